@@ -4,209 +4,400 @@
 基于Flask的Web服务，提供期权热力图生成和展示功能
 """
 
-import matplotlib
-matplotlib.use('Agg')
-
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, g
 import json
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 from datetime import datetime
 import os
 import io
 import base64
+import hashlib
 import warnings
 import sys
+import threading
+import time
 warnings.filterwarnings('ignore')
 
 from utils_option import (
     scrape_options_data,
     load_options_data,
+    load_snapshot_meta,
+    get_snapshot_history,
     create_heatmap_data,
+    build_heatmap_grid,
+    get_pivot_cube,
+    snapshot_file_path,
+    get_symbol_catalog,
+    iter_csv_chunks,
     generate_heatmap,
     generate_volatility_heatmap,
     generate_enhanced_heatmap,
     print_summary_statistics
 )
-
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
+from utils_store import (
+    SNAPSHOT_SUFFIX, CONTRACT_KEY_COLUMNS, has_columnar_support, normalize_timestamp,
+    read_snapshot_meta, iter_snapshot_batches, iter_snapshot_frames, iter_parquet_bytes, filter_chain
+)
+from utils_cache import TTLCache, DatasetRegistry, RenderCache, snapshot_order
+from utils_jobs import JobManager
+from utils_render import clamp_size, DEFAULT_SIZE
+from utils_renderpool import RenderPool, make_render_request
+from utils_scheduler import WatchlistScheduler, parse_watchlist, DEFAULT_INTERVAL, DEFAULT_EXPIRATIONS
+from utils_metrics import registry as metrics_registry, timed, count, cache_access, start_profile, stop_profile
 
 app = Flask(__name__)
 
-# 全局变量存储当前数据
-current_data = None
-current_symbol = None
+# 已加载的数据集: (symbol, snapshot_id) -> 处理后的DataFrame，按内存占用LRU淘汰
+datasets = DatasetRegistry(max_bytes=int(os.environ.get('OPTIONS_DATASET_MAX_MB', 512)) * 1024 * 1024)
+
+# 期权数据缓存: (symbol, 实际抓取的到期日数) -> 原始数据，新鲜期内的重复请求不再重新抓取（见 data_cache_key）
+DATA_CACHE_TTL = int(os.environ.get('OPTIONS_DATA_CACHE_TTL', 300))
+data_cache = TTLCache(maxsize=int(os.environ.get('OPTIONS_DATA_CACHE_SIZE', 32)), ttl=DATA_CACHE_TTL)
+# 抓取失败、退回磁盘上旧快照时的缓存时间（秒）
+STALE_DATA_TTL = int(os.environ.get('OPTIONS_STALE_DATA_TTL', 30))
+
+# 渲染结果缓存: (symbol, snapshot_id, chart_type, 渲染参数...) -> PNG，可选磁盘层（OPTIONS_RENDER_CACHE_DIR）
+render_cache = RenderCache(max_bytes=int(os.environ.get('OPTIONS_RENDER_CACHE_MB', 64)) * 1024 * 1024,
+                           disk_dir=os.environ.get('OPTIONS_RENDER_CACHE_DIR') or None)
+# 渲染进程池：热力图在常驻子进程中渲染，请求线程不使用pyplot（OPTIONS_RENDER_WORKERS=0 时在请求线程中渲染）
+render_pool = RenderPool()
+# Web图片默认的渲染方式：fast 为按目标像素尺寸的光栅渲染（utils_render），seaborn 为原来的300dpi绘图
+RENDERERS = ('fast', 'seaborn')
+DEFAULT_RENDERER = os.environ.get('OPTIONS_RENDERER', 'fast')
+DEFAULT_RENDER_SPEC = ('seaborn', 300) if DEFAULT_RENDERER == 'seaborn' else ('fast',) + DEFAULT_SIZE
+CHART_TYPES = ('direction_oi', 'volume', 'iv', 'gex', 'dex', 'oi_change')
+IMAGE_MIMETYPES = {'png': 'image/png', 'webp': 'image/webp'}
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+# 渲染结果版本号，修改绘图样式后递增，使浏览器缓存和磁盘缓存中的旧图片失效
+RENDER_VERSION = 2
+
+# 后台任务：/api/load_data 以异步方式提交时在这里执行抓取
+jobs = JobManager(max_workers=int(os.environ.get('OPTIONS_JOB_WORKERS', 4)))
+
+# 单次请求分阶段耗时：请求带 ?profile=1 或 X-Profile: 1 时返回（OPTIONS_PROFILING=0 时关闭）
+PROFILING_ENABLED = os.environ.get('OPTIONS_PROFILING', '1') != '0'
+
+def cache_metrics():
+    """/metrics 渲染时读取各缓存自己维护的命中数、条目数和占用字节数"""
+    return [
+        ('options_cache_requests_total', 'counter', '', [
+            ({'cache': 'data', 'result': 'hit'}, data_cache.hits), ({'cache': 'data', 'result': 'miss'}, data_cache.misses),
+            ({'cache': 'render', 'result': 'hit'}, render_cache.hits),
+            ({'cache': 'render', 'result': 'miss'}, render_cache.misses)]),
+        ('options_cache_entries', 'gauge', '进程内缓存的条目数', [
+            ({'cache': 'data'}, len(data_cache)), ({'cache': 'dataset'}, len(datasets)),
+            ({'cache': 'render'}, len(render_cache))]),
+        ('options_cache_bytes', 'gauge', '进程内缓存占用的字节数', [
+            ({'cache': 'dataset'}, datasets.total_bytes), ({'cache': 'render'}, render_cache.total_bytes)]),
+    ]
+
+metrics_registry.add_collector(cache_metrics)
 
-def load_options_data_web(symbol="AAPL", max_expirations=None):
-    """每次都强制抓取最新期权数据，覆盖旧数据"""
+def data_cache_key(symbol, max_expirations=None):
+    """数据缓存的key：未指定到期日数时按实际抓取的默认值，页面请求（默认传4）和关注列表刷新（默认None）共用同一条目"""
+    return symbol, max_expirations or DEFAULT_EXPIRATIONS
+
+def _data_cache_ttl(data):
+    """抓取失败时读到的旧快照只缓存 STALE_DATA_TTL 秒，之后的请求会重新尝试抓取"""
+    return STALE_DATA_TTL if data.get('stale') else DATA_CACHE_TTL
+
+def load_options_data_web(symbol="AAPL", max_expirations=None, force_refresh=False, progress=None):
+    """加载期权数据：缓存新鲜期内直接返回缓存，否则抓取最新数据（同一代码的并发请求只抓取一次）"""
     try:
-        # 修改为从data目录读取
-        file_path = os.path.join(os.path.dirname(__file__), 'data', f'{symbol}_options_data.json')
-        # 直接调用utils_option中的函数抓取数据
-        print(f"强制抓取 {symbol} 的最新期权数据……")
-        
-        # 调用utils_option中的scrape_options_data函数
-        from utils_option import scrape_options_data
-        scrape_options_data(
-            symbol=symbol, 
-            max_retries=3, 
-            multiple_expirations=True, 
-            max_expiration_dates=max_expirations if max_expirations else 4
+        return data_cache.get_or_load(
+            data_cache_key(symbol, max_expirations),
+            lambda: scrape_and_load_options_data(symbol, max_expirations, progress),
+            force=force_refresh,
+            ttl=_data_cache_ttl
         )
-        
-        if not os.path.exists(file_path):
-            print(f"抓取失败，未生成 {file_path}")
-            return None
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except json.JSONDecodeError as e:
-            print(f"JSON解析失败: {e}，文件内容可能不是有效数据，已删除该文件")
-            os.remove(file_path)
-            return None
-        if isinstance(data, list):
-            data = {'options_data': data}
-        return data
     except Exception as e:
         print(f"加载数据失败: {e}")
         return None
 
-def generate_heatmap_image(df, symbol="AAPL", chart_type="direction_oi"):
-    """Generate heatmap and return base64 image (English labels, with current price line and data timestamp)"""
+def scrape_and_load_options_data(symbol="AAPL", max_expirations=None, progress=None, max_retries=3, strict=False):
+    """强制抓取最新期权数据并读取保存的快照
+
+    抓取失败时仍读取磁盘上已有的快照（返回的字典中 stale 为 True）；strict 为 True 时改为抛出 RuntimeError（定时刷新用）。
+    """
+    print(f"强制抓取 {symbol} 的最新期权数据……")
+    with timed('fetch', symbol=symbol):
+        summary = scrape_options_data(
+            symbol=symbol,
+            max_retries=max_retries,
+            multiple_expirations=True,
+            max_expiration_dates=max_expirations or DEFAULT_EXPIRATIONS,
+            max_workers=4,
+            progress=progress
+        )
+    if summary is None and strict:
+        raise RuntimeError(f"{symbol} 抓取失败")
+    # 读取data目录中的快照（Parquet优先，兼容旧版JSON）
+    data = load_options_data(symbol)
+    if data is None:
+        print(f"抓取失败，未生成 {symbol} 的数据文件")
+    elif summary is None:
+        print(f"抓取 {symbol} 失败，使用磁盘上已有的快照")
+        data['stale'] = True
+    return data
+
+def refresh_watched_symbol(symbol, max_expirations=None, interval=DEFAULT_INTERVAL):
+    """关注列表刷新回调：抓取最新数据并发布到数据缓存、数据集注册表，再在后台预渲染全部图表
+
+    写入数据缓存的条目在两个刷新间隔内有效（至少 DATA_CACHE_TTL），/api/load_data 不带 force_refresh
+    时直接使用；失败时抛出异常，由调度器退避重试。
+    """
+    raw_data = data_cache.get_or_load(
+        data_cache_key(symbol, max_expirations),
+        lambda: scrape_and_load_options_data(symbol, max_expirations, progress=lambda event: None,
+                                             max_retries=1, strict=True),
+        force=True,
+        ttl=max(DATA_CACHE_TTL, 2 * interval)
+    )
+    if raw_data is None:
+        raise RuntimeError(f"没有 {symbol} 的数据文件")
+    entry = register_dataset(symbol, raw_data)
+    if entry is None:
+        raise RuntimeError(f"{symbol} 数据处理失败")
+    schedule_prerender(symbol, entry['snapshot_id'])
+    return entry['snapshot_id']
+
+# 关注列表：OPTIONS_WATCHLIST 为代码列表或文件（代码[:间隔秒数[:优先级[:最多到期日数]]]），服务启动后定时刷新；
+# OPTIONS_WATCHLIST_BUDGET 为每分钟最多的数据源请求数，OPTIONS_WATCHLIST_WORKERS 为同时刷新的代码数。
+# 多个WSGI worker 进程中只有持有 data/watchlist.lock 的一个进程刷新，预算不会按进程数成倍增加
+watchlist = WatchlistScheduler(
+    refresh_watched_symbol,
+    parse_watchlist(os.environ.get('OPTIONS_WATCHLIST', ''),
+                    float(os.environ.get('OPTIONS_WATCHLIST_INTERVAL', DEFAULT_INTERVAL))),
+    budget=float(os.environ.get('OPTIONS_WATCHLIST_BUDGET', 60)),
+    max_workers=int(os.environ.get('OPTIONS_WATCHLIST_WORKERS', 1)),
+    lock_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'watchlist.lock')
+)
+metrics_registry.add_collector(watchlist.collect_metrics)
+
+def render_heatmap_png(df, symbol="AAPL", chart_type="direction_oi", meta=None, dpi=300, size=None):
+    """Render heatmap to PNG bytes (English labels, with current price line and data timestamp)
+
+    size 为 (宽, 高) 像素时使用快速光栅渲染（utils_render），否则按 dpi 用seaborn绘制；都在渲染进程池中完成。
+    """
     if df is None or df.empty:
         return None
     import datetime
-    current_price = None
-    data_timestamp = None
-    try:
-        file_path = os.path.join(os.path.dirname(__file__), 'data', f'{symbol}_options_data.json')
-        import json as _json
-        with open(file_path, 'r', encoding='utf-8') as f:
-            raw = _json.load(f)
-            current_price = raw.get('current_price')
-            # 获取数据时间戳
-            data_timestamp = raw.get('data_timestamp')
-            if data_timestamp:
-                # 将ISO格式时间戳转换为可读格式
-                try:
-                    dt = datetime.datetime.fromisoformat(data_timestamp.replace('Z', '+00:00'))
-                    data_timestamp = dt.strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    data_timestamp = None
-    except Exception:
-        pass
+    if meta is None:
+        meta = load_snapshot_meta(symbol) or {}
+    current_price = meta.get('current_price')
+    # 获取数据时间戳
+    data_timestamp = meta.get('data_timestamp')
+    if data_timestamp:
+        # 将ISO格式时间戳转换为可读格式
+        try:
+            dt = datetime.datetime.fromisoformat(data_timestamp.replace('Z', '+00:00'))
+            data_timestamp = dt.strftime('%Y-%m-%d %H:%M:%S')
+        except:
+            data_timestamp = None
     
     if chart_type == "direction_oi":
-        value_col = 'direction_oi'
+        metric = 'direction_oi'
         cmap = 'RdBu_r'
         title = f'{symbol} Option OI Direction Heatmap\n(Red = Call Preference, Blue = Put Preference)'
         cbar_label = 'Direction × Open Interest'
         center = 0
     elif chart_type == "volume":
-        value_col = 'volume'
+        metric = 'volume'
         cmap = 'YlOrRd'
         title = f'{symbol} Option Volume Heatmap'
         cbar_label = 'Volume'
         center = None
     elif chart_type == "iv":
-        value_col = 'implied_volatility'
+        metric = 'iv'
         cmap = 'viridis'
         title = f'{symbol} Option Implied Volatility Heatmap'
         cbar_label = 'Implied Volatility (%)'
         center = None
+    elif chart_type == "gex":
+        metric = 'gex'
+        cmap = 'RdBu_r'
+        title = f'{symbol} Gamma Exposure Heatmap\n(Dealer $ Gamma per 1% Move, Calls + / Puts -)'
+        cbar_label = 'Gamma Exposure ($ per 1%)'
+        center = 0
+    elif chart_type == "dex":
+        metric = 'dex'
+        cmap = 'RdBu_r'
+        title = f'{symbol} Delta Exposure Heatmap'
+        cbar_label = 'Delta Exposure ($)'
+        center = 0
+    elif chart_type == "oi_change":
+        metric = 'oi_change'
+        cmap = 'RdBu_r'
+        title = f'{symbol} Open Interest Change Since Last Snapshot'
+        cbar_label = 'Open Interest Change'
+        center = 0
     else:
         return None
-    pivot_data = df.pivot_table(
-        values=value_col,
-        index='strike_price',
-        columns='expiration_display',
-        aggfunc='sum',
-        fill_value=0
-    ).sort_index()
-    plt.figure(figsize=(12, 8))
-    ax = sns.heatmap(
-        pivot_data,
-        annot=False,
-        cmap=cmap,
-        center=center,
-        cbar_kws={'label': cbar_label},
-        linewidths=0,
-        square=False
-    )
-    if current_price is not None:
-        try:
-            strike_prices = pivot_data.index.values
-            if strike_prices[0] <= current_price <= strike_prices[-1]:
-                y_pos = np.interp(current_price, strike_prices, np.arange(len(strike_prices)))
-                ax.axhline(y=y_pos + 0.5, color='orange', linestyle='--', linewidth=2, label=f'Current Price: {current_price}')
-                ax.legend(loc='upper right')
-        except Exception:
-            pass
-    plt.title(title, fontsize=16, fontweight='bold', pad=20)
-    plt.xlabel('Expiration Date', fontsize=12)
-    plt.ylabel('Strike Price ($)', fontsize=12)
-    
-    # 添加数据时间戳（优先显示数据时间，如果没有则显示生成时间）
+    if metric in ('gex', 'dex', 'oi_change') and metric not in df.columns:
+        # 快照中没有可用的当前股价（无法计算Greeks）或没有上一个快照
+        return None
+    cube = get_pivot_cube(df)
+    return render_pool.render(make_render_request(cube.matrix(metric), cube.strikes, cube.expirations, title, cmap,
+                                                  center, cbar_label, current_price, _timestamp_text(data_timestamp),
+                                                  size=size, dpi=dpi, symbol=symbol))
+
+def _timestamp_text(data_timestamp):
+    """图片底部的时间戳（优先显示数据时间，如果没有则显示生成时间）"""
     if data_timestamp:
-        timestamp_text = f'Data from: {data_timestamp}'
-    else:
-        timestamp_text = f'Generated at: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'
-    
-    plt.text(0.5, -0.13, timestamp_text, fontsize=11, color='gray', ha='center', va='center', transform=ax.transAxes)
-    plt.tight_layout()
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png', dpi=300, bbox_inches='tight')
-    img_buffer.seek(0)
-    img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-    plt.close()
-    return img_base64
+        return f'Data from: {data_timestamp}'
+    return f'Generated at: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'
+
+def generate_heatmap_image(df, symbol="AAPL", chart_type="direction_oi", meta=None):
+    """Generate heatmap and return base64 image"""
+    png = render_heatmap_png(df, symbol, chart_type, meta)
+    if png is None:
+        return None
+    with timed('base64', symbol=symbol):
+        return base64.b64encode(png).decode()
+
+def chart_unavailable_reason(entry, chart_type):
+    """数据集缺少图表所需的列时返回原因（如第一个快照没有未平仓量变化），否则返回None"""
+    if chart_type in ('gex', 'dex', 'oi_change') and chart_type not in entry['df'].columns:
+        if chart_type == 'oi_change':
+            return f"{entry['symbol']} 没有上一个快照，无法计算未平仓量变化"
+        return f"{entry['symbol']} 的快照没有可用的当前股价，无法计算Greeks敞口"
+    return None
+
+def get_heatmap_png(entry, chart_type="direction_oi", spec=DEFAULT_RENDER_SPEC):
+    """从渲染缓存获取数据集的热力图PNG，未命中时渲染并写入缓存
+
+    spec 为渲染参数：('fast', 宽, 高) 或 ('seaborn', dpi)，见 parse_render_spec。
+    """
+    key = (entry['symbol'], entry['snapshot_id'], chart_type) + tuple(spec) + (RENDER_VERSION,)
+    png = render_cache.get(key)
+    if png is None:
+        if spec[0] == 'fast':
+            png = render_heatmap_png(entry['df'], entry['symbol'], chart_type, entry['meta'], size=spec[1:])
+        else:
+            png = render_heatmap_png(entry['df'], entry['symbol'], chart_type, entry['meta'], dpi=spec[1])
+        if png is not None:
+            render_cache.put(key, png)
+    return png
+
+def get_heatmap_image(entry, chart_type="direction_oi", spec=DEFAULT_RENDER_SPEC, image_format='png'):
+    """返回指定格式（png / webp）的热力图字节"""
+    if image_format == 'png':
+        return get_heatmap_png(entry, chart_type, spec)
+    key = (entry['symbol'], entry['snapshot_id'], chart_type) + tuple(spec) + (image_format, RENDER_VERSION)
+    image = render_cache.get(key)
+    if image is None:
+        png = get_heatmap_png(entry, chart_type, spec)
+        if png is None:
+            return None
+        from PIL import Image
+        buffer = io.BytesIO()
+        with timed('encode_webp', symbol=entry['symbol']):
+            Image.open(io.BytesIO(png)).save(buffer, format='WEBP', lossless=True)
+        image = buffer.getvalue()
+        render_cache.put(key, image)
+    return image
+
+def parse_dpi(value, default=300):
+    """解析请求中的dpi，限制在 50-300 之间"""
+    try:
+        return min(max(int(value), 50), 300)
+    except (TypeError, ValueError):
+        return default
+
+def parse_flag(value, default=False):
+    """解析请求中的布尔参数：接受JSON布尔值、0/1 和 true/false、yes/no、on/off 字符串，其他值抛出ValueError"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ('1', 'true', 'yes', 'on'):
+            return True
+        if text in ('', '0', 'false', 'no', 'off'):
+            return False
+    raise ValueError(f'Invalid boolean value: {value!r}')
+
+def parse_render_spec(values):
+    """解析请求中的渲染参数，返回 ('fast', 宽, 高) 或 ('seaborn', dpi)；renderer 未知时抛出ValueError
+
+    renderer 省略时，只指定了 dpi 的请求（旧版客户端）沿用seaborn渲染，其余使用 DEFAULT_RENDERER；
+    width / height 为目标像素尺寸（只给一个时按 3:2 推算另一个）。
+    """
+    renderer = (values.get('renderer') or '').lower()
+    if not renderer:
+        legacy = values.get('dpi') is not None and not (values.get('width') or values.get('height'))
+        renderer = 'seaborn' if legacy else DEFAULT_RENDERER
+    if renderer not in RENDERERS:
+        raise ValueError(f'Unknown renderer: {renderer}')
+    if renderer == 'seaborn':
+        return ('seaborn', parse_dpi(values.get('dpi', 300)))
+    try:
+        return ('fast',) + clamp_size(values.get('width'), values.get('height'))
+    except (TypeError, ValueError):
+        return ('fast',) + DEFAULT_SIZE
+
+def parse_export_filters(args):
+    """解析导出接口的过滤参数，返回 (到期日列表或None, 最低执行价, 最高执行价)；参数格式错误时抛出ValueError"""
+    expirations = [d.strip() for value in args.getlist('expiration') for d in value.split(',') if d.strip()]
+    for d in expirations:
+        datetime.strptime(d, '%Y-%m-%d')
+    min_strike = float(args['min_strike']) if args.get('min_strike') else None
+    max_strike = float(args['max_strike']) if args.get('max_strike') else None
+    return expirations or None, min_strike, max_strike
+
+def prerender_heatmaps(progress, symbol, snapshot_id, spec=DEFAULT_RENDER_SPEC):
+    """后台任务：按默认渲染参数预先渲染数据集的全部图表类型"""
+    entry = datasets.get(symbol, snapshot_id)
+    if entry is None:
+        return {'rendered': []}
+    rendered = []
+    for chart_type in CHART_TYPES:
+        if get_heatmap_png(entry, chart_type, spec) is not None:
+            rendered.append(chart_type)
+        progress({'stage': 'rendered', 'chart_type': chart_type, 'symbol': symbol})
+    return {'rendered': rendered}
 
 def get_summary_statistics(df, symbol="AAPL"):
     """获取汇总统计信息"""
     if df is None or df.empty:
         return {}
-    
+    with timed('summary', symbol=symbol):
+        return _summary_statistics(df, symbol)
+
+def _summary_statistics(df, symbol):
+    cube = get_pivot_cube(df)
+    summary = cube.summary
     stats = {
         'symbol': symbol,
-        'total_options': len(df),
-        'call_options': len(df[df['type'] == 'Call']),
-        'put_options': len(df[df['type'] == 'Put']),
-        'expiration_dates': df['expiration_date'].nunique(),
+        'total_options': summary['total_options'],
+        'call_options': summary['call_options'],
+        'put_options': summary['put_options'],
+        'expiration_dates': summary['expiration_dates'],
         'strike_range': {
-            'min': float(df['strike_price'].min()),
-            'max': float(df['strike_price'].max())
+            'min': float(cube.strikes[0]),
+            'max': float(cube.strikes[-1])
         }
     }
     
     # 按到期日期统计
-    date_stats = df.groupby('expiration_display').agg({
-        'direction_oi': 'sum',
-        'volume': 'sum',
-        'open_interest': 'sum',
-        'implied_volatility': 'mean'  # 添加IV平均值统计
-    }).round(2).to_dict('index')
+    date_stats = cube.by_expiration().round(2).to_dict('index')
     
     stats['date_statistics'] = date_stats
     
     # 最大看涨和看跌偏好
-    max_call_oi = df[df['direction_oi'] > 0]['direction_oi'].max()
-    max_put_oi = abs(df[df['direction_oi'] < 0]['direction_oi'].min())
+    max_call_oi, max_put_oi = cube.max_preferences()
     
     stats['max_call_preference'] = float(max_call_oi) if not pd.isna(max_call_oi) else 0
     stats['max_put_preference'] = float(max_put_oi) if not pd.isna(max_put_oi) else 0
     
     # IV统计信息
-    if 'implied_volatility' in df.columns and df['implied_volatility'].sum() > 0:
-        stats['iv_stats'] = {
-            'min': float(df['implied_volatility'].min()),
-            'max': float(df['implied_volatility'].max()),
-            'mean': float(df['implied_volatility'].mean()),
-            'median': float(df['implied_volatility'].median())
-        }
+    iv_stats = summary['iv']
+    if iv_stats is not None and iv_stats['sum'] > 0:
+        stats['iv_stats'] = {k: iv_stats[k] for k in ('min', 'max', 'mean', 'median')}
     else:
         stats['iv_stats'] = None
     
@@ -217,29 +408,79 @@ def index():
     """主页"""
     return render_template('index.html')
 
-@app.route('/api/load_data', methods=['POST'])
-def api_load_data():
-    """API: 加载期权数据"""
-    global current_data, current_symbol
-    data = request.get_json()
-    symbol = data.get('symbol', 'AAPL').upper()
-    max_expirations = data.get('max_expirations')
-    if max_expirations is not None:
-        try:
-            max_expirations = int(max_expirations)
-        except Exception:
-            max_expirations = None
-    # 加载数据
-    raw_data = load_options_data_web(symbol, max_expirations)
-    if raw_data is None:
-        return jsonify({'success': False, 'message': f'No option data file found for {symbol}'})
-    # 处理数据
-    df = create_heatmap_data(raw_data)
+def snapshot_id_of(meta):
+    """快照ID：数据时间戳（旧版JSON没有时间戳时为 'latest'）"""
+    return meta.get('data_timestamp') or 'latest'
+
+def previous_snapshot(symbol, snapshot_id):
+    """返回同一代码上一个快照的合约表：优先使用注册表中已处理的数据集，
+    否则从历史库只读取计算未平仓量变化所需的列；都没有时返回None"""
+    latest = datasets.get(symbol)
+    if latest is not None and snapshot_order(latest['snapshot_id']) < snapshot_order(snapshot_id):
+        return latest['df']
+    if not has_columnar_support() or snapshot_id == 'latest':
+        return None
+    try:
+        current = normalize_timestamp(snapshot_id)
+    except (TypeError, ValueError):
+        return None
+    history = get_snapshot_history()
+    entries = [e for e in history.list(symbol, end=current) if e['data_timestamp'] < current]
+    if not entries:
+        return None
+    _, df = history.load(entries[-1], columns=CONTRACT_KEY_COLUMNS + ['open_interest'])
+    return df
+
+def register_dataset(symbol, raw_data):
+    """处理原始数据并登记到数据集注册表，失败返回None；同一快照已登记时直接返回已有条目"""
+    meta = {k: v for k, v in raw_data.items() if k != 'options_data'}
+    snapshot_id = snapshot_id_of(meta)
+    existing = datasets.get(symbol, snapshot_id)
+    if existing is not None:
+        return existing
+    df = create_heatmap_data(raw_data, previous=previous_snapshot(symbol, snapshot_id))
     if df is None:
-        return jsonify({'success': False, 'message': 'Data processing failed'})
-    # 保存到全局变量
-    current_data = df
-    current_symbol = symbol
+        return None
+    previous_latest = datasets.latest_snapshot_id(symbol)
+    entry = datasets.put(symbol, snapshot_id, df, meta)
+    # 新快照取代已登记的最新快照后，旧快照的渲染结果不再需要；登记较早的（指定 snapshot_id 查看的）快照、
+    # 或注册表中还没有该代码（不知道磁盘上的渲染结果是否更新）时不淘汰
+    if previous_latest not in (None, snapshot_id) and datasets.latest_snapshot_id(symbol) == snapshot_id:
+        render_cache.invalidate_symbol(symbol, keep_snapshot=snapshot_id)
+    return entry
+
+def get_dataset(symbol, snapshot_id=None):
+    """按代码和快照ID获取数据集；本进程中没有时从磁盘（最新快照或历史库）加载"""
+    entry = datasets.get(symbol, snapshot_id)
+    cache_access('dataset', entry is not None)
+    if entry is not None:
+        return entry
+    meta = load_snapshot_meta(symbol)
+    if meta is not None and snapshot_id in (None, snapshot_id_of(meta)):
+        raw_data = load_options_data(symbol)
+    elif snapshot_id is not None and has_columnar_support():
+        history = get_snapshot_history()
+        matches = history.list(symbol, snapshot_id, snapshot_id)
+        if not matches:
+            return None
+        history_meta, df = history.load(matches[0])
+        raw_data = dict(history_meta, options_data=df)
+    else:
+        return None
+    return register_dataset(symbol, raw_data) if raw_data is not None else None
+
+def load_data_payload(symbol, max_expirations=None, force_refresh=False, progress=None):
+    """加载并处理期权数据，返回 /api/load_data 的响应内容"""
+    watchlist.touch(symbol)
+    # 加载数据（缓存新鲜期内直接使用缓存，force_refresh 时强制重新抓取）
+    raw_data = load_options_data_web(symbol, max_expirations, force_refresh, progress)
+    if raw_data is None:
+        return {'success': False, 'message': f'No option data file found for {symbol}'}
+    # 处理数据并登记到数据集注册表
+    entry = register_dataset(symbol, raw_data)
+    if entry is None:
+        return {'success': False, 'message': 'Data processing failed'}
+    df = entry['df']
     # 获取统计信息
     stats = get_summary_statistics(df, symbol)
     # 获取公司名
@@ -253,27 +494,105 @@ def api_load_data():
         'scrape_duration_seconds': raw_data.get('scrape_duration_seconds')
     }
     
-    return jsonify({
+    schedule_prerender(symbol, entry['snapshot_id'])
+    
+    return {
         'success': True,
         'message': f'{symbol} data loaded successfully',
+        'symbol': symbol,
+        'snapshot_id': entry['snapshot_id'],
         'statistics': stats,
         'company_name': company_name,
         'data_info': data_info
-    })
+    }
+
+def run_load_data_job(progress, symbol, max_expirations=None, force_refresh=False):
+    """后台任务：加载数据，失败时抛出异常使任务状态为 failed"""
+    payload = load_data_payload(symbol, max_expirations, force_refresh, progress)
+    if not payload['success']:
+        raise RuntimeError(payload['message'])
+    return payload
+
+def schedule_prerender(symbol, snapshot_id):
+    """数据加载成功后在后台预渲染全部图表（OPTIONS_PRERENDER=0 时关闭）"""
+    if os.environ.get('OPTIONS_PRERENDER', '1') != '0':
+        jobs.submit('prerender', prerender_heatmaps, symbol=symbol, snapshot_id=snapshot_id)
+
+@app.route('/api/load_data', methods=['POST'])
+def api_load_data():
+    """API: 加载期权数据（async 为 true 时提交后台任务并立即返回任务ID）"""
+    data = request.get_json()
+    symbol = data.get('symbol', 'AAPL').upper()
+    max_expirations = data.get('max_expirations')
+    if max_expirations is not None:
+        try:
+            max_expirations = int(max_expirations)
+        except Exception:
+            max_expirations = None
+    try:
+        force_refresh = parse_flag(data.get('force_refresh'))
+        run_async = parse_flag(data.get('async'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if run_async:
+        job = jobs.submit('load_data', run_load_data_job, symbol=symbol,
+                          max_expirations=max_expirations, force_refresh=force_refresh)
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+    return jsonify(load_data_payload(symbol, max_expirations, force_refresh))
+
+@app.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    """API: 查询后台任务状态、进度和结果（since 为已读取的事件数）"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': f'Job {job_id} not found'}), 404
+    since = request.args.get('since', 0, type=int)
+    return jsonify(dict(job.to_dict(since), success=True))
+
+@app.route('/api/jobs/<job_id>/events')
+def api_job_events(job_id):
+    """API: 以Server-Sent Events推送后台任务进度，任务结束后关闭连接"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': f'Job {job_id} not found'}), 404
+
+    def stream():
+        version, sent = -1, 0
+        while True:
+            version = job.wait_for_change(version, timeout=15)
+            state = job.to_dict(sent)
+            sent = state['event_count']
+            yield f"data: {json.dumps(state, ensure_ascii=False, default=str)}\n\n"
+            if state['status'] in ('succeeded', 'failed'):
+                break
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/api/generate_heatmap', methods=['POST'])
 def api_generate_heatmap():
-    """API: 生成热力图"""
-    global current_data, current_symbol
-    
-    if current_data is None:
-        return jsonify({'success': False, 'message': '请先加载数据'})
-    
+    """API: 生成热力图（按请求中的 symbol / snapshot_id 选择数据集）"""
     data = request.get_json()
     chart_type = data.get('chart_type', 'direction_oi')
+    symbol = (data.get('symbol') or '').upper()
+    if not symbol:
+        return jsonify({'success': False, 'message': '请先加载数据'})
+    entry = get_dataset(symbol, data.get('snapshot_id'))
+    if entry is None:
+        return jsonify({'success': False, 'message': f'{symbol} 的数据未加载或已过期，请重新加载数据'})
     
-    # 生成热力图
-    img_base64 = generate_heatmap_image(current_data, current_symbol, chart_type)
+    # 生成热力图（优先使用渲染缓存）
+    try:
+        spec = parse_render_spec(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    reason = chart_unavailable_reason(entry, chart_type)
+    if reason is not None:
+        return jsonify({'success': False, 'message': reason})
+    png = get_heatmap_png(entry, chart_type, spec)
+    img_base64 = None
+    if png is not None:
+        with timed('base64', symbol=symbol):
+            img_base64 = base64.b64encode(png).decode()
     
     if img_base64 is None:
         return jsonify({'success': False, 'message': '生成热力图失败'})
@@ -281,21 +600,266 @@ def api_generate_heatmap():
     return jsonify({
         'success': True,
         'image': img_base64,
-        'chart_type': chart_type
+        'chart_type': chart_type,
+        'symbol': symbol,
+        'snapshot_id': entry['snapshot_id']
     })
 
+def encode_grid(grid, meta, encoding='binary'):
+    """把网格编码为响应内容，返回(字节, mimetype)
+
+    binary: 4字节小端header长度 + JSON header（空格补齐到4字节对齐）+ 各指标float32矩阵（行主序，按header中metrics顺序）
+    quantized: JSON，各指标量化为0-65535的整数，值 = min + q * (max - min) / 65535
+    """
+    header = {
+        'symbol': meta.get('symbol'),
+        'data_timestamp': meta.get('data_timestamp'),
+        'current_price': meta.get('current_price'),
+        'strikes': grid['strikes'].tolist(),
+        'expirations': grid['expirations'],
+        'expiration_dates': grid['expiration_dates'],
+        'shape': [len(grid['strikes']), len(grid['expirations'])],
+        'metrics': list(grid['metrics'])
+    }
+    if encoding == 'quantized':
+        levels = 65535
+        header['encoding'] = 'quantized'
+        header['levels'] = levels
+        header['values'] = {}
+        for name, matrix in grid['metrics'].items():
+            low = float(matrix.min()) if matrix.size else 0.0
+            high = float(matrix.max()) if matrix.size else 0.0
+            span = high - low
+            q = np.zeros(matrix.shape, dtype=np.int64) if span == 0 else np.rint((matrix - low) / span * levels)
+            header['values'][name] = {'min': low, 'max': high, 'data': q.astype(np.int64).ravel().tolist()}
+        return json.dumps(header, separators=(',', ':')).encode('utf-8'), 'application/json'
+    header['encoding'] = 'float32'
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 4)
+    body = b''.join(np.ascontiguousarray(m, dtype='<f4').tobytes() for m in grid['metrics'].values())
+    return len(header_bytes).to_bytes(4, 'little') + header_bytes + body, 'application/octet-stream'
+
+def conditional_response(entry, etag_parts, produce, mimetype):
+    """带ETag/Cache-Control的响应：If-None-Match命中时直接返回304，不调用 produce"""
+    etag = None
+    if entry['snapshot_id'] != 'latest':
+        key = '|'.join(str(part) for part in (RENDER_VERSION, entry['symbol'], entry['snapshot_id']) + tuple(etag_parts))
+        etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    if etag is not None and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = produce()
+        if body is None:
+            return None
+        etag = etag or hashlib.sha1(body).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    # 指定快照的内容不会再变化；未指定快照时最新数据可能更新，需要重新验证
+    if request.args.get('snapshot_id'):
+        response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Snapshot-Id'] = str(entry['snapshot_id'])
+    return response
+
+@app.route('/api/grid/<symbol>')
+def api_heatmap_grid(symbol):
+    """API: 返回 执行价 × 到期日 的多指标网格（direction_oi / volume / iv），供前端交互式渲染
+
+    查询参数: snapshot_id（省略时为最新快照）、encoding（binary 为float32二进制，quantized 为量化JSON）
+    """
+    symbol = symbol.upper()
+    encoding = request.args.get('encoding', 'binary')
+    if encoding not in ('binary', 'quantized'):
+        return jsonify({'success': False, 'message': f'Unsupported encoding: {encoding}'}), 400
+    entry = get_dataset(symbol, request.args.get('snapshot_id') or None)
+    if entry is None:
+        return jsonify({'success': False, 'message': f'{symbol} 的数据未加载或已过期，请重新加载数据'}), 404
+    mimetype = 'application/json' if encoding == 'quantized' else 'application/octet-stream'
+
+    def produce():
+        key = (entry['symbol'], entry['snapshot_id'], 'grid', encoding)
+        body = render_cache.get(key)
+        if body is None:
+            body, _ = encode_grid(build_heatmap_grid(entry['df']), dict(entry['meta'], symbol=symbol), encoding)
+            render_cache.put(key, body)
+        return body
+
+    return conditional_response(entry, ('grid', encoding), produce, mimetype)
+
+@app.route('/api/heatmap/<symbol>/<chart_type>')
+def api_heatmap_image(symbol, chart_type):
+    """API: 直接返回热力图图片（支持ETag/If-None-Match条件请求）
+
+    查询参数: snapshot_id（省略时为该代码的最新快照）、format（png / webp）、
+    renderer（fast / seaborn）、width / height（fast 的目标像素尺寸，默认1200×800）、dpi（seaborn 的分辨率，默认300）
+    """
+    symbol = symbol.upper()
+    if chart_type not in CHART_TYPES:
+        return jsonify({'success': False, 'message': f'Unknown chart type: {chart_type}'}), 400
+    image_format = request.args.get('format', 'png').lower()
+    if image_format not in IMAGE_MIMETYPES:
+        return jsonify({'success': False, 'message': f'Unsupported format: {image_format}'}), 400
+    snapshot_id = request.args.get('snapshot_id') or None
+    try:
+        spec = parse_render_spec(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    entry = get_dataset(symbol, snapshot_id)
+    if entry is None:
+        return jsonify({'success': False, 'message': f'{symbol} 的数据未加载或已过期，请重新加载数据'}), 404
+    reason = chart_unavailable_reason(entry, chart_type)
+    if reason is not None:
+        return jsonify({'success': False, 'message': reason}), 422
+    response = conditional_response(entry, (chart_type,) + spec + (image_format,),
+                                    lambda: get_heatmap_image(entry, chart_type, spec, image_format),
+                                    IMAGE_MIMETYPES[image_format])
+    if response is None:
+        return jsonify({'success': False, 'message': '生成热力图失败'}), 500
+    return response
+
+@app.route('/api/export/<symbol>')
+def api_export(symbol):
+    """API: 下载当前快照的合约数据，边读边写，不先把整份快照读入内存
+
+    查询参数: format（csv / parquet）、expiration（到期日 YYYY-MM-DD，可重复或逗号分隔）、min_strike、max_strike
+    """
+    symbol = symbol.upper()
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_MIMETYPES:
+        return jsonify({'success': False, 'message': f'Unsupported format: {export_format}'}), 400
+    try:
+        expirations, min_strike, max_strike = parse_export_filters(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'过滤参数错误: {e}'}), 400
+    path = snapshot_file_path(symbol)
+    if path is None:
+        return jsonify({'success': False, 'message': f'没有 {symbol} 的快照数据，请先加载数据'}), 404
+    if path.endswith(SNAPSHOT_SUFFIX):
+        if export_format == 'parquet':
+            meta = dict(read_snapshot_meta(path), export_filter={
+                'expirations': expirations, 'min_strike': min_strike, 'max_strike': max_strike})
+            body = iter_parquet_bytes(iter_snapshot_batches(path, expirations, min_strike, max_strike), meta)
+        else:
+            body = iter_csv_chunks(iter_snapshot_frames(path, expirations, min_strike, max_strike, compact=False),
+                                   symbol)
+    elif export_format == 'parquet':
+        return jsonify({'success': False, 'message': 'Parquet导出需要安装pyarrow'}), 400
+    else:
+        # 旧版JSON快照只能整体解析
+        data = load_options_data(symbol, compact=False)
+        if data is None:
+            return jsonify({'success': False, 'message': f'读取 {symbol} 的快照失败'}), 500
+        body = iter_csv_chunks(filter_chain(data['options_data'], expirations, min_strike, max_strike), symbol)
+    filename = f'{symbol}_options_data.{export_format}'
+    return Response(body, mimetype=EXPORT_MIMETYPES[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/api/available_symbols')
 def api_available_symbols():
-    """API: 获取可用的股票代码"""
-    symbols = []
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
-    if os.path.exists(data_dir):
-        for file in os.listdir(data_dir):
-            if file.endswith('_options_data.json'):
-                symbol = file.replace('_options_data.json', '')
-                symbols.append(symbol)
-    
-    return jsonify({'symbols': symbols})
+    """API: 获取可用的股票代码（来自代码目录索引，不逐个读取快照文件）
+
+    查询参数: q（代码前缀或公司名称）、max_age（数据时间戳距今的最大秒数）、min_contracts、
+    sort（freshness / symbol / contracts / size，默认 freshness）、order（asc / desc）、limit、offset
+    """
+    args = request.args
+    try:
+        max_age = float(args['max_age']) if args.get('max_age') else None
+        min_contracts = int(args['min_contracts']) if args.get('min_contracts') else None
+        limit = max(0, int(args['limit'])) if args.get('limit') else None
+        offset = max(0, int(args.get('offset') or 0))
+        order = args.get('order', '').lower()
+        if order not in ('', 'asc', 'desc'):
+            raise ValueError(f'Unknown order: {order}')
+        total, entries = get_symbol_catalog().query(
+            search=args.get('q') or None, max_age=max_age, min_contracts=min_contracts,
+            sort=args.get('sort', 'freshness'), descending=None if not order else order == 'desc',
+            limit=limit, offset=offset)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    items = [{k: v for k, v in e.items() if k != 'path'} for e in entries]
+    return jsonify({'symbols': [e['symbol'] for e in entries], 'items': items, 'total': total,
+                    'offset': offset, 'limit': limit})
+
+@app.route('/api/watchlist')
+def api_watchlist():
+    """API: 关注列表中各代码的刷新状态（距上次成功刷新的秒数、下次刷新时间、连续失败次数等）；
+    active 为 False 时关注列表由其他worker进程刷新"""
+    return jsonify({'success': True, 'running': watchlist.running, 'active': watchlist.active,
+                    'symbols': watchlist.status()})
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_services():
+    """启动后台服务（只执行一次）：创建渲染进程池的子进程并等待预热完成，再启动关注列表定时刷新
+
+    在 __main__ 中（debug 重载器实际处理请求的子进程）或第一个请求到来时调用，
+    因此 flask run --no-reload、debug=False 和其他WSGI服务器中同样生效。
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+        try:
+            workers = render_pool.start()
+            if workers:
+                print(f"渲染进程池已就绪: {len(workers)} 个进程")
+        except Exception as e:
+            print(f"渲染进程池预热失败（首次渲染时再创建）: {e}")
+        if len(watchlist):
+            watchlist.start()
+            print(f"关注列表定时刷新已启动: {len(watchlist)} 个代码")
+
+@app.before_request
+def ensure_background_services():
+    if not _background_started:
+        start_background_services()
+
+@app.before_request
+def begin_request_metrics():
+    g.request_start = time.perf_counter()
+    g.profile = None
+    if PROFILING_ENABLED and (request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1'):
+        g.profile = start_profile()
+
+@app.after_request
+def record_request_metrics(response):
+    """统计请求数和耗时；开启分阶段记录时以 Server-Timing 头返回各阶段耗时，JSON响应中另加 profile 字段"""
+    seconds = time.perf_counter() - g.get('request_start', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    count('options_http_requests_total', endpoint=endpoint, method=request.method, status=str(response.status_code))
+    metrics_registry.observe('options_http_request_seconds', seconds, endpoint=endpoint)
+    if g.get('profile') is None:
+        return response
+    stages, token = g.profile
+    g.profile = None
+    stop_profile(token)
+    total_ms = round(seconds * 1e3, 3)
+    timings = [f'{s["stage"]};dur={s["ms"]}' for s in stages] + [f'total;dur={total_ms}']
+    response.headers['Server-Timing'] = ', '.join(timings)
+    if response.is_json and not response.is_streamed:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body['profile'] = {'total_ms': total_ms, 'stages': stages}
+            response.set_data(json.dumps(body, ensure_ascii=False, default=str))
+    return response
+
+@app.teardown_request
+def end_request_profile(error=None):
+    # after_request 没有执行（请求异常）时也要结束分阶段记录
+    if g.get('profile') is not None:
+        stop_profile(g.profile[1])
+        g.profile = None
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 文本格式的运行指标：各阶段耗时、缓存命中、抓取失败/重试次数、HTTP请求数"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/health')
 def health_check():
@@ -312,5 +876,9 @@ if __name__ == '__main__':
     os.makedirs('static', exist_ok=True)
     
     print("期权热力图Web服务启动中...")
+    # debug模式下重载器的父进程只负责重启，在实际处理请求的子进程中提前启动后台服务（此时还没有请求线程）；
+    # 其他运行方式在第一个请求到来时启动
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     print("访问地址: http://localhost:5000")
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
@@ -0,0 +1,73 @@
+# -*- coding:utf8 -*-
+"""
+代码列表基准：data 目录中有大量快照文件时，比较逐个列目录匹配文件名（旧版 /api/available_symbols）、
+列目录后逐个读取元数据头（要显示数据时间和合约数时的做法）与查询代码目录索引的耗时
+用法: python benchmarks/bench_catalog.py [快照文件数] [查询次数]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils_option import build_chain_frame, concat_chain_frames  # noqa: E402
+from utils_store import SymbolCatalog, write_snapshot, read_snapshot_meta, SNAPSHOT_SUFFIX, JSON_SUFFIX  # noqa: E402
+from synthetic import make_chain  # noqa: E402
+
+
+def list_symbols(data_dir):
+    """旧版实现：列目录并按后缀匹配文件名"""
+    symbols = []
+    for file in os.listdir(data_dir):
+        for suffix in (SNAPSHOT_SUFFIX, JSON_SUFFIX):
+            if file.endswith(suffix):
+                symbol = file[:-len(suffix)]
+                if symbol not in symbols:
+                    symbols.append(symbol)
+    return symbols
+
+
+def list_with_meta(data_dir):
+    return [read_snapshot_meta(os.path.join(data_dir, f)) for f in os.listdir(data_dir) if f.endswith(SNAPSHOT_SUFFIX)]
+
+
+def timeit(func, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    chain = make_chain(2, 10)
+    df = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], 'X')
+    now = datetime.now()
+    with tempfile.TemporaryDirectory() as data_dir:
+        catalog = SymbolCatalog(data_dir)
+        for i in range(n_files):
+            symbol = f'S{i:05d}'
+            meta = {'symbol': symbol, 'company_name': f'{symbol} Corp', 'current_price': 100.0,
+                    'data_timestamp': (now - timedelta(minutes=i)).isoformat(), 'total_options': len(df),
+                    'expiration_dates': sorted(chain)}
+            path = os.path.join(data_dir, f'{symbol}{SNAPSHOT_SUFFIX}')
+            write_snapshot(path, df, meta)
+            catalog.record(symbol, path, meta)
+        print(f"{n_files} 个快照文件，每种方式查询 {repeat} 次")
+        print("====================================================================================================")
+        print(f"列目录匹配文件名（只有代码）:       {timeit(lambda: list_symbols(data_dir), repeat) * 1e3:8.2f} 毫秒/次")
+        print(f"列目录并读取元数据头:               {timeit(lambda: list_with_meta(data_dir), 1) * 1e3:8.2f} 毫秒/次")
+        print(f"目录索引 按新鲜度排序取前50个:      "
+              f"{timeit(lambda: catalog.query(limit=50), repeat) * 1e3:8.2f} 毫秒/次")
+        print(f"目录索引 前缀过滤 + 按代码排序:     "
+              f"{timeit(lambda: catalog.query(search='S01', sort='symbol', limit=50), repeat) * 1e3:8.2f} 毫秒/次")
+        t0 = time.perf_counter()
+        catalog.rebuild()
+        print(f"扫描目录重建索引:                   {(time.perf_counter() - t0) * 1e3:8.2f} 毫秒")
+
+
+if __name__ == '__main__':
+    main()
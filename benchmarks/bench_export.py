@@ -0,0 +1,94 @@
+# -*- coding:utf8 -*-
+"""
+CSV导出基准：原来的逐行字符串拼接 vs 分块流式写出（耗时与Python内存峰值），并检查两者输出的文件内容一致
+内存峰值由 tracemalloc 统计，只包含Python对象的分配（不含Arrow内存池中按块释放的缓冲区）
+用法: python benchmarks/bench_export.py [到期日数] [每边执行价数]
+默认 50 × 1000 × 2 = 100k 合约
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils_option import (  # noqa: E402
+    build_chain_frame, concat_chain_frames, chain_records, iter_csv_chunks, CSV_HEADER
+)
+from utils_store import write_snapshot, read_snapshot, iter_snapshot_frames  # noqa: E402
+from synthetic import make_chain  # noqa: E402
+
+SYMBOL = 'SPX'
+
+
+def concat_csv(records, path):
+    """原来的实现：整个文件先在一个字符串里逐行拼接"""
+    csv_content = CSV_HEADER
+    for option in records:
+        csv_content += f"{option['type']},{option['contract_name']},{option['expiration_date']},{option['strike_price']},{option['last_price']},{option['bid']},{option['ask']},{option['volume']},{option['open_interest']},{option['implied_volatility']}\n"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(csv_content)
+
+
+def stream_csv(frames, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in iter_csv_chunks(frames, SYMBOL):
+            f.write(chunk)
+
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def measure(fn):
+    """先计时，再单独在 tracemalloc 下运行一次测内存峰值（tracemalloc 会显著拖慢执行）"""
+    t0 = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 1e6
+
+
+def main():
+    n_exp = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_strikes = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    chain = make_chain(n_exp, n_strikes)
+    df = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], SYMBOL)
+    records = chain_records(df)
+    print(f"合成期权链: {len(df)} 个合约")
+
+    with tempfile.TemporaryDirectory() as d:
+        csv_path = os.path.join(d, 'out.csv')
+        snapshot = os.path.join(d, f'{SYMBOL}_options_data.parquet')
+        write_snapshot(snapshot, df, {'symbol': SYMBOL})
+        results = [
+            ("字符串拼接 (字典列表)", measure(lambda: concat_csv(records, csv_path))),
+            ("分块写出 (内存DataFrame)", measure(lambda: stream_csv(df, csv_path))),
+            ("分块写出 (直接读快照)",
+             measure(lambda: stream_csv(iter_snapshot_frames(snapshot, compact=False), csv_path))),
+        ]
+        size = os.path.getsize(csv_path) / 1e6
+        # 输出一致性：内存DataFrame与字典列表逐行拼接比较；快照中数值列按float64存储，与快照内容逐行拼接比较
+        concat_csv(records, csv_path)
+        expected = read_text(csv_path)
+        stream_csv(df, csv_path)
+        same_frame = read_text(csv_path) == expected
+        concat_csv(chain_records(read_snapshot(snapshot, compact=False)[1]), csv_path)
+        expected = read_text(csv_path)
+        stream_csv(iter_snapshot_frames(snapshot, compact=False), csv_path)
+        same_snapshot = read_text(csv_path) == expected
+
+    print(f"CSV文件大小: {size:.1f} MB")
+    print(f"{'':26}{'耗时 (秒)':>10}{'内存峰值 (MB)':>14}")
+    for label, (seconds, peak) in results:
+        print(f"{label:24}{seconds:>10.3f}{peak:>14.1f}")
+    print(f"输出一致: 内存DataFrame {same_frame}, 直接读快照 {same_snapshot}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -*- coding:utf8 -*-
+"""
+Greeks 计算基准：逐合约 math 实现 vs NumPy 批量实现
+用法: python benchmarks/bench_greeks.py [到期日数] [每边执行价数]
+默认 50 × 1000 × 2 = 100k 合约
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils_option import build_chain_frame, concat_chain_frames, create_heatmap_data  # noqa: E402
+from utils_greeks import add_greeks, year_fractions, RISK_FREE_RATE  # noqa: E402
+from synthetic import make_chain  # noqa: E402
+
+SPOT = 100.0
+# 逐合约实现只跑这么多合约，再按比例估算全量耗时
+SCALAR_SAMPLE = 5000
+
+
+def scalar_greeks(spot, strike, t, sigma, is_call, r=RISK_FREE_RATE):
+    """逐合约的纯Python实现（作为对照）"""
+    if not sigma > 0:
+        return (math.nan,) * 4
+    sqrt_t = math.sqrt(t)
+    d1 = (math.log(spot / strike) + (r + 0.5 * sigma * sigma) * t) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+    cdf_d1 = 0.5 * math.erfc(-d1 / math.sqrt(2))
+    cdf_d2 = 0.5 * math.erfc(-d2 / math.sqrt(2))
+    pdf = math.exp(-0.5 * d1 * d1) / math.sqrt(2 * math.pi)
+    disc = strike * math.exp(-r * t)
+    delta = cdf_d1 if is_call else -0.5 * math.erfc(d1 / math.sqrt(2))
+    gamma = pdf / (spot * sigma * sqrt_t)
+    vega = spot * pdf * sqrt_t / 100
+    decay = -spot * pdf * sigma / (2 * sqrt_t)
+    theta = (decay - r * disc * cdf_d2) if is_call else (decay + r * disc * (1 - cdf_d2))
+    return delta, gamma, vega, theta / 365
+
+
+def main():
+    n_exp = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_strikes = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    chain = make_chain(n_exp, n_strikes, spot=SPOT)
+    raw = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], 'SPX')
+    sigma = raw['implied_volatility'].to_numpy(dtype='float64')
+    df = create_heatmap_data({'options_data': raw})
+    as_of = pd.Timestamp.now()
+    print(f"合成期权链: {len(df)} 个合约")
+
+    timings = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        add_greeks(df, SPOT, sigma, as_of=as_of)
+        timings.append(time.perf_counter() - t0)
+    t_vec = min(timings)
+
+    n = min(SCALAR_SAMPLE, len(df))
+    strikes = df['strike_price'].to_numpy()[:n]
+    years = year_fractions(df['expiration_date'].iloc[:n], as_of)
+    calls = (df['type'] == 'Call').to_numpy()[:n]
+    t0 = time.perf_counter()
+    expected = [scalar_greeks(SPOT, k, t, s, c) for k, t, s, c in zip(strikes, years, sigma[:n], calls)]
+    t_scalar = (time.perf_counter() - t0) * len(df) / n
+
+    expected = np.array(expected)
+    actual = df[['delta', 'gamma', 'vega', 'theta']].to_numpy()[:n]
+    max_err = np.nanmax(np.abs(actual - expected) / np.maximum(np.abs(expected), 1e-12), axis=0)
+
+    print(f"逐合约 math:  {t_scalar:8.3f} 秒 (按 {n} 个合约估算)  {len(df) / t_scalar:>12,.0f} 合约/秒")
+    print(f"NumPy 批量:   {t_vec:8.3f} 秒                      {len(df) / t_vec:>12,.0f} 合约/秒")
+    print(f"加速比: {t_scalar / t_vec:.1f}x")
+    print("与逐合约结果的最大相对误差: " + "  ".join(f"{name}={err:.1e}" for name, err in zip(("delta", "gamma", "vega", "theta"), max_err)))
+
+
+if __name__ == '__main__':
+    main()
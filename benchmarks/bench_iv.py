@@ -0,0 +1,56 @@
+# -*- coding:utf8 -*-
+"""
+隐含波动率批量求解基准：用已知波动率生成理论价格，再从价格反解，统计耗时、收敛率和误差
+用法: python benchmarks/bench_iv.py [到期日数] [每边执行价数] [价格误差容限] [最大迭代次数]
+默认 25 × 1000 × 2 = 50k 合约
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils_option import build_chain_frame, concat_chain_frames, create_heatmap_data  # noqa: E402
+from utils_greeks import (  # noqa: E402
+    black_scholes_price, implied_volatility, year_fractions, IV_TOLERANCE, IV_MAX_ITER
+)
+from synthetic import make_chain  # noqa: E402
+
+SPOT = 100.0
+
+
+def main():
+    n_exp = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    n_strikes = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    tol = float(sys.argv[3]) if len(sys.argv) > 3 else IV_TOLERANCE
+    max_iter = int(sys.argv[4]) if len(sys.argv) > 4 else IV_MAX_ITER
+    chain = make_chain(n_exp, n_strikes, spot=SPOT)
+    raw = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], 'SPX')
+    true_sigma = raw['implied_volatility'].to_numpy(dtype='float64')
+    df = create_heatmap_data({'options_data': raw})
+    strikes = df['strike_price'].to_numpy(dtype='float64')
+    years = year_fractions(df['expiration_date'])
+    calls = (df['type'] == 'Call').to_numpy()
+    prices = black_scholes_price(SPOT, strikes, years, true_sigma, calls)
+    print(f"合成期权链: {len(df)} 个合约  (容限 {tol:g}，最多 {max_iter} 轮)")
+
+    timings = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        sigma, converged = implied_volatility(prices, SPOT, strikes, years, calls, tol=tol, max_iter=max_iter)
+        timings.append(time.perf_counter() - t0)
+
+    # 时间价值低于最小报价单位（0.01）的合约（深度实值/虚值）对波动率不敏感，单独统计
+    intrinsic = black_scholes_price(SPOT, strikes, years, np.zeros(len(df)), calls)
+    quoted = prices - intrinsic >= 0.01
+    err = np.abs(sigma - true_sigma)
+    print(f"求解耗时: {min(timings) * 1000:8.1f} 毫秒  {len(df) / min(timings):>12,.0f} 合约/秒")
+    print(f"收敛: {converged.sum()} / {len(df)} ({converged.mean():.1%})，"
+          f"时间价值 >= 0.01 的合约: {converged[quoted].sum()} / {quoted.sum()}")
+    print(f"时间价值 >= 0.01 的合约波动率最大误差: {np.nanmax(err[quoted & converged]):.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding:utf8 -*-
+"""
+DataFrame 内存占用基准：原来的布局（字符串/float64/contract_name列） vs 紧凑布局
+（类别列、float32价格和波动率、可空Int32数量，不保存合约名称），结果按每10万合约换算
+用法: python benchmarks/bench_memory.py [到期日数] [每边执行价数]
+默认 50 × 1000 × 2 = 100k 合约
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils_option import build_chain_frame, concat_chain_frames, create_heatmap_data  # noqa: E402
+from utils_store import write_snapshot, read_snapshot, contract_names  # noqa: E402
+from synthetic import make_chain  # noqa: E402
+
+SYMBOL = 'SPX'
+PER = 100_000
+
+
+def legacy_layout(df, symbol):
+    """把紧凑布局还原为原来的列类型：字符串、float64 和合约名称列"""
+    out = {}
+    if 'type' in df.columns:
+        out['type'] = df['type'].astype(str)
+        out['contract_name'] = contract_names(df, symbol)
+    for name in df.columns:
+        values = df[name]
+        if name == 'type':
+            continue
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(values.cat.categories.dtype)
+        elif values.dtype.kind == 'f' or isinstance(values.dtype, pd.Int32Dtype) or name == 'direction':
+            values = values.astype('float64')
+        out[name] = values
+    return pd.DataFrame(out, index=df.index)
+
+
+def legacy_read(path):
+    """原来的读取方式：全部列转成pandas，到期日格式化为字符串"""
+    df = pq.read_table(path).to_pandas(date_as_object=False, ignore_metadata=True)
+    codes, uniques = pd.factorize(df['expiration_date'])
+    df['expiration_date'] = uniques.strftime('%Y-%m-%d').to_numpy()[codes]
+    return df
+
+
+def mb_per(df):
+    return df.memory_usage(deep=True).sum() / len(df) * PER / 1e6
+
+
+def timed(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+
+def main():
+    n_exp = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_strikes = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    chain = make_chain(n_exp, n_strikes)
+    raw = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], SYMBOL)
+    meta = {'symbol': SYMBOL, 'current_price': 100.0, 'total_options': len(raw)}
+    print(f"合成期权链: {len(raw)} 个合约")
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, f'{SYMBOL}_options_data.parquet')
+        write_snapshot(path, raw, meta)
+        t_old, old_raw = timed(lambda: legacy_read(path))
+        t_new, (_, new_raw) = timed(lambda: read_snapshot(path))
+    processed = create_heatmap_data(dict(meta, options_data=new_raw))
+    old_processed = legacy_layout(processed, SYMBOL)
+
+    print(f"{'(MB / 10万合约)':22}{'原布局':>10}{'紧凑布局':>10}{'节省':>8}")
+    for label, before, after in (("加载的快照", old_raw, new_raw), ("热力图数据", old_processed, processed)):
+        b, a = mb_per(before), mb_per(after)
+        print(f"{label:18}{b:>12.2f}{a:>12.2f}{1 - a / b:>9.0%}")
+    print(f"读取快照 (秒):    {t_old:>12.3f}{t_new:>12.3f}")
+
+    print("\n热力图数据逐列占用 (字节/合约):")
+    old_bytes = old_processed.memory_usage(deep=True, index=False) / len(processed)
+    new_bytes = processed.memory_usage(deep=True, index=False) / len(processed)
+    for name in old_bytes.index:
+        after = new_bytes.get(name, np.nan)
+        print(f"  {name:20}{old_bytes[name]:>8.1f}{after:>8.1f}" if after == after else
+              f"  {name:20}{old_bytes[name]:>8.1f}{'(按需生成)':>12}")
+
+
+if __name__ == '__main__':
+    main()
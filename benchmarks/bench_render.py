@@ -0,0 +1,67 @@
+# -*- coding:utf8 -*-
+"""
+并发渲染吞吐量基准：多个线程同时请求热力图（模拟Flask的并发请求），比较在请求线程中渲染与不同进程数的渲染进程池
+用法: python benchmarks/bench_render.py [并发线程数] [每线程渲染次数] [renderer: fast|seaborn] [进程数,逗号分隔]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from utils_option import build_chain_frame, concat_chain_frames, create_heatmap_data, get_pivot_cube  # noqa: E402
+from utils_renderpool import RenderPool  # noqa: E402
+from synthetic import make_chain  # noqa: E402
+
+
+def make_dataset():
+    chain = make_chain(12, 200, spot=100.0, seed=0)
+    raw = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], 'BENCH')
+    meta = {'symbol': 'BENCH', 'current_price': 100.0, 'data_timestamp': datetime.now().isoformat()}
+    df = create_heatmap_data(dict(meta, options_data=raw))
+    get_pivot_cube(df)
+    return df, meta
+
+
+def run(df, meta, threads, per_thread, renderer):
+    size = (1200, 800) if renderer == 'fast' else None
+    charts = [c for c in app.CHART_TYPES if c not in ('oi_change',)]
+
+    def client(i):
+        for k in range(per_thread):
+            chart_type = charts[(i + k) % len(charts)]
+            app.render_heatmap_png(df, 'BENCH', chart_type, meta, dpi=300, size=size)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(client, range(threads)))
+    return time.perf_counter() - start
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    renderer = sys.argv[3] if len(sys.argv) > 3 else 'seaborn'
+    process_counts = [int(n) for n in sys.argv[4].split(',')] if len(sys.argv) > 4 else [0, 1, 2, 4]
+    df, meta = make_dataset()
+    total = threads * per_thread
+    print(f"{threads} 个并发线程 × 每线程 {per_thread} 次 = {total} 次渲染，renderer={renderer}，CPU核数 {os.cpu_count()}")
+    print("====================================================================================================")
+    for processes in process_counts:
+        pool = RenderPool(processes)
+        t0 = time.perf_counter()
+        pool.start()
+        warm = time.perf_counter() - t0
+        app.render_pool = pool
+        run(df, meta, 1, 1, renderer)  # 预热（进程内渲染时导入绘图库）
+        elapsed = run(df, meta, threads, per_thread, renderer)
+        pool.close()
+        label = '请求线程中渲染' if processes == 0 else f'进程池 {processes} 个进程 (启动预热 {warm:.2f} 秒)'
+        print(f"{label:40} {elapsed:7.2f} 秒, {total / elapsed:6.2f} 张/秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding:utf8 -*-
+"""
+离线抓取吞吐量基准：先把合成期权链录制为快照，再用 ReplayProvider 回放（注入延迟和失败），
+分别测量单个代码的串行/并发抓取和多进程批量抓取，不访问网络
+用法: python benchmarks/bench_replay.py [代码数] [到期日数] [每次请求延迟秒数] [失败率]
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils_option  # noqa: E402
+from utils_option import build_chain_frame, concat_chain_frames  # noqa: E402
+from utils_provider import ReplayProvider  # noqa: E402
+from utils_ratelimit import TokenBucket  # noqa: E402
+from utils_store import write_snapshot  # noqa: E402
+from synthetic import make_chain  # noqa: E402
+
+
+def record(symbols, n_exp, data_dir):
+    """把合成期权链写成各代码的快照，作为回放数据"""
+    for i, symbol in enumerate(symbols):
+        chain = make_chain(n_exp, 200, seed=i)
+        df = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], symbol)
+        write_snapshot(os.path.join(data_dir, f'{symbol}_options_data.parquet'), df,
+                       {'symbol': symbol, 'company_name': f'{symbol} Replay Corp', 'current_price': 100.0})
+
+
+def scrape_one(provider, workers, out_dir):
+    t0 = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        summary = utils_option.scrape_options_data('R0', max_retries=3, multiple_expirations=True,
+                                                   max_expiration_dates=0, max_workers=workers,
+                                                   rate_limiter=TokenBucket(rate=1000, capacity=1000),
+                                                   provider=provider, data_dir=out_dir, keep_history=False)
+    return time.perf_counter() - t0, summary['total_options'] if summary else 0
+
+
+def main():
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    n_exp = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    error_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 0.05
+    symbols = [f'R{i}' for i in range(n_symbols)]
+    with tempfile.TemporaryDirectory() as recorded, tempfile.TemporaryDirectory() as out_dir:
+        record(symbols, n_exp, recorded)
+        print(f"已录制 {n_symbols} 个代码 × {n_exp} 个到期日，回放延迟 {latency} 秒/请求，失败率 {error_rate:.0%}")
+
+        def provider():
+            return ReplayProvider(recorded, latency=latency, error_rate=error_rate, seed=1)
+
+        t_seq, n_seq = scrape_one(provider(), 1, out_dir)
+        t_par, n_par = scrape_one(provider(), 8, out_dir)
+        print("====================================================================================================")
+        print(f"单个代码 串行 (1线程):  {t_seq:.2f} 秒, {n_seq} 个合约")
+        print(f"单个代码 并发 (8线程):  {t_par:.2f} 秒, {n_par} 个合约, 加速比 {t_seq / t_par:.1f}x")
+        print("====================================================================================================")
+        utils_option.fetch_batch(symbols, max_expiration_dates=0, processes=4, threads_per_symbol=4, rate=200,
+                                 data_dir=out_dir, provider=provider())
+
+
+if __name__ == '__main__':
+    main()
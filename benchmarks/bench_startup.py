@@ -0,0 +1,52 @@
+# -*- coding:utf8 -*-
+"""
+冷启动基准：每次在新的Python进程中测量入口的导入耗时，并列出已加载的重量级依赖
+用法: python benchmarks/bench_startup.py [重复次数]
+
+fetch 子命令: 导入 utils_option 并分派到 fetch（参数不全时只打印用法，不访问网络）
+app 启动:     导入 app（创建Flask应用、缓存和任务管理器，相当于一个Web worker启动）
+"立即导入"一行在入口之前先导入 matplotlib/seaborn/yfinance，相当于这些依赖在模块顶层导入时的开销。
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('pandas', 'pyarrow', 'matplotlib', 'matplotlib.pyplot', 'seaborn', 'yfinance', 'flask', 'PIL')
+EAGER_IMPORTS = 'import matplotlib; matplotlib.use("Agg"); import matplotlib.pyplot, seaborn, yfinance\n'
+
+SCENARIOS = {
+    'fetch 子命令': "import sys, io, contextlib\nsys.argv = ['utils_option.py', 'fetch']\n"
+                 "import utils_option\nwith contextlib.redirect_stdout(io.StringIO()):\n    utils_option.main()\n",
+    'app 启动': "import app\n",
+}
+REPORT = "\nimport sys, json\nprint(json.dumps([m for m in %r if m in sys.modules]))\n" % (HEAVY_MODULES,)
+
+
+def run(code, repeat):
+    """返回 (最短耗时秒数, 已加载的重量级模块)"""
+    timings, loaded = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code + REPORT], cwd=ROOT, capture_output=True, text=True,
+                             check=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1')).stdout
+        timings.append(time.perf_counter() - t0)
+        loaded = json.loads(out.strip().splitlines()[-1])
+    return min(timings), loaded
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline, _ = run('pass\n', repeat)
+    print(f"空解释器启动: {baseline:.3f} 秒（以下耗时均已扣除）\n")
+    print(f"{'':16}{'延迟导入 (秒)':>14}{'立即导入 (秒)':>14}  已加载的重量级依赖")
+    for label, code in SCENARIOS.items():
+        lazy, loaded = run(code, repeat)
+        eager, _ = run(EAGER_IMPORTS + code, repeat)
+        print(f"{label:14}{lazy - baseline:>14.3f}{eager - baseline:>14.3f}  {', '.join(loaded) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
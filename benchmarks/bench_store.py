@@ -0,0 +1,67 @@
+# -*- coding:utf8 -*-
+"""
+快照存储基准：缩进JSON vs 列式Parquet（写入、全量加载、按列加载）
+用法: python benchmarks/bench_store.py [到期日数] [每边执行价数]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils_option import build_chain_frame, concat_chain_frames, chain_records, create_heatmap_data  # noqa: E402
+from utils_store import write_snapshot, read_snapshot  # noqa: E402
+from synthetic import make_chain  # noqa: E402
+
+OI_COLUMNS = ['type', 'strike_price', 'expiration_date', 'open_interest']
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    n_exp = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    n_strikes = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    chain = make_chain(n_exp, n_strikes)
+    df = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], 'SPY')
+    meta = {'symbol': 'SPY', 'current_price': 100.0, 'total_options': len(df)}
+    print(f"合成期权链: {len(df)} 个合约")
+
+    with tempfile.TemporaryDirectory() as d:
+        json_path = os.path.join(d, 'SPY_options_data.json')
+        pq_path = os.path.join(d, 'SPY_options_data.parquet')
+
+        def write_json():
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(meta, options_data=chain_records(df)), f, ensure_ascii=False, indent=2)
+
+        def load_json():
+            with open(json_path, 'r', encoding='utf-8') as f:
+                return create_heatmap_data(json.load(f))
+
+        def load_parquet(columns=None):
+            m, frame = read_snapshot(pq_path, columns=columns)
+            return create_heatmap_data(dict(m, options_data=frame))
+
+        t_wj, _ = timed(write_json)
+        t_wp, _ = timed(lambda: write_snapshot(pq_path, df, meta))
+        t_lj, _ = timed(load_json)
+        t_lp, _ = timed(load_parquet)
+        t_lo, _ = timed(lambda: load_parquet(OI_COLUMNS))
+        size_j = os.path.getsize(json_path) / 1e6
+        size_p = os.path.getsize(pq_path) / 1e6
+
+    print(f"{'':22}{'JSON':>10}{'Parquet':>10}")
+    print(f"{'文件大小 (MB)':18}{size_j:>10.2f}{size_p:>10.2f}")
+    print(f"{'写入 (秒)':20}{t_wj:>10.3f}{t_wp:>10.3f}")
+    print(f"{'加载+建表 (秒)':18}{t_lj:>10.3f}{t_lp:>10.3f}")
+    print(f"仅加载OI热力图所需列 (秒): {t_lo:.3f}")
+
+
+if __name__ == '__main__':
+    main()
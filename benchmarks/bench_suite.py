@@ -0,0 +1,202 @@
+# -*- coding:utf8 -*-
+"""
+端到端分阶段基准：用合成期权链（执行价 × 到期日 × 代码数可调）完全离线地测量每个阶段的耗时
+
+阶段: 入库(整列构建合约表) / 写Parquet / 写JSON / 抓取(ReplayProvider回放, 含保存快照和CSV) /
+      读Parquet / 读JSON / 构建热力图数据 / 透视 / 各图表类型渲染 / base64编码 / 汇总统计
+结果可保存为JSON（--output），并与保存的基线比较（--baseline，变慢超过阈值的阶段以退出码1报告）。
+
+用法: python benchmarks/bench_suite.py [--strikes 200] [--expirations 12] [--symbols 2] [--repeat 3]
+                                       [--renderer seaborn|fast] [--dpi 300] [--size 1200x800] [--render-workers 0]
+                                       [--charts direction_oi,iv] [--output 结果.json]
+                                       [--baseline 基线.json] [--threshold 1.25] [--json]
+"""
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from utils_option import (  # noqa: E402
+    build_chain_frame, concat_chain_frames, chain_records, scrape_options_data, load_options_data,
+    create_heatmap_data, get_pivot_cube, invalidate_pivot_cube
+)
+from utils_provider import ReplayProvider  # noqa: E402
+from utils_renderpool import RenderPool  # noqa: E402
+from utils_ratelimit import TokenBucket  # noqa: E402
+from utils_store import write_snapshot, CONTRACT_KEY_COLUMNS  # noqa: E402
+from synthetic import make_chain  # noqa: E402
+
+SPOT = 100.0
+
+
+class StageTimer:
+    """按阶段名收集每次运行的耗时（秒）"""
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        yield
+        self.samples.setdefault(name, []).append(time.perf_counter() - t0)
+
+    def summary(self):
+        return {name: {'median': float(np.median(s)), 'min': float(np.min(s)), 'max': float(np.max(s)),
+                       'runs': len(s)} for name, s in self.samples.items()}
+
+
+def run_symbol(timer, symbol, seed, args, dirs):
+    """对一个代码依次执行所有阶段"""
+    recorded, json_dir, out_dir = dirs
+    chain = make_chain(args.expirations, args.strikes, spot=SPOT, seed=seed)
+    meta = {'symbol': symbol, 'company_name': f'{symbol} Bench Corp', 'current_price': SPOT,
+            'data_timestamp': datetime.now().isoformat()}
+
+    with timer.stage('ingest'):
+        raw = concat_chain_frames([build_chain_frame(e, c, p) for e, (c, p) in chain.items()], symbol)
+    with timer.stage('write_parquet'):
+        write_snapshot(os.path.join(recorded, f'{symbol}_options_data.parquet'), raw, meta)
+    with timer.stage('write_json'):
+        with open(os.path.join(json_dir, f'{symbol}_options_data.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(meta, options_data=chain_records(raw)), f, ensure_ascii=False, indent=2)
+
+    provider = ReplayProvider(recorded)
+    provider.expirations(symbol)  # 预先读入回放数据，只测抓取流程本身
+    with timer.stage('fetch'), contextlib.redirect_stdout(io.StringIO()):
+        scrape_options_data(symbol, max_retries=1, multiple_expirations=True, max_expiration_dates=0,
+                            rate_limiter=TokenBucket(rate=1e9, capacity=1e9), provider=provider,
+                            data_dir=out_dir, keep_history=False, progress=lambda event: None)
+
+    with timer.stage('load_parquet'):
+        data = load_options_data(symbol, data_dir=recorded)
+    with timer.stage('load_json'):
+        load_options_data(symbol, data_dir=json_dir)
+    previous = data['options_data'][CONTRACT_KEY_COLUMNS + ['open_interest']]
+    with timer.stage('transform'):
+        df = create_heatmap_data(data, previous=previous)
+    invalidate_pivot_cube(df)
+    with timer.stage('pivot'):
+        get_pivot_cube(df)
+
+    png = None
+    for chart_type in args.charts:
+        with timer.stage(f'render_{chart_type}'):
+            image = app.render_heatmap_png(df, symbol, chart_type, data, args.dpi, args.size)
+        png = png or image
+    if png is not None:
+        with timer.stage('encode_base64'):
+            base64.b64encode(png).decode()
+    with timer.stage('summary'):
+        app.get_summary_statistics(df, symbol)
+
+
+def environment():
+    return {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(), 'processor': platform.processor() or platform.machine()}
+
+
+def compare(results, baseline, threshold):
+    """与基线逐阶段比较中位数耗时，返回变慢超过阈值的阶段列表"""
+    base_stages = baseline.get('stages', {})
+    if baseline.get('config') and baseline['config'] != results['config']:
+        print(f"注意: 基线的数据规模或参数不同 ({baseline['config']})，比较结果仅供参考")
+    regressions = []
+    print(f"\n{'阶段':18}{'基线 (毫秒)':>12}{'本次 (毫秒)':>12}{'比值':>8}")
+    for name, result in results['stages'].items():
+        base = base_stages.get(name)
+        if base is None:
+            print(f"{name:20}{'-':>12}{result['median'] * 1e3:>14.1f}")
+            continue
+        ratio = result['median'] / base['median'] if base['median'] > 0 else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  变慢'
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = '  变快'
+        print(f"{name:20}{base['median'] * 1e3:>12.1f}{result['median'] * 1e3:>14.1f}{ratio:>9.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='期权热力图端到端分阶段基准（离线）')
+    parser.add_argument('--strikes', type=int, default=200, help='每边执行价数')
+    parser.add_argument('--expirations', type=int, default=12, help='到期日数')
+    parser.add_argument('--symbols', type=int, default=2, help='代码数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    parser.add_argument('--renderer', choices=app.RENDERERS, default='seaborn', help='渲染方式')
+    parser.add_argument('--dpi', type=int, default=300, help='seaborn 渲染分辨率')
+    parser.add_argument('--size', default='1200x800', help='fast 渲染的像素尺寸（宽x高）')
+    parser.add_argument('--render-workers', type=int, default=0,
+                        help='渲染进程池的进程数（0 为在当前线程中渲染，只测渲染本身）')
+    parser.add_argument('--charts', default=','.join(app.CHART_TYPES), help='渲染的图表类型，逗号分隔')
+    parser.add_argument('--output', help='把结果保存为JSON文件')
+    parser.add_argument('--baseline', help='与之比较的基线JSON文件')
+    parser.add_argument('--threshold', type=float, default=1.25, help='中位数耗时超过基线的多少倍视为变慢')
+    parser.add_argument('--json', action='store_true', help='在标准输出打印JSON结果')
+    args = parser.parse_args()
+    args.charts = [c for c in args.charts.split(',') if c]
+    try:
+        width, height = (int(v) for v in args.size.lower().split('x'))
+    except ValueError:
+        parser.error(f"无效的尺寸: {args.size}")
+    args.size = (width, height) if args.renderer == 'fast' else None
+    render_desc = f"fast {width}x{height}" if args.size else f"seaborn {args.dpi}dpi"
+    unknown = [c for c in args.charts if c not in app.CHART_TYPES]
+    if unknown:
+        parser.error(f"未知的图表类型: {unknown}")
+
+    config = {'strikes': args.strikes, 'expirations': args.expirations, 'symbols': args.symbols,
+              'renderer': args.renderer, 'dpi': args.dpi, 'charts': args.charts}
+    if args.render_workers:
+        config['render_workers'] = args.render_workers
+    if args.size:
+        config['size'] = list(args.size)
+    timer = StageTimer()
+    app.render_pool = RenderPool(args.render_workers)
+    app.render_pool.start()
+    with tempfile.TemporaryDirectory() as recorded, tempfile.TemporaryDirectory() as json_dir, \
+            tempfile.TemporaryDirectory() as out_dir:
+        for _ in range(args.repeat):
+            for i in range(args.symbols):
+                run_symbol(timer, f'B{i}', i, args, (recorded, json_dir, out_dir))
+
+    results = {'config': config, 'contracts_per_symbol': 2 * args.strikes * args.expirations,
+               'environment': environment(), 'created': datetime.now().isoformat(timespec='seconds'),
+               'stages': timer.summary()}
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"{args.symbols} 个代码 × {args.expirations} 个到期日 × {args.strikes} 个执行价 × 2 = "
+              f"每个代码 {results['contracts_per_symbol']} 个合约，重复 {args.repeat} 次，渲染 {render_desc}")
+        print(f"{'阶段':18}{'中位数 (毫秒)':>14}{'最小':>10}{'最大':>10}{'次数':>6}")
+        for name, r in results['stages'].items():
+            print(f"{name:20}{r['median'] * 1e3:>14.1f}{r['min'] * 1e3:>12.1f}{r['max'] * 1e3:>12.1f}{r['runs']:>8}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n以下阶段的耗时超过基线的 {args.threshold} 倍: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# -*- coding:utf8 -*-
+"""
+本地假 yf.Ticker：返回合成期权链，可注入网络延迟和随机失败
+"""
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from synthetic import make_chain
+
+
+class FakeTicker:
+    """接口与 yf.Ticker 中本项目用到的部分一致: info / options / option_chain()"""
+
+    def __init__(self, symbol, n_expirations=20, n_strikes=200, latency=0.2, failure_rate=0.0, seed=0):
+        self.symbol = symbol
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._chain = make_chain(n_expirations, n_strikes, seed=seed)
+        self.calls_made = 0
+
+    def _request(self):
+        with self._lock:
+            self.calls_made += 1
+            fail = self._rng.random() < self.failure_rate
+        time.sleep(self.latency)
+        if fail:
+            raise ConnectionError("injected failure")
+
+    @property
+    def info(self):
+        self._request()
+        return {'regularMarketPrice': 100.0, 'shortName': f'{self.symbol} Fake Corp'}
+
+    @property
+    def options(self):
+        return tuple(self._chain)
+
+    def option_chain(self, expiration_date):
+        self._request()
+        calls, puts = self._chain[expiration_date]
+        return SimpleNamespace(calls=calls, puts=puts)
+
+
+def fake_ticker_factory(**kwargs):
+    """生成可传给 scrape_options_data(ticker_factory=...) 的工厂函数"""
+    return lambda symbol: FakeTicker(symbol, **kwargs)
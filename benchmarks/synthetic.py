@@ -0,0 +1,47 @@
+# -*- coding:utf8 -*-
+"""
+合成期权链数据（离线基准测试用）
+"""
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+def make_expirations(n_expirations, start=None):
+    """生成n个按周递增的到期日 (YYYY-MM-DD)"""
+    start = start or date.today()
+    return [(start + timedelta(days=7 * (i + 1))).isoformat() for i in range(n_expirations)]
+
+
+def make_raw_chain(n_strikes, spot=100.0, seed=0):
+    """生成与yfinance option_chain().calls/puts 字段一致的单边期权链"""
+    rng = np.random.default_rng(seed)
+    strikes = np.round(np.linspace(spot * 0.5, spot * 1.5, n_strikes), 2)
+    volume = rng.integers(0, 5000, n_strikes).astype('float64')
+    volume[rng.random(n_strikes) < 0.1] = np.nan
+    last = np.round(np.abs(spot - strikes) * 0.1 + rng.random(n_strikes) * 5, 2)
+    return pd.DataFrame({
+        'contractSymbol': [f'X{i}' for i in range(n_strikes)],
+        'strike': strikes,
+        'lastPrice': last,
+        'bid': np.round(last * 0.98, 2),
+        'ask': np.round(last * 1.02, 2),
+        'change': 0.0,
+        'percentChange': 0.0,
+        'volume': volume,
+        'openInterest': rng.integers(0, 20000, n_strikes),
+        'impliedVolatility': rng.uniform(0.1, 1.2, n_strikes),
+        'inTheMoney': strikes < spot,
+        'currency': 'USD',
+    })
+
+
+def make_chain(n_expirations, n_strikes, spot=100.0, seed=0):
+    """生成 {到期日: (calls, puts)} 的完整合成期权链"""
+    chain = {}
+    for i, expiration in enumerate(make_expirations(n_expirations)):
+        calls = make_raw_chain(n_strikes, spot, seed + 2 * i)
+        puts = make_raw_chain(n_strikes, spot, seed + 2 * i + 1)
+        chain[expiration] = (calls, puts)
+    return chain
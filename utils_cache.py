@@ -0,0 +1,286 @@
+# -*- coding:utf8 -*-
+"""
+进程内缓存：数据加载缓存(TTL + LRU，同key并发加载去重)、数据集注册表、渲染结果缓存
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils_store import atomic_open, normalize_timestamp
+
+
+def snapshot_order(snapshot_id):
+    """快照ID的排序键：时间戳按规范化后的时间排序；'latest'（旧版JSON没有时间戳）等无法解析的ID排在所有时间戳之前"""
+    try:
+        return (1, normalize_timestamp(snapshot_id))
+    except (TypeError, ValueError, AttributeError):
+        return (0, str(snapshot_id))
+
+
+class _InFlight:
+    """正在进行中的一次加载，其他请求同一key的线程等待它的结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """线程安全的TTL + LRU缓存
+
+    maxsize 为最多缓存的条目数，ttl 为条目的新鲜期（秒）。get_or_load 在缓存未命中或已过期时调用
+    loader 加载；同一个key同时只会有一个 loader 在运行，并发请求共享该次加载的结果。
+    loader 返回 None 时视为加载失败，不写入缓存。set / get_or_load 可以为单个条目指定更长或更短的 ttl，
+    get_or_load 的 ttl 也可以是函数，按 loader 的返回值决定该条目的新鲜期。
+    """
+
+    def __init__(self, maxsize=32, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (写入时间, 值, 新鲜期)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        stored_at, value, ttl = item
+        if now - stored_at > ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def get(self, key):
+        """返回未过期的缓存值，没有则返回None"""
+        with self._lock:
+            item = self._fresh(key, time.monotonic())
+            return item[1] if item else None
+
+    def age(self, key):
+        """返回缓存条目已存在的秒数，没有则返回None"""
+        with self._lock:
+            item = self._fresh(key, time.monotonic())
+            return time.monotonic() - item[0] if item else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value, self.ttl if ttl is None else ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """删除指定key，key为None时清空缓存"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def get_or_load(self, key, loader, force=False, ttl=None):
+        """命中则直接返回缓存值，否则调用 loader()（同key并发请求只加载一次）"""
+        with self._lock:
+            if not force:
+                item = self._fresh(key, time.monotonic())
+                if item is not None:
+                    self.hits += 1
+                    return item[1]
+            self.misses += 1
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = _InFlight()
+        if not owner:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+            if flight.value is not None:
+                self.set(key, flight.value, ttl(flight.value) if callable(ttl) else ttl)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class DatasetRegistry:
+    """按 (symbol, snapshot_id) 保存已处理数据集的线程安全注册表
+
+    以DataFrame实际占用的内存计量，总量超过 max_bytes 时按LRU淘汰；同一代码记录时间最新的快照ID
+    （按 snapshot_order 比较），get 不指定 snapshot_id 时返回该代码的最新快照。
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # (symbol, snapshot_id) -> entry
+        self._latest = {}  # symbol -> snapshot_id
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(df):
+        try:
+            return int(df.memory_usage(index=True, deep=True).sum())
+        except Exception:
+            return 0
+
+    def put(self, symbol, snapshot_id, df, meta=None):
+        """登记数据集，返回条目字典"""
+        entry = {
+            'symbol': symbol,
+            'snapshot_id': snapshot_id,
+            'df': df,
+            'meta': meta or {},
+            'nbytes': self._sizeof(df),
+            'loaded_at': time.time()
+        }
+        key = (symbol, snapshot_id)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old['nbytes']
+            self._entries[key] = entry
+            self.total_bytes += entry['nbytes']
+            latest = self._latest.get(symbol)
+            if latest is None or snapshot_order(snapshot_id) >= snapshot_order(latest):
+                self._latest[symbol] = snapshot_id
+            # 至少保留刚登记的条目
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                (old_symbol, old_id), victim = self._entries.popitem(last=False)
+                self.total_bytes -= victim['nbytes']
+                if self._latest.get(old_symbol) == old_id:
+                    del self._latest[old_symbol]
+        return entry
+
+    def get(self, symbol, snapshot_id=None):
+        """返回条目字典，不存在时返回None"""
+        with self._lock:
+            if snapshot_id is None:
+                snapshot_id = self._latest.get(symbol)
+            entry = self._entries.get((symbol, snapshot_id))
+            if entry is not None:
+                self._entries.move_to_end((symbol, snapshot_id))
+            return entry
+
+    def latest_snapshot_id(self, symbol):
+        with self._lock:
+            return self._latest.get(symbol)
+
+    def discard(self, symbol, snapshot_id=None):
+        """删除某代码的指定快照（snapshot_id 为 None 时删除该代码的全部快照）"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == symbol and snapshot_id in (None, k[1])]:
+                self.total_bytes -= self._entries.pop(key)['nbytes']
+            if snapshot_id is None or self._latest.get(symbol) == snapshot_id:
+                self._latest.pop(symbol, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RenderCache:
+    """渲染结果（图片字节）缓存，key 为 (symbol, snapshot_id, chart_type, 尺寸/dpi...)
+
+    内存层按字节数LRU淘汰；指定 disk_dir 时增加磁盘层，内存未命中时从磁盘读取并回填内存。
+    invalidate_symbol 删除某代码除当前快照以外的所有渲染结果。
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.disk_dir = disk_dir
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def _key_name(key):
+        return re.sub(r'[^A-Za-z0-9._-]', '_', '__'.join(str(part) for part in key[1:]))
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, re.sub(r'[^A-Za-z0-9._-]', '_', str(key[0])), self._key_name(key))
+
+    def _put_memory(self, key, value):
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        if len(value) > self.max_bytes:
+            return
+        self._data[key] = value
+        self.total_bytes += len(value)
+        while self.total_bytes > self.max_bytes:
+            _, victim = self._data.popitem(last=False)
+            self.total_bytes -= len(victim)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    value = f.read()
+            except OSError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._put_memory(key, value)
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._put_memory(key, value)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_open(path, 'wb') as f:
+                f.write(value)
+
+    def invalidate_symbol(self, symbol, keep_snapshot=None):
+        """删除某代码的渲染结果，keep_snapshot 指定的快照保留"""
+        with self._lock:
+            for key in [k for k in self._data if k[0] == symbol and k[1] != keep_snapshot]:
+                self.total_bytes -= len(self._data.pop(key))
+        if self.disk_dir:
+            directory = self._disk_path((symbol, ''))
+            directory = os.path.dirname(directory)
+            keep_prefix = self._key_name((symbol, keep_snapshot)) + '__' if keep_snapshot is not None else None
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    if keep_prefix is None or not name.startswith(keep_prefix):
+                        try:
+                            os.remove(os.path.join(directory, name))
+                        except OSError:
+                            pass
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,222 @@
+# -*- coding:utf8 -*-
+"""
+向量化 Black-Scholes：对整条期权链一次性计算理论价格、Greeks（delta、gamma、vega、theta）、
+gamma/delta 敞口，以及从市场价格反解隐含波动率
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# 无风险利率（连续复利，年化），可用环境变量覆盖
+RISK_FREE_RATE = float(os.environ.get('OPTIONS_RISK_FREE_RATE', 0.04))
+# 每张合约对应的股数
+CONTRACT_MULTIPLIER = 100
+# 剩余期限下限（年）：到期当天的合约按1小时计算，避免除零
+MIN_TIME_TO_EXPIRY = 1 / (365 * 24)
+# 美股期权在到期日收盘（16:00）到期
+EXPIRY_HOUR = 16
+# 隐含波动率求解：价格误差容限、最大迭代次数、搜索区间（小数形式）
+IV_TOLERANCE = 1e-6
+IV_MAX_ITER = 50
+IV_BOUNDS = (1e-4, 5.0)
+# 低于该值（或缺失）的隐含波动率视为无效数据，需要重新求解
+MIN_VALID_IV = 0.01
+# 时间价值不到半个最小报价单位的合约，价格几乎不随波动率变化，不做求解
+MIN_TIME_VALUE = 0.005
+
+_SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / _SQRT_2PI
+
+
+def norm_cdf(x):
+    """标准正态分布函数，双精度（Hart 1968 有理逼近，|x| >= 7.07 时用连分式）"""
+    x = np.asarray(x, dtype='float64')
+    z = np.abs(x)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        expo = np.exp(-0.5 * z * z)
+        num = ((((((3.52624965998911e-02 * z + 0.700383064443688) * z + 6.37396220353165) * z
+                  + 33.912866078383) * z + 112.079291497871) * z + 221.213596169931) * z + 220.206867912376)
+        den = (((((((8.83883476483184e-02 * z + 1.75566716318264) * z + 16.064177579207) * z
+                   + 86.7807322029461) * z + 296.564248779674) * z + 637.333633378831) * z
+                + 793.826512519948) * z + 440.413735824752)
+        frac = z + 1 / (z + 2 / (z + 3 / (z + 4 / (z + 0.65))))
+        tail = np.where(z < 7.07106781186547, expo * num / den, expo / frac / 2.506628274631)
+    tail = np.where(z > 37, 0.0, tail)
+    return np.where(x > 0, 1 - tail, tail)
+
+
+def year_fractions(expiration_dates, as_of=None):
+    """到期日（datetime64序列）距 as_of 的年数，不小于 MIN_TIME_TO_EXPIRY"""
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now()
+    if as_of.tzinfo is not None:
+        as_of = as_of.tz_convert(None)
+    expiry = pd.DatetimeIndex(expiration_dates) + pd.Timedelta(hours=EXPIRY_HOUR)
+    seconds = (expiry - as_of).total_seconds().to_numpy(dtype='float64')
+    return np.maximum(seconds / (365 * 24 * 3600), MIN_TIME_TO_EXPIRY)
+
+
+def _d1_d2(spot, strike, t, sigma, r, q):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vol_t = sigma * np.sqrt(t)
+        d1 = (np.log(spot / strike) + (r - q + 0.5 * sigma * sigma) * t) / vol_t
+    return d1, d1 - vol_t
+
+
+def _price_and_vega(spot, strike, t, sigma, sign, r, q):
+    """sigma > 0 时的价格和 dPrice/dSigma（未除以100）"""
+    d1, d2 = _d1_d2(spot, strike, t, sigma, r, q)
+    fwd = spot * np.exp(-q * t)
+    price = sign * (fwd * norm_cdf(sign * d1) - strike * np.exp(-r * t) * norm_cdf(sign * d2))
+    return price, fwd * norm_pdf(d1) * np.sqrt(t)
+
+
+def black_scholes_price(spot, strike, t, sigma, is_call, r=RISK_FREE_RATE, q=0.0):
+    """欧式期权理论价格；sigma <= 0 的合约返回内在价值的贴现值"""
+    strike = np.asarray(strike, dtype='float64')
+    t = np.asarray(t, dtype='float64')
+    sigma = np.asarray(sigma, dtype='float64')
+    sign = np.where(is_call, 1.0, -1.0)
+    price, _ = _price_and_vega(spot, strike, t, sigma, sign, r, q)
+    intrinsic = np.maximum(sign * (spot * np.exp(-q * t) - strike * np.exp(-r * t)), 0)
+    return np.where(sigma > 0, price, intrinsic)
+
+
+def black_scholes_greeks(spot, strike, t, sigma, is_call, r=RISK_FREE_RATE, q=0.0):
+    """批量计算 Greeks，返回 {'delta', 'gamma', 'vega', 'theta'} 数组
+
+    vega 为波动率变动1个百分点的价格变化，theta 为每个自然日的价格变化；
+    sigma 非正或缺失的合约各项为NaN。
+    """
+    strike = np.asarray(strike, dtype='float64')
+    t = np.asarray(t, dtype='float64')
+    sigma = np.where(np.asarray(sigma, dtype='float64') > 0, sigma, np.nan)
+    is_call = np.asarray(is_call, dtype=bool)
+    d1, d2 = _d1_d2(spot, strike, t, sigma, r, q)
+    sqrt_t = np.sqrt(t)
+    div = np.exp(-q * t)
+    disc = strike * np.exp(-r * t)
+    pdf = norm_pdf(d1)
+    sign = np.where(is_call, 1.0, -1.0)
+    # 看跌用 N(-d) 而不是 1 - N(d)，深度虚值合约不会损失精度
+    cdf_d1 = norm_cdf(sign * d1)
+    cdf_d2 = norm_cdf(sign * d2)
+    delta = sign * div * cdf_d1
+    gamma = div * pdf / (spot * sigma * sqrt_t)
+    vega = spot * div * pdf * sqrt_t / 100
+    decay = -spot * div * pdf * sigma / (2 * sqrt_t)
+    theta = (decay - sign * r * disc * cdf_d2 + sign * q * spot * div * cdf_d1) / 365
+    return {'delta': delta, 'gamma': gamma, 'vega': vega, 'theta': theta}
+
+
+def add_greeks(df, spot, sigma=None, as_of=None, r=RISK_FREE_RATE, q=0.0):
+    """为 create_heatmap_data 处理后的DataFrame追加 Greeks 与敞口列（原地修改，返回df）
+
+    sigma 为小数形式的隐含波动率数组，默认取 implied_volatility 列。追加的列：
+    delta / gamma / vega / theta —— 单份期权的 Greeks；
+    gex —— gamma 敞口：标的变动1%时的美元delta变化 × 未平仓量，看涨为正、看跌为负（做市商持有看涨、卖出看跌的惯例）；
+    dex —— delta 敞口：美元delta × 未平仓量（看跌期权的delta本身为负）。
+    无法定价的合约敞口记为0。追加的列以float32保存（汇总时再按float64累加）。
+    """
+    if sigma is None:
+        sigma = df['implied_volatility'].to_numpy(dtype='float64')
+    is_call = (df['type'] == 'Call').to_numpy()
+    t = year_fractions(df['expiration_date'], as_of)
+    greeks = black_scholes_greeks(spot, df['strike_price'].to_numpy(dtype='float64'), t, sigma, is_call, r, q)
+    for name, values in greeks.items():
+        df[name] = values.astype('float32')
+    shares = pd.to_numeric(df['open_interest'], errors='coerce').fillna(0).to_numpy(dtype='float64') * CONTRACT_MULTIPLIER
+    sign = np.where(is_call, 1.0, -1.0)
+    df['gex'] = np.nan_to_num(sign * greeks['gamma'] * shares * spot * spot * 0.01).astype('float32')
+    df['dex'] = np.nan_to_num(greeks['delta'] * shares * spot).astype('float32')
+    return df
+
+
+def implied_volatility(price, spot, strike, t, is_call, r=RISK_FREE_RATE, q=0.0,
+                       tol=IV_TOLERANCE, max_iter=IV_MAX_ITER, bounds=IV_BOUNDS, min_time_value=0.0):
+    """批量反解隐含波动率：Newton 迭代，步长越出当前区间时改用二分
+
+    价格关于 sigma 单调递增，每轮迭代都用模型价格与市场价格之差收紧每个合约的 [low, high]，
+    所以即使 vega 很小也不会发散。只对尚未收敛的合约继续迭代。
+    返回 (sigma, converged)：模型价格与 price 之差小于 tol 的合约 converged 为 True；
+    价格超出无套利区间（或时间价值不超过 min_time_value）、max_iter 轮内未收敛的合约 sigma 为NaN。
+    """
+    price = np.asarray(price, dtype='float64')
+    strike = np.broadcast_to(np.asarray(strike, dtype='float64'), price.shape)
+    t = np.broadcast_to(np.asarray(t, dtype='float64'), price.shape)
+    sign = np.broadcast_to(np.where(is_call, 1.0, -1.0), price.shape)
+    sigma = np.full(price.shape, np.nan)
+    converged = np.zeros(price.shape, dtype=bool)
+    fwd = spot * np.exp(-q * t)
+    disc = strike * np.exp(-r * t)
+    floor = np.maximum(sign * (fwd - disc), 0)
+    cap = np.where(sign > 0, fwd, disc)
+    with np.errstate(invalid='ignore'):
+        idx = np.flatnonzero((price - floor > min_time_value) & (price < cap))
+    low = np.full(idx.size, bounds[0])
+    high = np.full(idx.size, bounds[1])
+    # 初值：Brenner-Subrahmanyam 平值近似
+    x = np.clip(np.sqrt(2 * np.pi / t[idx]) * price[idx] / spot, bounds[0], bounds[1])
+    for _ in range(max_iter):
+        if idx.size == 0:
+            break
+        model, vega = _price_and_vega(spot, strike[idx], t[idx], x, sign[idx], r, q)
+        diff = model - price[idx]
+        done = np.abs(diff) < tol
+        if done.any():
+            sigma[idx[done]] = x[done]
+            converged[idx[done]] = True
+            keep = ~done
+            idx, x, low, high, diff, vega = idx[keep], x[keep], low[keep], high[keep], diff[keep], vega[keep]
+        above = diff > 0
+        high = np.where(above, x, high)
+        low = np.where(above, low, x)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = x - diff / vega
+        x = np.where(np.isfinite(step) & (step > low) & (step < high), step, 0.5 * (low + high))
+    return sigma, converged
+
+
+def market_prices(df):
+    """每个合约的市场价格：买卖价都有效时取中间价，否则取最新成交价，都没有则为NaN"""
+    bid = pd.to_numeric(df['bid'], errors='coerce').to_numpy(dtype='float64') if 'bid' in df.columns else None
+    ask = pd.to_numeric(df['ask'], errors='coerce').to_numpy(dtype='float64') if 'ask' in df.columns else None
+    last = pd.to_numeric(df['last_price'], errors='coerce').to_numpy(dtype='float64') if 'last_price' in df.columns \
+        else np.full(len(df), np.nan)
+    last = np.where(last > 0, last, np.nan)
+    if bid is None or ask is None:
+        return last
+    with np.errstate(invalid='ignore'):
+        return np.where((bid > 0) & (ask >= bid), 0.5 * (bid + ask), last)
+
+
+def backfill_implied_volatility(df, spot, sigma=None, as_of=None, min_iv=MIN_VALID_IV, recompute_all=False,
+                                r=RISK_FREE_RATE, q=0.0, tol=IV_TOLERANCE, max_iter=IV_MAX_ITER):
+    """用市场价格重新求解缺失或过小（< min_iv）的隐含波动率
+
+    sigma 为小数形式的原始隐含波动率，默认取 implied_volatility 列；recompute_all 为 True 时求解全部合约。
+    返回补齐后的 sigma 数组（求解失败的保持原值），并在df中写入 iv_backfilled 列标记被替换的合约。
+    """
+    if sigma is None:
+        sigma = df['implied_volatility'].to_numpy(dtype='float64')
+    sigma = np.array(sigma, dtype='float64')
+    flags = np.zeros(len(df), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        targets = np.ones(len(df), dtype=bool) if recompute_all else ~(sigma >= min_iv)
+    if targets.any():
+        idx = np.flatnonzero(targets)
+        solved, converged = implied_volatility(
+            market_prices(df)[idx], spot,
+            df['strike_price'].to_numpy(dtype='float64')[idx],
+            year_fractions(df['expiration_date'], as_of)[idx],
+            (df['type'] == 'Call').to_numpy()[idx],
+            r, q, tol, max_iter, min_time_value=MIN_TIME_VALUE
+        )
+        idx = idx[converged]
+        sigma[idx] = solved[converged]
+        flags[idx] = True
+    df['iv_backfilled'] = flags
+    return sigma
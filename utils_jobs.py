@@ -0,0 +1,115 @@
+# -*- coding:utf8 -*-
+"""
+后台任务：在线程池中运行耗时的数据加载，通过任务ID查询进度和结果
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 每个任务最多保留的进度事件数
+MAX_EVENTS_PER_JOB = 200
+
+
+class Job:
+    """单个后台任务的状态: queued / running / succeeded / failed"""
+
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.progress = {}
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.version = 0
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def _touch(self):
+        self.updated_at = time.time()
+        self.version += 1
+        self.changed.notify_all()
+
+    def add_event(self, event):
+        """进度回调：记录事件，并把最新的进度字段合并到 progress"""
+        with self.changed:
+            self.events.append(event)
+            del self.events[:-MAX_EVENTS_PER_JOB]
+            self.progress.update({k: v for k, v in event.items() if k != 'message'})
+            self._touch()
+
+    def set_status(self, status, result=None, error=None):
+        with self.changed:
+            self.status = status
+            self.result = result
+            self.error = error
+            self._touch()
+
+    def wait_for_change(self, version, timeout=None):
+        """阻塞直到任务版本号大于 version 或超时，返回当前版本号"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version > version, timeout=timeout)
+            return self.version
+
+    def to_dict(self, since_event=0):
+        with self.changed:
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'params': self.params,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'events': self.events[since_event:],
+                'event_count': len(self.events),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'updated_at': self.updated_at
+            }
+
+
+class JobManager:
+    """后台任务管理器：有界线程池执行任务，最多保留 max_jobs 个任务记录（优先淘汰已结束的任务）"""
+
+    def __init__(self, max_workers=4, max_jobs=200):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, **params):
+        """提交任务，立即返回Job；fn(progress=回调, **params) 的返回值作为任务结果"""
+        job = Job(uuid.uuid4().hex, kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job.set_status('running')
+        try:
+            result = fn(progress=job.add_event, **job.params)
+        except Exception as e:
+            job.set_status('failed', error=str(e))
+        else:
+            job.set_status('succeeded', result=result)
+
+    def _evict(self):
+        while len(self._jobs) > self.max_jobs:
+            victim = next((j for j in self._jobs.values() if j.finished), None)
+            if victim is None:
+                break
+            del self._jobs[victim.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
@@ -0,0 +1,173 @@
+# -*- coding:utf8 -*-
+"""
+轻量级运行指标：各阶段耗时直方图、计数器，按Prometheus文本格式导出；可选的单次请求分阶段耗时记录
+
+    with timed('transform', symbol='AAPL'):   # 记入 options_stage_seconds{stage="transform",symbol="AAPL"}
+        ...
+    count('options_fetch_errors_total', symbol='AAPL', scope='expiration')
+
+start_profile() 之后，同一上下文（同一请求线程）中 timed() 记录的每个阶段也会追加到该次的分阶段记录中。
+"""
+import contextlib
+import contextvars
+import threading
+import time
+
+STAGE_METRIC = 'options_stage_seconds'
+# 耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """线程安全的计数器 / 直方图集合
+
+    describe 登记指标类型和说明；inc / observe 按标签累加；collector 为渲染时调用的函数，
+    返回 [(名称, 类型, 说明, [(标签字典, 值), ...]), ...]，用于导出已有对象自己维护的计数（如缓存命中数）。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._meta = {}  # 名称 -> (类型, 说明)
+        self._counters = {}  # (名称, 标签) -> 值
+        self._histograms = {}  # (名称, 标签) -> [各桶计数..., 总数, 总和]
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            state = self._histograms.get(key)
+            if state is None:
+                state = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def value(self, name, **labels):
+        """计数器的当前值（直方图返回观测次数），没有时返回0"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            state = self._histograms.get(key)
+            return state[-2] if state else 0
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """按Prometheus文本格式（0.0.4）输出全部指标，同名指标的样本排在一起"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        families = {}  # 名称 -> (类型, 样本行)
+
+        def family(name, kind):
+            if name not in families:
+                families[name] = (self._meta.get(name, (kind, ''))[0], [])
+            return families[name][1]
+
+        for (name, labels), value in counters:
+            family(name, 'counter').append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                self._meta.setdefault(name, (kind, help_text))
+                lines = family(name, kind)
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}')
+        for (name, labels), state in histograms:
+            lines = family(name, 'histogram')
+            for bound, n in zip(self.buckets + (float('inf'),), state[:len(self.buckets)] + [state[-2]]):
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", _format_value(float(bound)))])} {n}')
+            lines.append(f'{name}_count{_format_labels(labels)} {state[-2]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(float(state[-1]))}')
+        out = []
+        for name, (kind, lines) in families.items():
+            help_text = self._meta.get(name, (kind, ''))[1]
+            if help_text:
+                out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+registry = MetricsRegistry()
+registry.describe(STAGE_METRIC, 'histogram', '各处理阶段的耗时（秒）')
+registry.describe('options_cache_requests_total', 'counter', '进程内缓存的命中/未命中次数')
+registry.describe('options_fetch_errors_total', 'counter', '抓取请求失败次数（scope: attempt 整次抓取 / expiration 单个到期日）')
+registry.describe('options_fetch_retries_total', 'counter', '抓取重试次数')
+registry.describe('options_http_requests_total', 'counter', 'HTTP请求数')
+registry.describe('options_http_request_seconds', 'histogram', 'HTTP请求处理耗时（秒，流式响应不含发送正文的时间）')
+
+# ================= 单次请求分阶段记录 =================
+
+_profile = contextvars.ContextVar('options_profile', default=None)
+
+
+def start_profile():
+    """开始记录当前上下文中的阶段耗时，返回 (记录列表, token)；结束时调用 stop_profile(token)"""
+    stages = []
+    return stages, _profile.set(stages)
+
+
+def stop_profile(token):
+    _profile.reset(token)
+
+
+@contextlib.contextmanager
+def timed(stage, **labels):
+    """记录一个阶段的耗时（异常退出也会记录）"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - t0, **labels)
+
+
+def record_stage(stage, seconds, **labels):
+    """记录一个已测得的阶段耗时（如渲染子进程返回的分阶段记录）"""
+    registry.observe(STAGE_METRIC, seconds, stage=stage, **labels)
+    stages = _profile.get()
+    if stages is not None:
+        stages.append(dict(labels, stage=stage, ms=round(seconds * 1e3, 3)))
+
+
+def count(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+def cache_access(cache, hit):
+    """记录一次缓存访问"""
+    registry.inc('options_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
@@ -1,204 +1,761 @@
 # -*- coding:utf8 -*-
 """
 期权数据与热力图工具函数合集
+
+matplotlib/seaborn 和 yfinance 在第一次画图、联网抓取时才导入（见 import_plotting / utils_provider），
+只抓取数据的命令和Web worker启动时不必加载绘图库。
 """
-import yfinance as yf
 import json
 import time
 from datetime import datetime
 import pandas as pd
 import random
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 import warnings
 warnings.filterwarnings('ignore')
 import sys
+import io
+import threading
+import multiprocessing
+import weakref
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from utils_ratelimit import get_default_limiter, set_default_limiter, SharedTokenBucket, DEFAULT_RATE_PER_SEC
+from utils_store import (
+    atomic_open, has_columnar_support, write_snapshot, read_snapshot, read_snapshot_meta,
+    SnapshotHistory, SymbolCatalog, SNAPSHOT_SUFFIX, JSON_SUFFIX, CONTRACT_KEY_COLUMNS,
+    align_contracts, compact_frame, contract_names, format_csv_rows
+)
+from utils_greeks import add_greeks, backfill_implied_volatility
+from utils_provider import get_default_provider, TickerProvider, CHAIN_COLUMN_MAP
+from utils_metrics import timed, count, cache_access
+
+# ================= 延迟导入 =================
+
+_plotting = None
+_plotting_lock = threading.Lock()
 
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
+def import_plotting(backend=None):
+    """按需导入并返回 (pyplot, seaborn)，第一次导入时设置中文字体
+
+    backend 只在第一次导入pyplot之前生效（Web服务传入 'Agg'）。
+    """
+    global _plotting
+    with _plotting_lock:
+        if _plotting is None:
+            import matplotlib
+            if backend:
+                matplotlib.use(backend)
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+            plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
+            plt.rcParams['axes.unicode_minus'] = False
+            _plotting = (plt, sns)
+    return _plotting
 
 # ================= 数据抓取与保存 =================
 
-def scrape_options_data(symbol="AAPL", max_retries=5, multiple_expirations=False, max_expiration_dates=3):
-    """爬取期权数据并保存到data目录"""
+SEPARATOR = "----------------------------------------------------------------------------------------------------"
+
+def print_progress(event):
+    """默认进度回调：把进度事件中的消息打印到控制台"""
+    if event.get('message'):
+        print(event['message'])
+
+class ScrapeProgress:
+    """抓取进度：汇总已完成到期日数、已获取合约数、重试状态，并以事件字典的形式回调
+
+    事件字段: symbol, stage, message, attempt, expirations_done, expirations_total, contracts, time，
+    以及各阶段附带的字段（如 expiration_date、retry_in）。
+    """
+
+    def __init__(self, symbol, callback=None):
+        self.symbol = symbol
+        self.callback = callback or print_progress
+        self.attempt = 0
+        self.expirations_done = 0
+        self.expirations_total = 0
+        self.contracts = 0
+        self._lock = threading.Lock()
+
+    def report(self, stage, message='', **fields):
+        with self._lock:
+            event = {
+                'symbol': self.symbol,
+                'stage': stage,
+                'message': message,
+                'attempt': self.attempt,
+                'expirations_done': self.expirations_done,
+                'expirations_total': self.expirations_total,
+                'contracts': self.contracts,
+                'time': datetime.now().isoformat()
+            }
+        event.update(fields)
+        self.callback(event)
+
+    def start_attempt(self, attempt):
+        with self._lock:
+            self.attempt = attempt
+            self.expirations_done = 0
+            self.expirations_total = 0
+            self.contracts = 0
+
+    def set_total(self, total):
+        with self._lock:
+            self.expirations_total = total
+
+    def expiration_done(self, contracts):
+        with self._lock:
+            self.expirations_done += 1
+            self.contracts += contracts
+
+def scrape_options_data(symbol="AAPL", max_retries=5, multiple_expirations=False, max_expiration_dates=3,
+                        max_workers=1, rate_limiter=None, ticker_factory=None, data_dir=None, keep_history=True,
+                        progress=None, provider=None):
+    """爬取期权数据并保存到data目录
+
+    max_workers > 1 时各到期日通过线程池并发获取；所有请求共用 rate_limiter（令牌桶）限速，
+    每个到期日单独重试。provider 为行情数据源（utils_provider.MarketDataProvider），默认为 get_default_provider()；
+    兼容旧参数 ticker_factory（yf.Ticker 风格的工厂函数），传入时包装为 TickerProvider。
+    keep_history 为 True 时快照同时追加到 data/history 历史库中。
+    progress 为进度回调，接收 ScrapeProgress 生成的事件字典，默认打印到控制台。
+    """
     global List_OptionsAll, CurCountShow, TotalCountShow
     List_OptionsAll = []
     TotalCountShow = 0
     CurCountShow = 0
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
+    limiter = rate_limiter or get_default_limiter()
+    if provider is None:
+        provider = TickerProvider(ticker_factory) if ticker_factory is not None else get_default_provider()
+    tracker = ScrapeProgress(symbol, progress)
+    data_dir = data_dir or os.path.join(os.path.dirname(__file__), 'data')
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
     scrape_start_time = datetime.now()
-    print(f"开始爬取 {symbol} 期权数据...")
-    print(f"爬取开始时间: {scrape_start_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    print("----------------------------------------------------------------------------------------------------")
+    tracker.report('start', f"开始爬取 {symbol} 期权数据...\n"
+                            f"爬取开始时间: {scrape_start_time.strftime('%Y-%m-%d %H:%M:%S')}\n{SEPARATOR}")
     for attempt in range(max_retries):
         try:
-            print(f"尝试第 {attempt + 1} 次获取数据...")
+            tracker.start_attempt(attempt + 1)
+            tracker.report('attempt', f"尝试第 {attempt + 1} 次获取数据...")
             List_OptionsAll = []
             CurCountShow = 0
             if attempt > 0:
                 delay = random.uniform(5 + attempt * 2, 10 + attempt * 3)
-                print(f"等待 {delay:.1f} 秒后重试...")
+                tracker.report('retry_wait', f"等待 {delay:.1f} 秒后重试...", retry_in=delay)
                 time.sleep(delay)
-            stock = yf.Ticker(symbol)
-            info = stock.info
-            current_price = info.get('regularMarketPrice', 'N/A')
-            # 获取公司名称
-            company_name = info.get('shortName') or info.get('longName') or symbol
-            print(f"股票代码: {symbol}")
-            print(f"公司名称: {company_name}")
-            print(f"当前股价: ${current_price}")
-            print(f"市场时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print("----------------------------------------------------------------------------------------------------")
-            expiration_dates = stock.options
+            limiter.acquire()
+            quote = provider.quote(symbol)
+            current_price = quote['current_price']
+            company_name = quote['company_name']
+            tracker.report('quote', f"股票代码: {symbol}\n公司名称: {company_name}\n当前股价: ${current_price}\n"
+                                    f"市场时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n{SEPARATOR}",
+                           company_name=company_name, current_price=current_price)
+            limiter.acquire()
+            expiration_dates = provider.expirations(symbol)
             if not expiration_dates:
-                print("没有找到期权数据")
+                tracker.report('failed', "没有找到期权数据")
                 return
-            print(f"可用的期权到期日期数量: {len(expiration_dates)}")
             if multiple_expirations and len(expiration_dates) > 1:
                 if max_expiration_dates == 0 or max_expiration_dates >= len(expiration_dates):
                     dates_to_fetch = expiration_dates
-                    print(f"将获取所有到期日期的数据: 共{len(dates_to_fetch)}个")
+                    plan = f"将获取所有到期日期的数据: 共{len(dates_to_fetch)}个"
                 else:
                     dates_to_fetch = expiration_dates[:max_expiration_dates]
-                    print(f"将获取前{max_expiration_dates}个到期日期的数据: {dates_to_fetch}")
+                    plan = f"将获取前{max_expiration_dates}个到期日期的数据: {dates_to_fetch}"
             else:
                 dates_to_fetch = [expiration_dates[0]]
-                print(f"最近的到期日期: {expiration_dates[0]}")
-            print("----------------------------------------------------------------------------------------------------")
-            total_calls = 0
-            total_puts = 0
-            for date_idx, expiration_date in enumerate(dates_to_fetch):
-                print(f"正在获取 {expiration_date} 到期的期权数据...")
-                print("正在获取期权链数据，请稍候...")
-                options = stock.option_chain(expiration_date)
-                calls = options.calls
-                print(f"\n{expiration_date} 看涨期权 (Calls) - 共 {len(calls)} 个:")
-                print("----------------------------------------------------------------------------------------------------")
-                for i, call in calls.iterrows():
-                    contract_name = f"{symbol}{expiration_date.replace('-', '')}C{int(call['strike']*1000):08d}"
-                    option_info = {
-                        'type': 'Call',
-                        'contract_name': contract_name,
-                        'expiration_date': expiration_date,
-                        'strike_price': call['strike'],
-                        'last_price': call['lastPrice'],
-                        'bid': call['bid'],
-                        'ask': call['ask'],
-                        'volume': call['volume'],
-                        'open_interest': call['openInterest'],
-                        'implied_volatility': call['impliedVolatility']
-                    }
-                    List_OptionsAll.append(option_info)
-                    total_calls += 1
-                puts = options.puts
-                print(f"\n{expiration_date} 看跌期权 (Puts) - 共 {len(puts)} 个:")
-                print("----------------------------------------------------------------------------------------------------")
-                for i, put in puts.iterrows():
-                    contract_name = f"{symbol}{expiration_date.replace('-', '')}P{int(put['strike']*1000):08d}"
-                    option_info = {
-                        'type': 'Put',
-                        'contract_name': contract_name,
-                        'expiration_date': expiration_date,
-                        'strike_price': put['strike'],
-                        'last_price': put['lastPrice'],
-                        'bid': put['bid'],
-                        'ask': put['ask'],
-                        'volume': put['volume'],
-                        'open_interest': put['openInterest'],
-                        'implied_volatility': put['impliedVolatility']
-                    }
-                    List_OptionsAll.append(option_info)
-                    total_puts += 1
-                if date_idx < len(dates_to_fetch) - 1:
-                    print("等待2秒后获取下一个到期日期的数据...")
-                    time.sleep(2)
-            print(f"\n总共获取到 {len(List_OptionsAll)} 个期权合约的数据")
-            print(f"看涨期权: {total_calls} 个")
-            print(f"看跌期权: {total_puts} 个")
+                plan = f"最近的到期日期: {expiration_dates[0]}"
+            tracker.set_total(len(dates_to_fetch))
+            tracker.report('expirations', f"可用的期权到期日期数量: {len(expiration_dates)}\n{plan}\n{SEPARATOR}",
+                           expiration_dates=list(dates_to_fetch))
+            chain_frames, failed_dates = fetch_expiration_chains(
+                provider, symbol, dates_to_fetch, limiter, max_workers=max_workers, max_retries=max_retries, tracker=tracker)
+            fetched_dates = [d for d in dates_to_fetch if d not in failed_dates]
+            if failed_dates:
+                tracker.report('expirations_skipped', f"警告: 以下到期日期多次重试后仍获取失败，已跳过: {failed_dates}",
+                               failed_dates=failed_dates)
+            chain_df = concat_chain_frames(chain_frames, symbol)
+            List_OptionsAll = chain_records(chain_df)
+            total_calls = int((chain_df['type'] == 'Call').sum())
+            total_puts = len(chain_df) - total_calls
+            tracker.report('fetched', f"\n总共获取到 {len(List_OptionsAll)} 个期权合约的数据\n"
+                                      f"看涨期权: {total_calls} 个\n看跌期权: {total_puts} 个")
             if len(List_OptionsAll) < 50:
-                print(f"警告: 获取的期权数量较少({len(List_OptionsAll)})，可能数据不完整")
-                if attempt < max_retries - 1:
-                    print("将进行重试以获取更完整的数据...")
+                retry = attempt < max_retries - 1
+                tracker.report('incomplete', f"警告: 获取的期权数量较少({len(List_OptionsAll)})，可能数据不完整"
+                                             + ("\n将进行重试以获取更完整的数据..." if retry else ""))
+                if retry:
                     continue
             scrape_end_time = datetime.now()
             scrape_duration = scrape_end_time - scrape_start_time
-            json_path = os.path.join(data_dir, f'{symbol}_options_data.json')
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'symbol': symbol,
-                    'company_name': company_name,
-                    'current_price': current_price,
-                    'expiration_dates': dates_to_fetch,
-                    'scrape_start_time': scrape_start_time.isoformat(),
-                    'scrape_end_time': scrape_end_time.isoformat(),
-                    'scrape_duration_seconds': scrape_duration.total_seconds(),
-                    'data_timestamp': scrape_end_time.isoformat(),
-                    'total_options': len(List_OptionsAll),
-                    'calls_count': total_calls,
-                    'puts_count': total_puts,
-                    'options_data': List_OptionsAll
-                }, f, ensure_ascii=False, indent=2)
-            print(f"数据已保存到 {json_path}")
-            print(f"爬取完成时间: {scrape_end_time.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"总耗时: {scrape_duration.total_seconds():.2f} 秒")
-            generate_csv_data(symbol, data_dir)
-            break
+            summary = {
+                'symbol': symbol,
+                'company_name': company_name,
+                'current_price': current_price,
+                'expiration_dates': fetched_dates,
+                'scrape_start_time': scrape_start_time.isoformat(),
+                'scrape_end_time': scrape_end_time.isoformat(),
+                'scrape_duration_seconds': scrape_duration.total_seconds(),
+                'data_timestamp': scrape_end_time.isoformat(),
+                'total_options': len(List_OptionsAll),
+                'calls_count': total_calls,
+                'puts_count': total_puts
+            }
+            if has_columnar_support():
+                snapshot_path = os.path.join(data_dir, f'{symbol}{SNAPSHOT_SUFFIX}')
+                write_snapshot(snapshot_path, chain_df, summary)
+                if keep_history:
+                    entry = get_snapshot_history(data_dir).append(symbol, chain_df, summary)
+                    if entry['base'] is not None:
+                        tracker.report('history', f"历史快照: 相对上一快照 {entry['changed']} 个合约有变化，"
+                                                  f"{entry['removed']} 个合约已删除，只保存变化部分",
+                                       changed=entry['changed'], removed=entry['removed'])
+            else:
+                snapshot_path = os.path.join(data_dir, f'{symbol}{JSON_SUFFIX}')
+                with atomic_open(snapshot_path) as f:
+                    json.dump(dict(summary, options_data=List_OptionsAll), f, ensure_ascii=False, indent=2)
+            record_in_catalog(symbol, snapshot_path, summary, data_dir)
+            generate_csv_data(symbol, data_dir, chain_df)
+            tracker.report('done', f"数据已保存到 {snapshot_path}\n"
+                                   f"爬取完成时间: {scrape_end_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                                   f"总耗时: {scrape_duration.total_seconds():.2f} 秒",
+                           data_timestamp=summary['data_timestamp'])
+            return summary
+        except Exception as e:
+            count('options_fetch_errors_total', symbol=symbol, scope='attempt')
+            if attempt < max_retries - 1:
+                count('options_fetch_retries_total', symbol=symbol, scope='attempt')
+                tracker.report('error', f"第 {attempt + 1} 次尝试失败: {e}\n准备重试...", error=str(e))
+            else:
+                tracker.report('failed', f"第 {attempt + 1} 次尝试失败: {e}\n"
+                                         "所有重试都失败了，未能获取真实数据。请稍后再试或更换网络环境。", error=str(e))
+
+def fetch_expiration_chain(provider, symbol, expiration_date, limiter, max_retries=3, tracker=None):
+    """获取单个到期日的期权链，失败时仅重试该到期日"""
+    tracker = tracker or ScrapeProgress(symbol)
+    for attempt in range(max_retries):
+        try:
+            limiter.acquire()
+            with timed('fetch_expiration', symbol=symbol):
+                calls, puts = provider.option_chain(symbol, expiration_date)
+            frame = build_chain_frame(expiration_date, calls, puts)
+            tracker.expiration_done(0 if frame is None else len(frame))
+            tracker.report('expiration_done', f"{expiration_date} 看涨期权 (Calls) - 共 {len(calls)} 个, "
+                                              f"看跌期权 (Puts) - 共 {len(puts)} 个",
+                           expiration_date=expiration_date)
+            return frame
         except Exception as e:
-            print(f"第 {attempt + 1} 次尝试失败: {e}")
+            count('options_fetch_errors_total', symbol=symbol, scope='expiration')
             if attempt < max_retries - 1:
-                print("准备重试...")
+                count('options_fetch_retries_total', symbol=symbol, scope='expiration')
+                delay = random.uniform(1, 2) * (2 ** attempt)
+                tracker.report('expiration_retry', f"{expiration_date} 第 {attempt + 1} 次获取失败: {e}\n"
+                                                   f"{expiration_date} 等待 {delay:.1f} 秒后重试...",
+                               expiration_date=expiration_date, error=str(e), retry_in=delay)
+                time.sleep(delay)
             else:
-                print("所有重试都失败了，未能获取真实数据。请稍后再试或更换网络环境。")
+                tracker.report('expiration_failed', f"{expiration_date} 第 {attempt + 1} 次获取失败: {e}",
+                               expiration_date=expiration_date, error=str(e))
+    return None
+
+def fetch_expiration_chains(provider, symbol, dates_to_fetch, limiter, max_workers=1, max_retries=3, tracker=None):
+    """按到期日获取期权链（max_workers > 1 时并发），返回(按到期日顺序的合约表列表, 失败的到期日)"""
+    tracker = tracker or ScrapeProgress(symbol)
+    tracker.report('fetching', f"正在获取 {len(dates_to_fetch)} 个到期日期的期权链数据 "
+                               f"(并发数: {max(1, max_workers)})，请稍候...")
+    if max_workers <= 1 or len(dates_to_fetch) <= 1:
+        frames = [fetch_expiration_chain(provider, symbol, d, limiter, max_retries, tracker) for d in dates_to_fetch]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(dates_to_fetch))) as executor:
+            frames = list(executor.map(lambda d: fetch_expiration_chain(provider, symbol, d, limiter, max_retries, tracker),
+                                       dates_to_fetch))
+    failed_dates = [d for d, frame in zip(dates_to_fetch, frames) if frame is None]
+    return [frame for frame in frames if frame is not None], failed_dates
+
+OPTION_COLUMNS = ['type', 'contract_name', 'expiration_date'] + list(CHAIN_COLUMN_MAP.values())
+
+def build_chain_frame(expiration_date, calls, puts):
+    """将单个到期日的calls/puts按整列改名并标记类型/到期日（不逐行遍历）"""
+    frames = []
+    for option_type, raw in (('Call', calls), ('Put', puts)):
+        if raw is None or len(raw) == 0:
+            continue
+        part = raw.reindex(columns=list(CHAIN_COLUMN_MAP)).rename(columns=CHAIN_COLUMN_MAP)
+        part['type'] = option_type
+        part['expiration_date'] = expiration_date
+        frames.append(part)
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+def concat_chain_frames(frames, symbol):
+    """一次性拼接各到期日的合约表，并整列生成合约名称"""
+    frames = [f for f in frames if f is not None and len(f) > 0]
+    if not frames:
+        return pd.DataFrame(columns=OPTION_COLUMNS)
+    df = pd.concat(frames, ignore_index=True)
+    df['contract_name'] = contract_names(df, symbol)
+    return df[OPTION_COLUMNS]
 
-def generate_csv_data(symbol, data_dir):
-    if not List_OptionsAll:
+def chain_records(df):
+    """合约表 -> 合约字典列表（按列tolist后组装，比to_dict('records')快）"""
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[c].tolist() for c in columns))]
+
+CSV_HEADER = "期权类型,合约名称,到期日期,执行价格,最新价格,买价,卖价,成交量,未平仓合约,隐含波动率\n"
+# 每次格式化并写出的CSV行数
+CSV_CHUNK_ROWS = 10_000
+
+def iter_csv_chunks(frames, symbol):
+    """把合约表逐块格式化为CSV文本：先返回表头，之后每 CSV_CHUNK_ROWS 行一块，不在内存中拼接整个文件
+
+    frames 为DataFrame或DataFrame的可迭代对象（如 iter_snapshot_frames 的结果）；
+    没有 contract_name 列时按需生成。
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    yield CSV_HEADER
+    for df in frames:
+        for start in range(0, len(df), CSV_CHUNK_ROWS):
+            chunk = df.iloc[start:start + CSV_CHUNK_ROWS]
+            if 'contract_name' not in chunk.columns:
+                chunk = chunk.assign(contract_name=contract_names(chunk, symbol))
+            yield format_csv_rows(chunk.reindex(columns=OPTION_COLUMNS))
+
+def generate_csv_data(symbol, data_dir, df=None):
+    """把合约表（默认为本次爬取的 List_OptionsAll）分块写入 {symbol}_options_data.csv"""
+    if df is None:
+        df = pd.DataFrame(List_OptionsAll)
+    if len(df) == 0:
         print("没有数据可保存")
         return
-    csv_content = "期权类型,合约名称,到期日期,执行价格,最新价格,买价,卖价,成交量,未平仓合约,隐含波动率\n"
-    for option in List_OptionsAll:
-        csv_content += f"{option['type']},{option['contract_name']},{option['expiration_date']},{option['strike_price']},{option['last_price']},{option['bid']},{option['ask']},{option['volume']},{option['open_interest']},{option['implied_volatility']}\n"
     csv_path = os.path.join(data_dir, f'{symbol}_options_data.csv')
-    with open(csv_path, 'w', encoding='utf-8') as f:
-        f.write(csv_content)
+    with atomic_open(csv_path) as f:
+        for chunk in iter_csv_chunks(df, symbol):
+            f.write(chunk)
     print(f"CSV数据已保存到 {csv_path}")
 
-def load_options_data(symbol="AAPL"):
-    """加载期权数据"""
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
-    json_path = os.path.join(data_dir, f'{symbol}_options_data.json')
+# ================= 批量抓取 =================
+
+def read_symbol_list(source):
+    """解析股票代码列表：逗号/空白分隔的字符串，或每行一个代码的文件（#开头为注释）"""
+    if os.path.isfile(source):
+        with open(source, 'r', encoding='utf-8') as f:
+            text = '\n'.join(line.split('#', 1)[0] for line in f)
+    else:
+        text = source
+    symbols = []
+    for token in text.replace(',', ' ').split():
+        token = token.strip().upper()
+        if token and token not in symbols:
+            symbols.append(token)
+    return symbols
+
+def _init_batch_worker(limiter, provider):
+    """批量抓取子进程初始化：所有子进程共用同一个跨进程限速器"""
+    global _batch_provider
+    set_default_limiter(limiter)
+    _batch_provider = provider
+
+def _batch_fetch_worker(symbol, max_expiration_dates, threads, data_dir):
+    """在子进程中抓取单个代码，返回(代码, 是否成功, 合约数, 耗时秒数, 日志末行)"""
+    start = time.perf_counter()
+    log = io.StringIO()
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with redirect_stdout(log):
+            summary = scrape_options_data(symbol, max_retries=3, multiple_expirations=True,
+                                          max_expiration_dates=max_expiration_dates, max_workers=threads,
+                                          provider=_batch_provider, data_dir=data_dir)
+    except Exception as e:
+        summary = None
+        print(f"{symbol} 抓取异常: {e}", file=log)
+    lines = log.getvalue().strip().splitlines()
+    contracts = summary['total_options'] if summary else 0
+    return symbol, summary is not None, contracts, time.perf_counter() - start, lines[-1] if lines else ''
+
+def fetch_batch(symbols, max_expiration_dates=3, processes=4, threads_per_symbol=2,
+                rate=DEFAULT_RATE_PER_SEC, ticker_factory=None, data_dir=None, provider=None):
+    """用进程池批量抓取多个代码，所有进程共享一个令牌桶限速器，返回每个代码的结果列表
+
+    provider 会被传给每个子进程（未指定时子进程各自按环境变量创建默认数据源）。
+    """
+    if provider is None and ticker_factory is not None:
+        provider = TickerProvider(ticker_factory)
+    ctx = multiprocessing.get_context()
+    limiter = SharedTokenBucket(rate=rate, capacity=max(1, processes), ctx=ctx)
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_init_batch_worker,
+                             initargs=(limiter, provider)) as executor:
+        futures = [executor.submit(_batch_fetch_worker, symbol, max_expiration_dates, threads_per_symbol, data_dir)
+                   for symbol in symbols]
+        for done, future in enumerate(as_completed(futures), 1):
+            symbol, ok, contracts, seconds, last_line = future.result()
+            results.append({'symbol': symbol, 'success': ok, 'contracts': contracts, 'seconds': seconds})
+            status = '成功' if ok else f'失败 ({last_line})'
+            print(f"[{done}/{len(symbols)}] {symbol}: {status}, {contracts} 个合约, {seconds:.2f} 秒")
+    print_batch_summary(results, time.perf_counter() - start)
+    return results
+
+def print_batch_summary(results, elapsed):
+    """打印批量抓取吞吐量汇总"""
+    ok = [r for r in results if r['success']]
+    contracts = sum(r['contracts'] for r in ok)
+    print("----------------------------------------------------------------------------------------------------")
+    print(f"批量抓取完成: 成功 {len(ok)}/{len(results)} 个代码，共 {contracts} 个合约，总耗时 {elapsed:.2f} 秒")
+    if elapsed > 0:
+        print(f"吞吐量: {len(results) / elapsed:.2f} 代码/秒, {contracts / elapsed:.1f} 合约/秒")
+    if results:
+        latencies = np.array([r['seconds'] for r in results])
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"单代码耗时: p50 {p50:.2f}秒, p90 {p90:.2f}秒, p99 {p99:.2f}秒, 最大 {latencies.max():.2f}秒")
+    failed = [r['symbol'] for r in results if not r['success']]
+    if failed:
+        print(f"失败的代码: {', '.join(failed)}")
+
+def snapshot_file_path(symbol, data_dir=None):
+    """返回某代码现有的快照文件路径（优先Parquet，其次旧版JSON），不存在时返回None"""
+    data_dir = data_dir or os.path.join(os.path.dirname(__file__), 'data')
+    for suffix in (SNAPSHOT_SUFFIX, JSON_SUFFIX):
+        path = os.path.join(data_dir, f'{symbol}{suffix}')
+        if os.path.exists(path) and (suffix == JSON_SUFFIX or has_columnar_support()):
+            return path
+    return None
+
+def load_options_data(symbol="AAPL", columns=None, data_dir=None, compact=True):
+    """加载期权数据
+
+    返回元数据字典，合约数据在 'options_data' 中，为紧凑布局的DataFrame（见 utils_store.compact_frame，
+    不含 contract_name）。columns 指定只读取的合约列（如 ['type', 'strike_price', 'expiration_date', 'open_interest']）。
+    compact 为 False 时保持文件中存储的类型并保留 contract_name（导出用）。
+    """
+    path = snapshot_file_path(symbol, data_dir)
+    if path is None:
+        print(f"未找到 {symbol} 的期权数据文件，请先运行期权数据爬虫")
+        return None
+    columnar = path.endswith(SNAPSHOT_SUFFIX)
+    with timed('load_parquet' if columnar else 'load_json', symbol=symbol):
+        try:
+            if columnar:
+                meta, df = read_snapshot(path, columns=columns, compact=compact)
+                meta['options_data'] = df
+                return meta
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取 {path} 失败: {e}")
+            return None
+        if isinstance(data, list):
+            data = {'options_data': data}
+        rows = pd.DataFrame(data.get('options_data', []))
+        rows = rows if columns is None else rows.reindex(columns=columns)
+        data['options_data'] = compact_frame(rows) if compact else rows
         return data
-    except FileNotFoundError:
-        print(f"未找到 {json_path} 文件，请先运行期权数据爬虫")
+
+_histories = {}
+
+def get_snapshot_history(data_dir=None):
+    """返回 data/history 下的历史快照库（需要pyarrow）"""
+    data_dir = data_dir or os.path.join(os.path.dirname(__file__), 'data')
+    root = os.path.join(data_dir, 'history')
+    if root not in _histories:
+        _histories[root] = SnapshotHistory(root)
+    return _histories[root]
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_symbol_catalog(data_dir=None):
+    """返回 data 目录的代码目录索引；索引为空而目录中已有快照时先扫描重建一次"""
+    data_dir = data_dir or os.path.join(os.path.dirname(__file__), 'data')
+    # SQLite连接不能跨进程使用，批量抓取的子进程（fork）各自打开
+    key = (os.getpid(), data_dir)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = SymbolCatalog(data_dir)
+            if len(catalog) == 0:
+                catalog.rebuild()
+    return catalog
+
+def record_in_catalog(symbol, path, summary, data_dir=None):
+    """登记新写入的快照；目录索引出错不影响抓取结果"""
+    try:
+        get_symbol_catalog(data_dir).record(symbol, path, summary)
+    except Exception as e:
+        print(f"更新代码目录失败: {e}")
+
+def load_snapshot_meta(symbol="AAPL", data_dir=None):
+    """只加载快照元数据（current_price、data_timestamp等）"""
+    path = snapshot_file_path(symbol, data_dir)
+    if path is None:
+        return None
+    try:
+        if path.endswith(SNAPSHOT_SUFFIX):
+            return read_snapshot_meta(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {k: v for k, v in data.items() if k != 'options_data'} if isinstance(data, dict) else {}
+    except Exception as e:
+        print(f"读取 {path} 失败: {e}")
         return None
 
 # ================= 数据处理与热力图 =================
 
-def create_heatmap_data(data):
-    """创建热力图数据"""
-    if not data or 'options_data' not in data:
-        print("数据格式错误")
+def _price_or_none(value):
+    """元数据中的价格可能是 'N/A' 或缺失"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
         return None
-    df = pd.DataFrame(data['options_data'])
-    df['direction'] = df['type'].map({'Call': 1, 'Put': -1})
-    df['direction_oi'] = df['direction'] * df['open_interest']
-    df['direction_oi'] = df['direction_oi'].fillna(0)
+    return value if value > 0 else None
+
+def _iv_scale(df):
+    """原始隐含波动率换算成百分比的倍数：数据为小数形式时为100"""
+    if 'implied_volatility' not in df.columns:
+        return None
+    return 100 if df['implied_volatility'].max() <= 1 else 1
+
+def _prepare_rows(df, scale, spot, as_of, backfill_iv):
+    """逐合约预处理（原地修改df）：多空方向、到期日解析、隐含波动率补齐与百分比换算"""
+    if 'type' in df.columns and 'open_interest' in df.columns:
+        calls = (df['type'] == 'Call').to_numpy(dtype=bool)
+        puts = (df['type'] == 'Put').to_numpy(dtype=bool)
+        direction = np.where(calls, 1, np.where(puts, -1, 0)).astype('int8')
+        df['direction'] = direction
+        df['direction_oi'] = (direction * _numeric(df, 'open_interest')).astype('float32')
+    # 到期日只有少数几个取值，去重后再解析和格式化；两列都是按日期排序的类别列
+    codes, uniques = pd.factorize(df['expiration_date'], sort=True)
+    expirations = pd.to_datetime(np.asarray(uniques))
+    df['expiration_date'] = pd.Categorical.from_codes(codes, expirations)
+    df['expiration_display'] = pd.Categorical.from_codes(codes, expirations.strftime('%m-%d'))
     if 'implied_volatility' in df.columns:
-        if df['implied_volatility'].max() <= 1:
-            df['implied_volatility'] = df['implied_volatility'] * 100
-        df['implied_volatility'] = df['implied_volatility'].fillna(0)
+        # 求解使用原始的小数形式波动率，显示时再换算成百分比
+        sigma = pd.to_numeric(df['implied_volatility'], errors='coerce').to_numpy(dtype='float64')
+        if backfill_iv and spot is not None and 'direction' in df.columns:
+            sigma = backfill_implied_volatility(df, spot, sigma, as_of=as_of)
+        df['implied_volatility'] = np.nan_to_num(sigma * scale, nan=0.0).astype('float32')
     else:
-        df['implied_volatility'] = 0
-    df['expiration_date'] = pd.to_datetime(df['expiration_date'])
-    df['expiration_display'] = df['expiration_date'].dt.strftime('%m-%d')
+        df['implied_volatility'] = np.float32(0)
+
+def _add_oi_change(df, previous):
+    """相对上一个快照的未平仓量变化（新出现的合约按从0开始计算）"""
+    positions = align_contracts(previous, df)
+    if positions is None:
+        return
+    previous_oi = _numeric(previous, 'open_interest')
+    current_oi = _numeric(df, 'open_interest')
+    df['oi_change'] = (current_oi - np.where(positions >= 0, previous_oi[positions], 0)).astype('float32')
+
+def _add_greeks(df, scale, spot, as_of):
+    if spot is not None and scale is not None and 'direction' in df.columns:
+        add_greeks(df, spot, df['implied_volatility'].to_numpy(dtype='float64') / scale, as_of=as_of)
+
+def create_heatmap_data(data, backfill_iv=True, previous=None):
+    """创建热力图数据
+
+    快照带有当前股价时，backfill_iv 为 True 会用买卖中间价（或最新成交价）重新求解缺失/接近0的隐含波动率，
+    并为每个合约计算 Greeks 与 gamma/delta 敞口。
+    previous 为同一代码上一个快照（至少含 CONTRACT_KEY_COLUMNS 与 open_interest 列）时按合约键对齐，增加 oi_change 列。
+    结果为紧凑布局（见 utils_store.compact_frame），Greeks 与敞口列为float32。
+    """
+    if not data or 'options_data' not in data:
+        print("数据格式错误")
+        return None
+    with timed('transform', symbol=data.get('symbol', '')):
+        return _create_heatmap_data(data, backfill_iv, previous)
+
+def _create_heatmap_data(data, backfill_iv, previous):
+    symbol = data.get('symbol', '')
+    options_data = data['options_data']
+    df = compact_frame(options_data if isinstance(options_data, pd.DataFrame) else pd.DataFrame(options_data))
+    spot = _price_or_none(data.get('current_price'))
+    as_of = data.get('data_timestamp')
+    scale = _iv_scale(df)
+    _prepare_rows(df, scale, spot, as_of, backfill_iv)
+    if previous is not None and set(CONTRACT_KEY_COLUMNS) <= set(df.columns) and \
+            set(CONTRACT_KEY_COLUMNS + ['open_interest']) <= set(previous.columns):
+        _add_oi_change(df, previous)
+    _add_greeks(df, scale, spot, as_of)
+    with timed('pivot', symbol=symbol):
+        _remember_cube(df, PivotCube.from_frame(df))
     return df
 
+# ================= 透视立方体 =================
+
+# 立方体中的指标: 名称 -> (来源列, 聚合方式)；没有合约的格子 sum/mean 为0，max/min 为NaN
+CUBE_METRICS = {
+    'direction_oi': ('direction_oi', 'sum'),
+    'volume': ('volume', 'sum'),
+    'open_interest': ('open_interest', 'sum'),
+    'iv': ('implied_volatility', 'mean'),
+    'gex': ('gex', 'sum'),
+    'dex': ('dex', 'sum'),
+    'oi_change': ('oi_change', 'sum'),
+    'direction_oi_max': ('direction_oi', 'max'),
+    'direction_oi_min': ('direction_oi', 'min')
+}
+# 网格接口中的指标（立方体指标的子集）
+GRID_METRICS = ('direction_oi', 'volume', 'iv', 'gex', 'dex', 'oi_change')
+
+
+def _numeric(df, column):
+    return pd.to_numeric(df[column], errors='coerce').fillna(0).to_numpy(dtype='float64')
+
+
+class PivotCube:
+    """执行价 × 到期日 × 指标 的稠密透视立方体
+
+    每个快照只对全部合约分组一次；热力图和汇总统计都从这里切片，不再各自 pivot_table/groupby。
+    values[i, j, k] 为执行价 strikes[i]、到期日 expiration_dates[j] 上指标 metrics[k] 的聚合值，
+    counts[i, j] 为该格子的合约数；summary 保存与网格无关的整体统计（合约数、IV分布等）。
+    """
+
+    def __init__(self, strikes, expiration_dates, metrics, values, counts, summary):
+        self.strikes = strikes
+        self.expiration_dates = expiration_dates
+        self.expirations = expiration_dates.strftime('%m-%d')
+        self.metrics = dict(metrics)
+        self._index = {name: k for k, name in enumerate(self.metrics)}
+        self.values = values
+        self.counts = counts
+        self.summary = summary
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    @staticmethod
+    def _summarize(df, n_expirations):
+        if 'type' in df.columns:
+            calls = int((df['type'] == 'Call').sum())
+            puts = int((df['type'] == 'Put').sum())
+        else:
+            calls = puts = 0
+        iv_stats = None
+        if 'implied_volatility' in df.columns and len(df):
+            iv = _numeric(df, 'implied_volatility')
+            iv_stats = {'min': float(iv.min()), 'max': float(iv.max()), 'mean': float(iv.mean()),
+                        'median': float(np.median(iv)), 'sum': float(iv.sum())}
+        return {
+            'total_options': len(df),
+            'call_options': calls,
+            'put_options': puts,
+            'expiration_dates': n_expirations,
+            'iv': iv_stats
+        }
+
+    @staticmethod
+    def _extreme(cells, data, how, size):
+        ufunc = np.maximum if how == 'max' else np.minimum
+        out = np.full(size, -np.inf if how == 'max' else np.inf)
+        ufunc.at(out, cells, data)
+        out[np.isinf(out)] = np.nan
+        return out
+
+    @classmethod
+    def from_frame(cls, df, metrics=CUBE_METRICS):
+        """对 create_heatmap_data 处理后的DataFrame分组一次，构建立方体"""
+        strike_codes, strikes = pd.factorize(df['strike_price'], sort=True)
+        exp_codes, expirations = pd.factorize(df['expiration_date'], sort=True)
+        shape = (len(strikes), len(expirations))
+        size = shape[0] * shape[1]
+        # 执行价或到期日缺失的合约不属于任何格子（与 pivot_table 丢弃这些行一致）
+        valid = (strike_codes >= 0) & (exp_codes >= 0)
+        cells = (strike_codes * shape[1] + exp_codes)[valid]
+        counts = np.bincount(cells, minlength=size)
+        values = np.zeros((size, len(metrics)))
+        for k, (name, (column, how)) in enumerate(metrics.items()):
+            if column not in df.columns:
+                if how in ('max', 'min'):
+                    values[:, k] = np.nan
+                continue
+            data = _numeric(df, column)[valid]
+            if how in ('max', 'min'):
+                values[:, k] = cls._extreme(cells, data, how, size)
+                continue
+            totals = np.bincount(cells, weights=data, minlength=size)
+            if how == 'mean':
+                totals = np.divide(totals, counts, out=np.zeros(size), where=counts > 0)
+            values[:, k] = totals
+        return cls(np.asarray(strikes, dtype='float64'), pd.DatetimeIndex(expirations), metrics,
+                   values.reshape(shape + (len(metrics),)), counts.reshape(shape), cls._summarize(df, shape[1]))
+
+    def matrix(self, metric):
+        """返回某指标的二维数组 [执行价, 到期日]（视图，不要原地修改）"""
+        return self.values[:, :, self._index[metric]]
+
+    def frame(self, metric):
+        """返回某指标的 执行价 × 到期日(MM-DD) DataFrame，行列均升序，相当于原来的 pivot_table"""
+        return pd.DataFrame(
+            self.matrix(metric),
+            index=pd.Index(self.strikes, name='strike_price'),
+            columns=pd.Index(self.expirations, name='expiration_display')
+        )
+
+    def by_expiration(self):
+        """按到期日汇总 方向×未平仓量、成交量、未平仓量之和 与 IV均值，相当于原来的 groupby"""
+        counts = self.counts.sum(axis=0)
+        iv_totals = (self.matrix('iv') * self.counts).sum(axis=0)
+        return pd.DataFrame({
+            'direction_oi': self.matrix('direction_oi').sum(axis=0),
+            'volume': self.matrix('volume').sum(axis=0),
+            'open_interest': self.matrix('open_interest').sum(axis=0),
+            'implied_volatility': np.divide(iv_totals, counts, out=np.zeros(len(counts)), where=counts > 0)
+        }, index=pd.Index(self.expirations, name='expiration_display'))
+
+    def max_preferences(self):
+        """返回 (最大看涨偏好, 最大看跌偏好)，没有对应方向的合约时为NaN"""
+        high = np.nanmax(self.matrix('direction_oi_max'), initial=-np.inf)
+        low = np.nanmin(self.matrix('direction_oi_min'), initial=np.inf)
+        return (float(high) if high > 0 else np.nan, float(-low) if low < 0 else np.nan)
+
+
+_pivot_cubes = {}  # id(df) -> PivotCube，df被回收时自动删除
+_pivot_cubes_lock = threading.Lock()
+
+def get_pivot_cube(df):
+    """返回df的透视立方体，同一个DataFrame对象只构建一次
+
+    立方体按对象缓存而不放进 df.attrs（attrs 会在每次 copy/切片时被深拷贝）。
+    原地修改df后需要调用 invalidate_pivot_cube(df)。
+    """
+    key = id(df)
+    with _pivot_cubes_lock:
+        item = _pivot_cubes.get(key)
+    hit = item is not None and item[0]() is df
+    cache_access('pivot', hit)
+    if hit:
+        return item[1]
+    with timed('pivot'):
+        return _remember_cube(df, PivotCube.from_frame(df))
+
+def _remember_cube(df, cube):
+    key = id(df)
+    with _pivot_cubes_lock:
+        _pivot_cubes[key] = (weakref.ref(df), cube)
+    weakref.finalize(df, _pivot_cubes.pop, key, None)
+    return cube
+
+def invalidate_pivot_cube(df):
+    with _pivot_cubes_lock:
+        _pivot_cubes.pop(id(df), None)
+
+def build_heatmap_grid(df, metrics=GRID_METRICS):
+    """从透视立方体取出网格接口需要的指标
+
+    返回 {'strikes': 升序执行价, 'expiration_dates': 升序到期日(YYYY-MM-DD), 'expirations': 显示用MM-DD,
+    'metrics': {名称: 二维float64数组 [执行价, 到期日]}}；没有合约的格子为0。
+    """
+    cube = get_pivot_cube(df)
+    return {
+        'strikes': cube.strikes,
+        'expiration_dates': list(cube.expiration_dates.strftime('%Y-%m-%d')),
+        'expirations': list(cube.expirations),
+        'metrics': {name: cube.matrix(name) for name in metrics}
+    }
+
 def generate_heatmap(df, symbol="AAPL"):
     """生成热力图（补全所有strike/expiration组合，避免空白）"""
     if df is None or df.empty:
@@ -212,15 +769,10 @@ def generate_heatmap(df, symbol="AAPL"):
     if max_strike - min_strike > 200:
         step = 10
     strike_range = np.arange(min_strike, max_strike + step, step)
-    all_expirations = sorted(df['expiration_display'].unique(), key=lambda x: datetime.strptime(x, '%m-%d'))
-    pivot_data = df.pivot_table(
-        values='direction_oi',
-        index='strike_price',
-        columns='expiration_display',
-        aggfunc='sum',
-        fill_value=0
-    )
-    pivot_data = pivot_data.reindex(index=strike_range, columns=all_expirations, fill_value=0)
+    pivot_data = get_pivot_cube(df).frame('direction_oi')
+    all_expirations = pivot_data.columns
+    pivot_data = pivot_data.reindex(index=strike_range, fill_value=0)
+    plt, sns = import_plotting()
     plt.figure(figsize=(max(10, len(all_expirations)*0.8), max(8, len(strike_range)*0.18)))
     sns.heatmap(
         pivot_data,
@@ -246,16 +798,12 @@ def generate_volatility_heatmap(df, symbol="AAPL"):
     if df is None or df.empty:
         print("没有数据可以生成波动率热力图")
         return
-    if 'implied_volatility' not in df.columns or df['implied_volatility'].sum() == 0:
+    cube = get_pivot_cube(df)
+    if cube.summary['iv'] is None or cube.summary['iv']['sum'] == 0:
         print("没有可用的波动率数据")
         return
-    pivot_iv = df.pivot_table(
-        values='implied_volatility',
-        index='strike_price',
-        columns='expiration_display',
-        aggfunc='mean',
-        fill_value=0
-    ).sort_index()
+    pivot_iv = cube.frame('iv')
+    plt, sns = import_plotting()
     plt.figure(figsize=(12, 8))
     sns.heatmap(
         pivot_iv,
@@ -278,14 +826,10 @@ def generate_enhanced_heatmap(df, symbol="AAPL"):
     if df is None or df.empty:
         print("没有数据可以生成热力图")
         return
+    cube = get_pivot_cube(df)
+    plt, sns = import_plotting()
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(14, 18))
-    pivot_oi = df.pivot_table(
-        values='direction_oi',
-        index='strike_price',
-        columns='expiration_display',
-        aggfunc='sum',
-        fill_value=0
-    ).sort_index()
+    pivot_oi = cube.frame('direction_oi')
     sns.heatmap(
         pivot_oi,
         ax=ax1,
@@ -299,13 +843,7 @@ def generate_enhanced_heatmap(df, symbol="AAPL"):
     ax1.set_title(f'{symbol} 期权方向×未平仓量热力图\n(红色=看涨偏好，蓝色=看跌偏好)', fontsize=14, fontweight='bold')
     ax1.set_xlabel('')
     ax1.set_ylabel('执行价格 ($)', fontsize=12)
-    pivot_volume = df.pivot_table(
-        values='volume',
-        index='strike_price',
-        columns='expiration_display',
-        aggfunc='sum',
-        fill_value=0
-    ).sort_index()
+    pivot_volume = cube.frame('volume')
     sns.heatmap(
         pivot_volume,
         ax=ax2,
@@ -318,14 +856,8 @@ def generate_enhanced_heatmap(df, symbol="AAPL"):
     ax2.set_title(f'{symbol} 期权成交量热力图', fontsize=14, fontweight='bold')
     ax2.set_xlabel('')
     ax2.set_ylabel('执行价格 ($)', fontsize=12)
-    if 'implied_volatility' in df.columns and df['implied_volatility'].sum() > 0:
-        pivot_iv = df.pivot_table(
-            values='implied_volatility',
-            index='strike_price',
-            columns='expiration_display',
-            aggfunc='mean',
-            fill_value=0
-        ).sort_index()
+    if cube.summary['iv'] is not None and cube.summary['iv']['sum'] > 0:
+        pivot_iv = cube.frame('iv')
         sns.heatmap(
             pivot_iv,
             ax=ax3,
@@ -349,30 +881,26 @@ def generate_enhanced_heatmap(df, symbol="AAPL"):
 def print_summary_statistics(df, symbol="AAPL"):
     if df is None or df.empty:
         return
+    cube = get_pivot_cube(df)
+    summary = cube.summary
     print(f"\n=== {symbol} 期权数据汇总 ===")
-    print(f"总期权数量: {len(df)}")
-    print(f"看涨期权数量: {len(df[df['type'] == 'Call'])}")
-    print(f"看跌期权数量: {len(df[df['type'] == 'Put'])}")
-    print(f"到期日期数量: {df['expiration_date'].nunique()}")
-    print(f"执行价格范围: ${df['strike_price'].min():.2f} - ${df['strike_price'].max():.2f}")
+    print(f"总期权数量: {summary['total_options']}")
+    print(f"看涨期权数量: {summary['call_options']}")
+    print(f"看跌期权数量: {summary['put_options']}")
+    print(f"到期日期数量: {summary['expiration_dates']}")
+    print(f"执行价格范围: ${cube.strikes[0]:.2f} - ${cube.strikes[-1]:.2f}")
     print(f"\n按到期日期统计:")
-    date_stats = df.groupby('expiration_display').agg({
-        'direction_oi': 'sum',
-        'volume': 'sum',
-        'open_interest': 'sum',
-        'implied_volatility': 'mean'
-    }).round(2)
-    print(date_stats)
-    max_call_oi = df[df['direction_oi'] > 0]['direction_oi'].max()
-    max_put_oi = abs(df[df['direction_oi'] < 0]['direction_oi'].min())
+    print(cube.by_expiration().round(2))
+    max_call_oi, max_put_oi = cube.max_preferences()
     print(f"\n最大看涨偏好: {max_call_oi:,.0f}")
     print(f"最大看跌偏好: {max_put_oi:,.0f}")
-    if 'implied_volatility' in df.columns and df['implied_volatility'].sum() > 0:
+    iv_stats = summary['iv']
+    if iv_stats is not None and iv_stats['sum'] > 0:
         print(f"\n波动率统计:")
-        print(f"最小IV: {df['implied_volatility'].min():.2f}%")
-        print(f"最大IV: {df['implied_volatility'].max():.2f}%")
-        print(f"平均IV: {df['implied_volatility'].mean():.2f}%")
-        print(f"中位数IV: {df['implied_volatility'].median():.2f}%")
+        print(f"最小IV: {iv_stats['min']:.2f}%")
+        print(f"最大IV: {iv_stats['max']:.2f}%")
+        print(f"平均IV: {iv_stats['mean']:.2f}%")
+        print(f"中位数IV: {iv_stats['median']:.2f}%")
     else:
         print(f"\n波动率数据: 无可用数据")
 
@@ -382,14 +910,79 @@ def main():
     if len(sys.argv) > 1 and sys.argv[1] == 'fetch':
         # 极简抓取模式：python utils_option.py fetch TSLA 3
         if len(sys.argv) < 3:
-            print("用法: python utils_option.py fetch 股票代码 [最多到期日数]")
+            print("用法: python utils_option.py fetch 股票代码 [最多到期日数] [并发数]")
             return
         symbol = sys.argv[2].upper()
         max_exp = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
         # 只抓取数据，不做分析和画图
-        scrape_options_data(symbol, max_expiration_dates=max_exp, multiple_expirations=True)
+        scrape_options_data(symbol, max_expiration_dates=max_exp, multiple_expirations=True, max_workers=workers)
         print(f"已抓取 {symbol} 的期权数据到 data 目录")
         return
+    if len(sys.argv) > 1 and sys.argv[1] == 'fetch-batch':
+        # 批量抓取：python utils_option.py fetch-batch AAPL,TSLA,SPY 3 8
+        #          python utils_option.py fetch-batch symbols.txt 3 8
+        if len(sys.argv) < 3:
+            print("用法: python utils_option.py fetch-batch 代码列表或文件 [最多到期日数] [进程数] [每秒请求数]")
+            return
+        symbols = read_symbol_list(sys.argv[2])
+        max_exp = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+        processes = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+        rate = float(sys.argv[5]) if len(sys.argv) > 5 else DEFAULT_RATE_PER_SEC
+        print(f"批量抓取 {len(symbols)} 个代码，进程数 {processes}，限速 {rate} 次请求/秒")
+        fetch_batch(symbols, max_expiration_dates=max_exp, processes=processes, rate=rate)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        # 定时刷新关注列表：python utils_option.py watch AAPL:120:2,SPY,TSLA:600 [每分钟请求数]
+        #                python utils_option.py watch watchlist.txt 60
+        if len(sys.argv) < 3:
+            print("用法: python utils_option.py watch 关注列表或文件(代码[:间隔秒数[:优先级[:最多到期日数]]]) [每分钟请求数]")
+            return
+        from utils_scheduler import WatchlistScheduler, parse_watchlist, DEFAULT_EXPIRATIONS
+
+        def refresh(symbol, max_expirations, interval):
+            summary = scrape_options_data(symbol, max_retries=1, multiple_expirations=True,
+                                          max_expiration_dates=max_expirations or DEFAULT_EXPIRATIONS,
+                                          max_workers=4, progress=lambda event: None)
+            if summary is None:
+                raise RuntimeError(f"{symbol} 抓取失败")
+            print(f"{datetime.now().strftime('%H:%M:%S')} 已刷新 {symbol}: {summary['total_options']} 个合约")
+
+        entries = parse_watchlist(sys.argv[2])
+        budget = float(sys.argv[3]) if len(sys.argv) > 3 else 60
+        scheduler = WatchlistScheduler(refresh, entries, budget=budget)
+        print(f"定时刷新 {len(entries)} 个代码，预算 {budget:g} 次请求/分钟，Ctrl+C 退出")
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop(wait=False)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'catalog-rebuild':
+        # 扫描data目录重建代码目录索引（手动增删了快照文件后使用）：python utils_option.py catalog-rebuild
+        n = get_symbol_catalog().rebuild()
+        print(f"代码目录已重建: {n} 个代码")
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'history':
+        # 查看历史快照：python utils_option.py history TSLA [开始时间] [结束时间]
+        if len(sys.argv) < 3:
+            print("用法: python utils_option.py history 股票代码 [开始时间] [结束时间]")
+            return
+        symbol = sys.argv[2].upper()
+        start = sys.argv[3] if len(sys.argv) > 3 else None
+        end = sys.argv[4] if len(sys.argv) > 4 else None
+        entries = get_snapshot_history().list(symbol, start, end)
+        for e in entries:
+            print(f"{e['data_timestamp']}  {e['contracts']:>8} 个合约  {e['path']}")
+        print(f"{symbol} 共 {len(entries)} 个历史快照")
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'history-compact':
+        # 执行保留策略并合并历史分区：python utils_option.py history-compact [股票代码]
+        symbol = sys.argv[2].upper() if len(sys.argv) > 2 else None
+        removed, merged = get_snapshot_history().compact(symbol)
+        print(f"已删除 {removed} 个过期快照，合并 {merged} 个按天分区")
+        return
     # 默认分析和画图
     symbol = "AAPL"
     print("正在加载期权数据...")
@@ -0,0 +1,252 @@
+# -*- coding:utf8 -*-
+"""
+行情数据源：抓取流程只通过 MarketDataProvider 的三个方法获取报价、到期日列表和期权链
+
+YFinanceProvider 为默认数据源；ReplayProvider 从磁盘上已保存的快照回放期权链，可注入延迟和失败，
+用于离线、可重复地压测抓取流程和Web服务。环境变量 OPTIONS_DATA_PROVIDER=replay 时默认数据源为回放
+（OPTIONS_REPLAY_DIR、OPTIONS_REPLAY_LATENCY、OPTIONS_REPLAY_JITTER、OPTIONS_REPLAY_ERROR_RATE）。
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import pandas as pd
+
+from utils_store import has_columnar_support, read_snapshot, SNAPSHOT_SUFFIX, JSON_SUFFIX
+
+# yfinance期权链字段 -> 本项目字段；option_chain() 返回的calls/puts使用左侧的字段名
+CHAIN_COLUMN_MAP = {
+    'strike': 'strike_price',
+    'lastPrice': 'last_price',
+    'bid': 'bid',
+    'ask': 'ask',
+    'volume': 'volume',
+    'openInterest': 'open_interest',
+    'impliedVolatility': 'implied_volatility'
+}
+
+
+class MarketDataProvider:
+    """行情数据源接口
+
+    quote(symbol)                    -> {'current_price': 最新价或'N/A', 'company_name': 名称}
+    expirations(symbol)              -> 到期日列表（'YYYY-MM-DD'，升序）
+    option_chain(symbol, expiration) -> (calls, puts) 两个DataFrame，列名见 CHAIN_COLUMN_MAP 的键
+
+    一次抓取按 quote -> expirations -> option_chain 的顺序调用，option_chain 可能被多个线程并发调用。
+    子类的锁、缓存等运行时状态放在 _init_state() 中创建，这样数据源可以传给批量抓取的子进程。
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self._init_state()
+
+    def _init_state(self):
+        pass
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if not k.startswith('_')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def quote(self, symbol):
+        raise NotImplementedError
+
+    def expirations(self, symbol):
+        raise NotImplementedError
+
+    def option_chain(self, symbol, expiration_date):
+        raise NotImplementedError
+
+
+class TickerProvider(MarketDataProvider):
+    """把 yf.Ticker 风格的工厂函数（返回带 info / options / option_chain() 的对象）适配为数据源
+
+    quote() 开始一次新的抓取：为该代码新建Ticker，之后的 expirations / option_chain 复用它
+    （yfinance 按Ticker对象缓存到期日列表，长期运行的服务不能一直复用同一个对象）。
+    """
+
+    name = 'ticker'
+
+    def __init__(self, ticker_factory):
+        self.ticker_factory = ticker_factory
+        super().__init__()
+
+    def _init_state(self):
+        self._tickers = {}
+        self._lock = threading.Lock()
+
+    def _ticker(self, symbol, fresh=False):
+        with self._lock:
+            ticker = None if fresh else self._tickers.get(symbol)
+            if ticker is None:
+                ticker = self._tickers[symbol] = self._factory()(symbol)
+            return ticker
+
+    def _factory(self):
+        return self.ticker_factory
+
+    def quote(self, symbol):
+        info = self._ticker(symbol, fresh=True).info
+        return {'current_price': info.get('regularMarketPrice', 'N/A'),
+                'company_name': info.get('shortName') or info.get('longName') or symbol}
+
+    def expirations(self, symbol):
+        return list(self._ticker(symbol).options or ())
+
+    def option_chain(self, symbol, expiration_date):
+        chain = self._ticker(symbol).option_chain(expiration_date)
+        return chain.calls, chain.puts
+
+
+class YFinanceProvider(TickerProvider):
+    """Yahoo Finance 数据源（第一次抓取时才导入yfinance）"""
+
+    name = 'yfinance'
+
+    def __init__(self):
+        super().__init__(None)
+
+    def _factory(self):
+        import yfinance as yf
+        return yf.Ticker
+
+
+class ReplayProvider(MarketDataProvider):
+    """从 data_dir 中已保存的快照（{symbol}_options_data.parquet / .json）回放期权链
+
+    每次请求先等待 latency 秒加上 [0, jitter) 的随机延迟，再以 error_rate 的概率抛出 ConnectionError，
+    seed 固定时注入的延迟和失败序列可重复。快照文件被重写后自动重新读取；没有快照的代码返回空的到期日列表。
+    """
+
+    name = 'replay'
+
+    def __init__(self, data_dir=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.data_dir = data_dir or os.path.join(os.path.dirname(__file__), 'data')
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        super().__init__()
+        self.requests = 0
+        self.injected_errors = 0
+
+    def _init_state(self):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._chains = {}  # symbol -> (文件mtime, 报价, {到期日: (calls, puts)})
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+            if fail:
+                self.injected_errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise ConnectionError("replay: injected failure")
+
+    def _path(self, symbol):
+        suffixes = (SNAPSHOT_SUFFIX, JSON_SUFFIX) if has_columnar_support() else (JSON_SUFFIX,)
+        for suffix in suffixes:
+            path = os.path.join(self.data_dir, f'{symbol}{suffix}')
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _load(self, symbol):
+        path = self._path(symbol)
+        if path is None:
+            return None
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._chains.get(symbol)
+        if cached is not None and cached[0] == mtime:
+            return cached
+        if path.endswith(SNAPSHOT_SUFFIX):
+            meta, df = read_snapshot(path)
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            meta = {k: v for k, v in data.items() if k != 'options_data'} if isinstance(data, dict) else {}
+            df = pd.DataFrame(data.get('options_data', []) if isinstance(data, dict) else data)
+        quote = {'current_price': meta.get('current_price', 'N/A'), 'company_name': meta.get('company_name', symbol)}
+        cached = (mtime, quote, self._split_chain(df))
+        with self._lock:
+            self._chains[symbol] = cached
+        return cached
+
+    @staticmethod
+    def _split_chain(df):
+        """快照合约表 -> {到期日: (calls, puts)}，字段还原为yfinance的列名和float64"""
+        columns = {v: k for k, v in CHAIN_COLUMN_MAP.items()}
+        chains = {}
+        if len(df) == 0:
+            return chains
+        expirations = pd.to_datetime(df['expiration_date'].astype(str)).dt.strftime('%Y-%m-%d')
+        frame = pd.DataFrame({yf_name: pd.to_numeric(df[name], errors='coerce').astype('float64')
+                              for name, yf_name in columns.items() if name in df.columns})
+        is_call = (df['type'] == 'Call').to_numpy(dtype=bool)
+        for expiration, rows in frame.groupby(expirations.to_numpy(), sort=True).indices.items():
+            calls = is_call[rows]
+            chains[expiration] = (frame.iloc[rows[calls]].reset_index(drop=True),
+                                  frame.iloc[rows[~calls]].reset_index(drop=True))
+        return chains
+
+    def quote(self, symbol):
+        self._request()
+        cached = self._load(symbol)
+        return dict(cached[1]) if cached else {'current_price': 'N/A', 'company_name': symbol}
+
+    def expirations(self, symbol):
+        self._request()
+        cached = self._load(symbol)
+        return list(cached[2]) if cached else []
+
+    def option_chain(self, symbol, expiration_date):
+        self._request()
+        cached = self._load(symbol)
+        if cached is None or expiration_date not in cached[2]:
+            raise KeyError(f"回放数据中没有 {symbol} {expiration_date} 的期权链")
+        calls, puts = cached[2][expiration_date]
+        return calls.copy(), puts.copy()
+
+
+def provider_from_env():
+    """按环境变量 OPTIONS_DATA_PROVIDER（yfinance / replay）创建数据源"""
+    name = os.environ.get('OPTIONS_DATA_PROVIDER', 'yfinance').lower()
+    if name == 'replay':
+        return ReplayProvider(data_dir=os.environ.get('OPTIONS_REPLAY_DIR') or None,
+                              latency=float(os.environ.get('OPTIONS_REPLAY_LATENCY', 0)),
+                              jitter=float(os.environ.get('OPTIONS_REPLAY_JITTER', 0)),
+                              error_rate=float(os.environ.get('OPTIONS_REPLAY_ERROR_RATE', 0)))
+    if name != 'yfinance':
+        raise ValueError(f"未知的数据源: {name}")
+    return YFinanceProvider()
+
+
+_default_provider = None
+_default_lock = threading.Lock()
+
+
+def get_default_provider():
+    """进程内共享的默认数据源（首次使用时按环境变量创建）"""
+    global _default_provider
+    with _default_lock:
+        if _default_provider is None:
+            _default_provider = provider_from_env()
+        return _default_provider
+
+
+def set_default_provider(provider):
+    """替换默认数据源（如在测试或压测中换成 ReplayProvider）"""
+    global _default_provider
+    with _default_lock:
+        _default_provider = provider
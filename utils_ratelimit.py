@@ -0,0 +1,99 @@
+# -*- coding:utf8 -*-
+"""
+数据源请求限速（令牌桶）
+"""
+import multiprocessing
+import threading
+import time
+
+# 默认限速: 每秒2个请求，最多允许5个突发请求
+DEFAULT_RATE_PER_SEC = 2.0
+DEFAULT_BURST = 5
+
+
+class TokenBucket:
+    """线程安全的令牌桶限速器，rate为每秒补充的令牌数，capacity为桶容量（突发上限）"""
+
+    def __init__(self, rate=DEFAULT_RATE_PER_SEC, capacity=DEFAULT_BURST):
+        if rate <= 0:
+            raise ValueError("rate 必须大于0")
+        self.rate = float(rate)
+        self.capacity = float(max(1, capacity))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens):
+        """尝试取出令牌，成功返回0，否则返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def _check(self, tokens):
+        # 超过桶容量的请求永远无法满足，直接报错而不是一直等待
+        if tokens > self.capacity:
+            raise ValueError(f"tokens ({tokens}) 不能大于桶容量 ({self.capacity:g})")
+
+    def try_acquire(self, tokens=1):
+        """非阻塞获取令牌（tokens 不能大于 capacity）"""
+        self._check(tokens)
+        return self._take(tokens) == 0.0
+
+    def acquire(self, tokens=1, timeout=None):
+        """阻塞直到获取令牌；超时返回False（tokens 不能大于 capacity）"""
+        self._check(tokens)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take(tokens)
+            if wait == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """跨进程共享的令牌桶（状态保存在共享内存中），需通过进程池 initializer 传给子进程"""
+
+    def __init__(self, rate=DEFAULT_RATE_PER_SEC, capacity=DEFAULT_BURST, ctx=None):
+        super().__init__(rate, capacity)
+        ctx = ctx or multiprocessing.get_context()
+        self._shared_tokens = ctx.Value('d', self.capacity, lock=False)
+        self._shared_last = ctx.Value('d', time.monotonic(), lock=False)
+        self._lock = ctx.Lock()
+
+    def _take(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            available = min(self.capacity, self._shared_tokens.value + (now - self._shared_last.value) * self.rate)
+            self._shared_last.value = now
+            if available >= tokens:
+                self._shared_tokens.value = available - tokens
+                return 0.0
+            self._shared_tokens.value = available
+            return (tokens - available) / self.rate
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def get_default_limiter():
+    """进程内共享的默认限速器"""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = TokenBucket()
+        return _default_limiter
+
+
+def set_default_limiter(limiter):
+    """替换默认限速器（如批量抓取子进程中换成跨进程共享的限速器）"""
+    global _default_limiter
+    with _default_lock:
+        _default_limiter = limiter
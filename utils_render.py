@@ -0,0 +1,239 @@
+# -*- coding:utf8 -*-
+"""
+快速热力图光栅渲染（Web输出用）
+
+透视矩阵经颜色查找表（256级LUT）直接映射为像素并按目标尺寸最近邻放大，写入画布；matplotlib 只负责坐标轴、
+刻度、标题、色条和时间戳等外框。不经过 pyplot：每个线程复用自己的 Figure（按像素尺寸缓存），
+因此不需要全局渲染锁，也不会重复创建刻度和文字对象。
+
+render_heatmap_seaborn 为原来按 dpi 绘制的seaborn图（经过pyplot，同一进程内用 pyplot_lock 串行）。
+"""
+import io
+import math
+import numbers
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils_metrics import timed
+
+DEFAULT_SIZE = (1200, 800)
+MIN_SIZE = (320, 240)
+MAX_SIZE = (2400, 1600)
+# PNG压缩级别：1 比默认的 6 编码快得多，图片只大约 20%
+PNG_COMPRESS_LEVEL = 1
+# 每个线程最多保留的不同尺寸画布数
+MAX_FIGURES_PER_THREAD = 4
+# 字号、边距按相对 1200×800 的比例缩放
+BASE_WIDTH, BASE_HEIGHT = DEFAULT_SIZE
+
+_luts = {}
+_local = threading.local()
+# pyplot 的全局状态不是线程安全的，同一进程内的seaborn渲染需串行
+pyplot_lock = threading.Lock()
+
+
+def clamp_size(width=None, height=None):
+    """规范化目标像素尺寸：只给宽度时高度按 3:2 推算，并限制在 MIN_SIZE ~ MAX_SIZE 之间"""
+    width = int(width) if width else None
+    height = int(height) if height else None
+    if width is None and height is None:
+        return DEFAULT_SIZE
+    if width is None:
+        width = round(height * 3 / 2)
+    if height is None:
+        height = round(width * 2 / 3)
+    return (min(max(width, MIN_SIZE[0]), MAX_SIZE[0]), min(max(height, MIN_SIZE[1]), MAX_SIZE[1]))
+
+
+def colormap_lut(name):
+    """颜色表 -> (256, 4) uint8 RGBA 查找表"""
+    lut = _luts.get(name)
+    if lut is None:
+        import matplotlib
+        lut = _luts[name] = np.rint(matplotlib.colormaps[name](np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+    return lut
+
+
+def color_limits(matrix, center=None):
+    """颜色范围：与 sns.heatmap 一致，取数据的最小/最大值；指定 center 时取关于 center 对称的范围"""
+    finite = matrix[np.isfinite(matrix)]
+    if finite.size == 0:
+        return 0.0, 1.0
+    vmin, vmax = float(finite.min()), float(finite.max())
+    if center is not None:
+        span = max(vmax - center, center - vmin)
+        vmin, vmax = center - span, center + span
+    if vmin == vmax:
+        vmin, vmax = vmin - 0.5, vmax + 0.5
+    return vmin, vmax
+
+
+def colorize(matrix, lut, vmin, vmax, height, width):
+    """矩阵 -> (height, width, 4) 像素：按LUT着色后最近邻放大，第0行在最上方，NaN 为白色"""
+    missing = ~np.isfinite(matrix)
+    scaled = (np.where(missing, vmin, matrix) - vmin) * (255.0 / (vmax - vmin))
+    # 每个像素的RGBA按一个uint32整体搬运
+    cells = lut.view(np.uint32).ravel()[np.clip(np.rint(scaled), 0, 255).astype(np.uint8)]
+    cells[missing] = np.array([255, 255, 255, 255], dtype=np.uint8).view(np.uint32)[0]
+    rows = np.arange(height) * matrix.shape[0] // height
+    cols = np.arange(width) * matrix.shape[1] // width
+    return cells.take(cols, axis=1).take(rows, axis=0).view(np.uint8).reshape(height, width, 4)
+
+
+class HeatmapRasterizer:
+    """一个固定像素尺寸的可复用画布；同一个对象不能被多个线程同时使用（见 render_heatmap_raster）"""
+
+    def __init__(self, width, height):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.cm import ScalarMappable
+        from matplotlib.colors import Normalize
+        from matplotlib.figure import Figure
+
+        self.width, self.height = width, height
+        self.scale = max(0.5, min(width / BASE_WIDTH, height / BASE_HEIGHT, 1.5))
+        s = self.scale
+        self.font_px = 10 * s * 100 / 72
+        self.figure = Figure(figsize=(width / 100, height / 100), dpi=100)
+        self.canvas = FigureCanvasAgg(self.figure)
+        # 边距（像素）：左侧执行价刻度，下方旋转的日期刻度和时间戳，右侧色条
+        left, right, bottom, top = 100 * s, 150 * s, 125 * s, 90 * s
+        body = [left / width, bottom / height, 1 - (left + right) / width, 1 - (bottom + top) / height]
+        self.ax = self.figure.add_axes(body)
+        self.ax.patch.set_visible(False)
+        colorbar_ax = self.figure.add_axes([body[0] + body[2] + 20 * s / width, body[1], 20 * s / width, body[3]])
+        self.cmap = 'viridis'
+        self.mappable = ScalarMappable(Normalize(0, 1), self.cmap)
+        self.colorbar = self.figure.colorbar(self.mappable, cax=colorbar_ax)
+        self.colorbar.ax.tick_params(labelsize=10 * s)
+        self.title = self.ax.set_title('', fontsize=16 * s, fontweight='bold', pad=20 * s)
+        self.ax.set_xlabel('Expiration Date', fontsize=12 * s)
+        self.ax.set_ylabel('Strike Price ($)', fontsize=12 * s)
+        self.ax.tick_params(labelsize=10 * s)
+        self.ax.tick_params(axis='x', labelrotation=90)
+        self.timestamp = self.ax.text(0.5, -(bottom - 25 * s) / (body[3] * height), '', fontsize=11 * s,
+                                      color='gray', ha='center', va='center', transform=self.ax.transAxes)
+        # 热力图像素在画布绘制完成后直接写入，边框、价格线和图例随后画在它上面
+        for spine in self.ax.spines.values():
+            spine.set_animated(True)
+        self.price_line = self.ax.axhline(0, color='orange', linestyle='--', linewidth=2 * s, animated=True)
+        self.legend = self.ax.legend([self.price_line], [''], loc='upper right', fontsize=10 * s)
+        self.legend.set_animated(True)
+
+    def _set_ticks(self, axis, positions, labels, length_px, spacing):
+        """按可用像素长度抽稀刻度标签"""
+        n = len(labels)
+        step = max(1, math.ceil(n / max(1, length_px / (self.font_px * spacing))))
+        axis.set_ticks(positions[::step], labels[::step])
+
+    def render(self, matrix, strikes, expirations, title, cmap, center, cbar_label, current_price, timestamp_text):
+        """渲染为PNG字节；matrix 为 [执行价, 到期日]，strikes 升序"""
+        from PIL import Image
+
+        n_rows, n_cols = matrix.shape
+        vmin, vmax = color_limits(matrix, center)
+        if cmap != self.cmap:
+            self.cmap = cmap
+            self.mappable.set_cmap(cmap)
+        self.mappable.set_clim(vmin, vmax)
+        self.colorbar.set_label(cbar_label, fontsize=12 * self.scale)
+        self.ax.set_xlim(-0.5, n_cols - 0.5)
+        self.ax.set_ylim(n_rows - 0.5, -0.5)
+        x0, y0, x1, y1 = (round(v) for v in self.ax.bbox.extents)
+        self._set_ticks(self.ax.yaxis, np.arange(n_rows), [f'{s:g}' for s in strikes], y1 - y0, 2.0)
+        self._set_ticks(self.ax.xaxis, np.arange(n_cols), list(expirations), x1 - x0, 2.0)
+        self.title.set_text(title)
+        self.timestamp.set_text(timestamp_text)
+        self.canvas.draw()
+
+        pixels = np.asarray(self.canvas.buffer_rgba())
+        top = self.height - y1
+        pixels[top:top + (y1 - y0), x0:x1] = colorize(matrix, colormap_lut(cmap), vmin, vmax, y1 - y0, x1 - x0)
+        for spine in self.ax.spines.values():
+            self.ax.draw_artist(spine)
+        # 没有报价时快照中的股价为 'N/A'，与seaborn渲染一样不画股价线
+        if isinstance(current_price, numbers.Real) and n_rows > 1 and strikes[0] <= current_price <= strikes[-1]:
+            y = float(np.interp(current_price, strikes, np.arange(n_rows)))
+            self.price_line.set_ydata([y, y])
+            self.ax.draw_artist(self.price_line)
+            self.legend.get_texts()[0].set_text(f'Current Price: {current_price}')
+            self.ax.draw_artist(self.legend)
+
+        buffer = io.BytesIO()
+        image = Image.frombuffer('RGBA', (self.width, self.height), pixels, 'raw', 'RGBA', 0, 1).convert('RGB')
+        image.save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+        return buffer.getvalue()
+
+
+def get_rasterizer(width, height):
+    """当前线程中指定尺寸的画布（每个线程最多缓存 MAX_FIGURES_PER_THREAD 个尺寸）"""
+    figures = getattr(_local, 'figures', None)
+    if figures is None:
+        figures = _local.figures = OrderedDict()
+    rasterizer = figures.get((width, height))
+    if rasterizer is None:
+        rasterizer = figures[(width, height)] = HeatmapRasterizer(width, height)
+        while len(figures) > MAX_FIGURES_PER_THREAD:
+            figures.popitem(last=False)
+    figures.move_to_end((width, height))
+    return rasterizer
+
+
+def render_heatmap_raster(matrix, strikes, expirations, title, cmap, center, cbar_label, current_price,
+                          timestamp_text, size=DEFAULT_SIZE):
+    """按目标像素尺寸 size=(宽, 高) 渲染热力图PNG（线程安全）"""
+    width, height = clamp_size(*size)
+    return get_rasterizer(width, height).render(np.asarray(matrix, dtype=np.float64), np.asarray(strikes, dtype=float),
+                                                expirations, title, cmap, center, cbar_label, current_price,
+                                                timestamp_text)
+
+
+def render_heatmap_seaborn(pivot_data, title, cmap, center, cbar_label, current_price, timestamp_text, dpi,
+                           symbol=''):
+    """用 sns.heatmap 绘制 执行价 × 到期日 DataFrame，按 dpi 保存为PNG字节"""
+    with timed('render_wait', symbol=symbol):
+        pyplot_lock.acquire()
+    try:
+        with timed('draw', symbol=symbol):
+            plt = _draw_seaborn_figure(pivot_data, title, cmap, center, cbar_label, current_price, timestamp_text)
+        with timed('savefig', symbol=symbol):
+            buffer = io.BytesIO()
+            plt.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+            plt.close()
+        return buffer.getvalue()
+    finally:
+        pyplot_lock.release()
+
+
+def _draw_seaborn_figure(pivot_data, title, cmap, center, cbar_label, current_price, timestamp_text):
+    from utils_option import import_plotting
+
+    plt, sns = import_plotting('Agg')
+    plt.figure(figsize=(12, 8))
+    ax = sns.heatmap(
+        pivot_data,
+        annot=False,
+        cmap=cmap,
+        center=center,
+        cbar_kws={'label': cbar_label},
+        linewidths=0,
+        square=False
+    )
+    if current_price is not None:
+        try:
+            strike_prices = pivot_data.index.values
+            if strike_prices[0] <= current_price <= strike_prices[-1]:
+                y_pos = np.interp(current_price, strike_prices, np.arange(len(strike_prices)))
+                ax.axhline(y=y_pos + 0.5, color='orange', linestyle='--', linewidth=2, label=f'Current Price: {current_price}')
+                ax.legend(loc='upper right')
+        except Exception:
+            pass
+    plt.title(title, fontsize=16, fontweight='bold', pad=20)
+    plt.xlabel('Expiration Date', fontsize=12)
+    plt.ylabel('Strike Price ($)', fontsize=12)
+
+    # 添加数据时间戳
+    plt.text(0.5, -0.13, timestamp_text, fontsize=11, color='gray', ha='center', va='center', transform=ax.transAxes)
+    plt.tight_layout()
+    return plt
@@ -0,0 +1,184 @@
+# -*- coding:utf8 -*-
+"""
+渲染进程池：热力图在常驻的子进程中渲染，请求线程只提交矩阵、取回PNG字节
+
+子进程启动时导入 matplotlib / seaborn 并各渲染一张小图（加载字体缓存、颜色表和可复用画布），之后一直复用。
+矩阵以连续的 float64 字节缓冲区加形状传给子进程，不传DataFrame；pyplot 只在子进程中使用，
+渲染吞吐量随进程数增加，不受请求进程的 GIL 和 pyplot 锁限制。
+子进程中 timed() 记录的阶段耗时随结果返回，记入主进程的指标和当次请求的分阶段记录。
+子进程用 forkserver（不支持时用 spawn）方式启动，不 fork 带着Web服务线程和锁的请求进程。
+子进程意外退出时进程池自动重建，当次渲染改在调用线程中完成；渲染超过 OPTIONS_RENDER_TIMEOUT 秒时同样改在调用线程中完成。
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from utils_metrics import registry, count, record_stage, start_profile, stop_profile, timed
+from utils_render import DEFAULT_SIZE, colormap_lut, render_heatmap_raster, render_heatmap_seaborn
+
+# 预热时加载的颜色表（与 app.render_heatmap_png 中各图表类型使用的一致）
+WARM_CMAPS = ('RdBu_r', 'YlOrRd', 'viridis')
+
+registry.describe('options_render_pool_restarts_total', 'counter', '渲染子进程意外退出后重建进程池的次数')
+registry.describe('options_render_pool_timeouts_total', 'counter', '渲染进程池超时、改在请求线程中渲染的次数')
+
+
+def default_timeout():
+    """等待渲染进程池结果的秒数（含排队）：OPTIONS_RENDER_TIMEOUT，默认30秒"""
+    return float(os.environ.get('OPTIONS_RENDER_TIMEOUT', 30))
+
+
+def start_method():
+    """子进程启动方式：forkserver，平台不支持时（如Windows）为 spawn"""
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def default_processes():
+    """默认渲染进程数：OPTIONS_RENDER_WORKERS，未设置时为 CPU 核数（最多4个）；0 表示在请求线程中渲染"""
+    value = os.environ.get('OPTIONS_RENDER_WORKERS')
+    if value is not None:
+        return max(0, int(value))
+    return min(4, os.cpu_count() or 1)
+
+
+def make_render_request(matrix, strikes, expirations, title, cmap, center, cbar_label, current_price,
+                        timestamp_text, size=None, dpi=300, symbol=''):
+    """打包一次渲染：size 为 (宽, 高) 时快速光栅渲染，否则按 dpi 用seaborn绘制"""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+    return {
+        'renderer': 'fast' if size is not None else 'seaborn',
+        'matrix': matrix.tobytes(),
+        'shape': matrix.shape,
+        'strikes': np.ascontiguousarray(strikes, dtype=np.float64).tobytes(),
+        'expirations': [str(e) for e in expirations],
+        'title': title,
+        'cmap': cmap,
+        'center': center,
+        'cbar_label': cbar_label,
+        'current_price': current_price,
+        'timestamp_text': timestamp_text,
+        'size': tuple(size) if size is not None else None,
+        'dpi': dpi,
+        'symbol': symbol
+    }
+
+
+def render_request(request):
+    """在当前进程中执行一次渲染，返回PNG字节"""
+    matrix = np.frombuffer(request['matrix'], dtype=np.float64).reshape(request['shape'])
+    strikes = np.frombuffer(request['strikes'], dtype=np.float64)
+    expirations = request['expirations']
+    symbol = request['symbol']
+    if request['renderer'] == 'fast':
+        with timed('rasterize', symbol=symbol):
+            return render_heatmap_raster(matrix, strikes, expirations, request['title'], request['cmap'],
+                                         request['center'], request['cbar_label'], request['current_price'],
+                                         request['timestamp_text'], request['size'])
+    import pandas as pd
+    pivot_data = pd.DataFrame(matrix, index=pd.Index(strikes, name='strike_price'),
+                              columns=pd.Index(expirations, name='expiration_display'))
+    return render_heatmap_seaborn(pivot_data, request['title'], request['cmap'], request['center'],
+                                  request['cbar_label'], request['current_price'], request['timestamp_text'],
+                                  request['dpi'], symbol)
+
+
+def _init_render_worker(sizes):
+    """子进程初始化：导入绘图库，按常用尺寸和两种渲染方式各渲染一张小图"""
+    for cmap in WARM_CMAPS:
+        colormap_lut(cmap)
+    matrix = np.array([[1.0, -1.0], [0.5, np.nan]])
+    for size in tuple(sizes) + (None,):
+        render_request(make_render_request(matrix, [1.0, 2.0], ['01-01', '01-02'], 'Warm-up', 'RdBu_r', 0, '',
+                                           1.5, '', size=size, dpi=50))
+
+
+def _worker_pid():
+    return os.getpid()
+
+
+def _render_in_worker(request):
+    """子进程中渲染，返回 (PNG字节, 分阶段记录)"""
+    stages, token = start_profile()
+    try:
+        png = render_request(request)
+    finally:
+        stop_profile(token)
+    return png, stages
+
+
+class RenderPool:
+    """常驻渲染进程池
+
+    processes=0 时不创建子进程，在调用线程中渲染（seaborn 渲染仍由进程内的 pyplot 锁串行）。
+    子进程第一次提交渲染时才启动；Web服务在开始处理请求前调用 start()，在单线程时创建子进程并等待预热完成。
+    """
+
+    def __init__(self, processes=None, warm_sizes=(DEFAULT_SIZE,), timeout=None):
+        self.processes = default_processes() if processes is None else processes
+        self.warm_sizes = tuple(warm_sizes)
+        self.timeout = default_timeout() if timeout is None else timeout
+        self.restarts = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.processes > 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context(start_method()),
+                                                     initializer=_init_render_worker, initargs=(self.warm_sizes,))
+            return self._executor
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+        count('options_render_pool_restarts_total')
+
+    def start(self):
+        """启动全部子进程并等待预热完成，返回子进程pid列表"""
+        if not self.enabled:
+            return []
+        executor = self._get_executor()
+        futures = [executor.submit(_worker_pid) for _ in range(self.processes)]
+        return sorted({future.result() for future in futures})
+
+    def render(self, request):
+        """渲染一个 make_render_request() 打包的请求，返回PNG字节"""
+        if not self.enabled:
+            return render_request(request)
+        executor = self._get_executor()
+        try:
+            # 包含排队、传输和子进程中的渲染
+            with timed('render_pool', symbol=request['symbol']):
+                future = executor.submit(_render_in_worker, request)
+                png, stages = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            print(f"渲染进程池 {self.timeout:g} 秒内没有返回结果，改在请求线程中渲染")
+            count('options_render_pool_timeouts_total')
+            return render_request(request)
+        except BrokenProcessPool:
+            print("渲染子进程意外退出，重建渲染进程池")
+            self._discard(executor)
+            return render_request(request)
+        for stage in stages:
+            stage = dict(stage)
+            record_stage(stage.pop('stage'), stage.pop('ms') / 1e3, **stage)
+        return png
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
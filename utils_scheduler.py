@@ -0,0 +1,315 @@
+# -*- coding:utf8 -*-
+"""
+关注列表定时刷新：后台线程按每个代码自己的间隔重新抓取，保持一组代码的数据始终是新的
+
+    scheduler = WatchlistScheduler(refresh, parse_watchlist('AAPL:120:2, SPY, TSLA:600'), budget=60)
+    scheduler.start()
+
+refresh(symbol, max_expirations, interval) 完成一次抓取并发布结果，失败时抛出异常。
+到期的代码按 优先级 × 过期程度 排序，近期被请求得越多越靠前；每次刷新按预计的数据源请求数
+（报价 + 到期日列表 + 每个到期日一条期权链）从全局预算（令牌桶，每分钟请求数）中扣除，预算不足时等待下一轮；
+失败的代码按指数退避推迟下一次刷新，成功后恢复正常间隔。
+指定 lock_path 时，多个进程（如多个WSGI worker）中只有持有该文件锁的一个进程执行刷新，
+其他进程的调度线程等待，持有锁的进程退出后由其中一个接替。
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from utils_metrics import registry, count
+from utils_ratelimit import TokenBucket
+
+DEFAULT_INTERVAL = 300
+# 未指定到期日数时，抓取流程默认获取的到期日数（见 app.scrape_and_load_options_data）
+DEFAULT_EXPIRATIONS = 4
+# 失败后的退避：第n次连续失败后等待 min(MAX_BACKOFF, MIN_BACKOFF × 2^(n-1)) 秒
+MIN_BACKOFF = 30
+MAX_BACKOFF = 1800
+# 请求热度的半衰期（秒）
+DEMAND_HALF_LIFE = 600
+# 调度线程最长的检查间隔（秒）
+TICK_SECONDS = 5
+
+registry.describe('options_watchlist_refreshes_total', 'counter', '关注列表的刷新次数（result: success / failure）')
+registry.describe('options_watchlist_budget_waits_total', 'counter', '因请求预算不足而推迟刷新的次数')
+
+
+def try_lock_file(path):
+    """以非阻塞方式获取跨进程的排他文件锁，返回需保持打开的文件对象（关闭或进程退出时释放）；
+    锁已被其他进程持有时返回None"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    f = open(path, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    # 记录持有锁的进程，便于排查
+    f.seek(0)
+    f.truncate()
+    f.write(f'{os.getpid()}\n')
+    f.flush()
+    return f
+
+
+def parse_watchlist(source, default_interval=DEFAULT_INTERVAL):
+    """解析关注列表：逗号/空白分隔的 代码[:间隔秒数[:优先级[:最多到期日数]]]，或每行若干项的文件（#开头为注释）"""
+    from utils_option import read_symbol_list
+
+    entries = []
+    for token in read_symbol_list(source):
+        parts = token.split(':')
+        interval = float(parts[1]) if len(parts) > 1 and parts[1] else default_interval
+        priority = float(parts[2]) if len(parts) > 2 and parts[2] else 1.0
+        max_expirations = int(parts[3]) if len(parts) > 3 and parts[3] else None
+        entries.append(WatchEntry(parts[0], interval, priority, max_expirations))
+    return entries
+
+
+class WatchEntry:
+    """关注列表中的一个代码及其刷新状态（时间为 time.monotonic()，last_success_at 为 time.time()）"""
+
+    def __init__(self, symbol, interval=DEFAULT_INTERVAL, priority=1.0, max_expirations=None):
+        if interval <= 0 or priority <= 0:
+            raise ValueError("interval 和 priority 必须大于0")
+        self.symbol = symbol.upper()
+        self.interval = float(interval)
+        self.priority = float(priority)
+        self.max_expirations = max_expirations
+        self.next_due = 0.0
+        self.last_success = None
+        self.last_success_at = None
+        self.last_error = None
+        self.failures = 0
+        self.refreshes = 0
+        self.running = False
+        self.demand = 0.0
+        self.demand_at = 0.0
+
+    @property
+    def cost(self):
+        """一次刷新预计的数据源请求数"""
+        return 2 + (self.max_expirations or DEFAULT_EXPIRATIONS)
+
+    def current_demand(self, now):
+        return self.demand * 0.5 ** ((now - self.demand_at) / DEMAND_HALF_LIFE)
+
+    def score(self, now):
+        """到期代码的排序分数：优先级 × 过期程度（距上次成功的时间 / 间隔，从未成功时视为很旧）× 请求热度加成"""
+        staleness = 10.0 if self.last_success is None else (now - self.last_success) / self.interval
+        return self.priority * staleness * (1 + math.log1p(self.current_demand(now)))
+
+    def to_dict(self, now):
+        return {
+            'symbol': self.symbol,
+            'interval': self.interval,
+            'priority': self.priority,
+            'max_expirations': self.max_expirations,
+            'running': self.running,
+            'last_success_at': self.last_success_at,
+            'age_seconds': None if self.last_success is None else round(now - self.last_success, 1),
+            'next_refresh_in': round(max(0.0, self.next_due - now), 1),
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'refreshes': self.refreshes,
+            'demand': round(self.current_demand(now), 2)
+        }
+
+
+class WatchlistScheduler:
+    """关注列表刷新调度器
+
+    refresh 为刷新回调，见模块说明；budget 为全局预算（每分钟数据源请求数），max_workers 为同时刷新的代码数。
+    lock_path 为跨进程文件锁的路径，指定时只在持有锁期间刷新（active 为 True），预算也就只由这一个进程使用。
+    add / remove 可在运行中修改关注列表；touch(symbol) 记录一次用户请求，提高该代码的排序。
+    """
+
+    def __init__(self, refresh, entries=(), budget=60, max_workers=1, min_backoff=MIN_BACKOFF,
+                 max_backoff=MAX_BACKOFF, lock_path=None):
+        self.refresh = refresh
+        self.budget = TokenBucket(rate=budget / 60.0, capacity=budget)
+        self.max_workers = max_workers
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._executor = None
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        """加入或替换一个代码（替换时保留刷新状态），下一轮即刷新新加入的代码"""
+        with self._lock:
+            old = self._entries.get(entry.symbol)
+            if old is not None:
+                old.interval, old.priority, old.max_expirations = entry.interval, entry.priority, entry.max_expirations
+            else:
+                self._entries[entry.symbol] = entry
+        self._wake.set()
+
+    def remove(self, symbol):
+        with self._lock:
+            return self._entries.pop(symbol.upper(), None) is not None
+
+    def __contains__(self, symbol):
+        with self._lock:
+            return symbol in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def touch(self, symbol):
+        """记录一次用户请求（不在关注列表中的代码忽略）"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None:
+                entry.demand = entry.current_demand(now) + 1
+                entry.demand_at = now
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e.symbol)
+            return [e.to_dict(now) for e in entries]
+
+    def run_pending(self, now=None):
+        """提交到期的刷新（按分数从高到低，受并发数和预算限制），返回本轮提交的代码列表"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            running = sum(e.running for e in self._entries.values())
+            due = [e for e in self._entries.values() if not e.running and e.next_due <= now]
+            due.sort(key=lambda e: e.score(now), reverse=True)
+            started = []
+            for entry in due[:max(0, self.max_workers - running)]:
+                # 单次刷新的请求数超过整个预算时按预算上限扣除，否则永远无法刷新
+                if not self.budget.try_acquire(min(entry.cost, self.budget.capacity)):
+                    count('options_watchlist_budget_waits_total')
+                    break
+                entry.running = True
+                started.append(entry)
+        for entry in started:
+            self._submit(entry)
+        return [e.symbol for e in started]
+
+    def _submit(self, entry):
+        if self._executor is None:
+            self._run_refresh(entry)
+        else:
+            self._executor.submit(self._run_refresh, entry)
+
+    def _run_refresh(self, entry):
+        error = None
+        try:
+            self.refresh(entry.symbol, entry.max_expirations, entry.interval)
+        except Exception as e:
+            error = e
+        now = time.monotonic()
+        with self._lock:
+            entry.running = False
+            entry.refreshes += 1
+            if error is None:
+                entry.failures = 0
+                entry.last_error = None
+                entry.last_success = now
+                entry.last_success_at = time.time()
+                entry.next_due = now + entry.interval
+            else:
+                entry.failures += 1
+                entry.last_error = str(error)
+                entry.next_due = now + min(self.max_backoff, self.min_backoff * 2 ** (entry.failures - 1))
+        if error is None:
+            count('options_watchlist_refreshes_total', result='success')
+        else:
+            count('options_watchlist_refreshes_total', result='failure')
+            print(f"关注列表刷新 {entry.symbol} 失败（连续 {entry.failures} 次）: {error}")
+        self._wake.set()
+
+    def _next_wait(self):
+        now = time.monotonic()
+        with self._lock:
+            waiting = [e.next_due - now for e in self._entries.values() if not e.running]
+        return min([TICK_SECONDS] + [max(0.0, w) for w in waiting]) or 0.5
+
+    def _wait_for_lock(self):
+        """等待获得跨进程文件锁，返回是否获得（停止时返回False）"""
+        waiting = False
+        while not self._stopped.is_set():
+            self._lock_file = try_lock_file(self.lock_path)
+            if self._lock_file is not None:
+                if waiting:
+                    print(f"关注列表定时刷新由本进程接替 (pid {os.getpid()})")
+                return True
+            if not waiting:
+                print(f"关注列表由其他进程刷新，本进程 (pid {os.getpid()}) 待命")
+                waiting = True
+            self._stopped.wait(TICK_SECONDS)
+        return False
+
+    def _loop(self):
+        if self.lock_path is not None and not self._wait_for_lock():
+            return
+        while not self._stopped.is_set():
+            self.run_pending()
+            self._wake.wait(self._next_wait())
+            self._wake.clear()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    @property
+    def active(self):
+        """本进程是否正在执行刷新（指定 lock_path 时需持有文件锁）"""
+        return self.running and (self.lock_path is None or self._lock_file is not None)
+
+    def start(self):
+        """启动后台调度线程（已启动时不重复启动）"""
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='watchlist')
+        self._thread = threading.Thread(target=self._loop, name='watchlist-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def collect_metrics(self):
+        """/metrics 的 collector：每个代码距上次成功刷新的秒数和连续失败次数"""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._entries.values())
+        return [
+            ('options_watchlist_age_seconds', 'gauge', '关注列表中各代码距上次成功刷新的秒数',
+             [({'symbol': e.symbol}, now - e.last_success) for e in entries if e.last_success is not None]),
+            ('options_watchlist_failures', 'gauge', '关注列表中各代码的连续失败次数',
+             [({'symbol': e.symbol}, e.failures) for e in entries]),
+        ]
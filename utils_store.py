@@ -0,0 +1,971 @@
+# -*- coding:utf8 -*-
+"""
+期权快照存储：列式Parquet文件（带类型的列 + 元数据头），兼容读取旧版JSON
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装pyarrow时退回JSON存储
+    pa = None
+    pc = None
+    pq = None
+
+SNAPSHOT_SUFFIX = '_options_data.parquet'
+JSON_SUFFIX = '_options_data.json'
+# Parquet schema元数据中保存快照头信息（symbol、current_price、data_timestamp等）的键
+META_KEY = b'options_meta'
+# 增量快照头中保存基准快照时间戳和已删除合约（合约键）的键
+DELTA_KEY = b'options_delta'
+# 比较快照时逐合约检查的原始字段
+DELTA_COLUMNS = ['strike_price', 'last_price', 'bid', 'ask', 'volume', 'open_interest', 'implied_volatility']
+# 唯一确定一个合约的列（contract_name 可由它们和代码生成）
+CONTRACT_KEY_COLUMNS = ['type', 'expiration_date', 'strike_price']
+
+# 内存中的紧凑列类型：类别列字典编码（每行1字节），价格/波动率为float32，数量为可空Int32；
+# 执行价是合约键和透视表的坐标，保持float64以免 152.3 之类的价位出现舍入
+OPTION_TYPES = ['Call', 'Put']
+CATEGORY_COLUMNS = ('type', 'expiration_date', 'expiration_display')
+FLOAT32_COLUMNS = ('last_price', 'bid', 'ask', 'implied_volatility')
+COUNT_COLUMNS = ('volume', 'open_interest')
+
+# 快照文件每个row group的行数：导出时可按row group统计信息跳过不需要的到期日/执行价
+SNAPSHOT_ROW_GROUP_ROWS = 50_000
+# 导出时每批读取/写出的行数
+EXPORT_BATCH_ROWS = 10_000
+
+
+def has_columnar_support():
+    """是否可以读写Parquet快照"""
+    return pq is not None
+
+
+def snapshot_schema():
+    """期权快照的列类型"""
+    return pa.schema([
+        ('type', pa.string()),
+        ('contract_name', pa.string()),
+        ('expiration_date', pa.date32()),
+        ('strike_price', pa.float64()),
+        ('last_price', pa.float64()),
+        ('bid', pa.float64()),
+        ('ask', pa.float64()),
+        ('volume', pa.float64()),
+        ('open_interest', pa.float64()),
+        ('implied_volatility', pa.float64()),
+    ])
+
+
+@contextmanager
+def atomic_open(path, mode='w', encoding='utf-8'):
+    """先写同目录下的临时文件，成功后再原子替换目标文件，避免读到写了一半的数据"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else encoding) as f:
+            yield f
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _to_table(df, meta, delta=None):
+    schema = snapshot_schema()
+    frame = df.reindex(columns=schema.names).copy()
+    if 'contract_name' not in df.columns and set(CONTRACT_KEY_COLUMNS) <= set(df.columns):
+        frame['contract_name'] = contract_names(df, meta.get('symbol', ''))
+    frame['expiration_date'] = pd.to_datetime(frame['expiration_date']).dt.date
+    for name in schema.names[3:]:
+        frame[name] = pd.to_numeric(frame[name], errors='coerce')
+    table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+    metadata = {META_KEY: json.dumps(meta, ensure_ascii=False).encode('utf-8')}
+    if delta is not None:
+        metadata[DELTA_KEY] = json.dumps(delta, ensure_ascii=False).encode('utf-8')
+    return table.replace_schema_metadata(metadata)
+
+
+def write_snapshot(path, df, meta, delta=None):
+    """把合约表和元数据头原子写入Parquet快照；delta 为增量快照的 {'base', 'removed'}"""
+    table = _to_table(df, meta, delta)
+    with atomic_open(path, 'wb') as f:
+        pq.write_table(table, f, compression='zstd', row_group_size=SNAPSHOT_ROW_GROUP_ROWS)
+
+
+def read_snapshot_meta(path):
+    """只读取快照元数据头（不读取合约数据）"""
+    metadata = pq.read_schema(path).metadata or {}
+    raw = metadata.get(META_KEY)
+    return json.loads(raw.decode('utf-8')) if raw else {}
+
+
+def frame_columns():
+    """默认读取的快照列：除 contract_name 外的全部列（合约名称需要时用 contract_names() 生成）"""
+    return [name for name in snapshot_schema().names if name != 'contract_name']
+
+
+def read_snapshot(path, columns=None, compact=True):
+    """读取快照，返回(元数据, 紧凑布局的DataFrame)；columns 为 None 时读取 frame_columns()
+
+    compact 为 False 时读取全部列（含 contract_name）并保持存储的类型（float64，到期日为 datetime.date）。
+    """
+    if columns is None and compact:
+        columns = frame_columns()
+    table = pq.read_table(path, columns=columns)
+    meta = json.loads((table.schema.metadata or {}).get(META_KEY, b'{}').decode('utf-8'))
+    return meta, _table_to_frame(table) if compact else table.to_pandas(ignore_metadata=True)
+
+
+_COUNT_DTYPES = {pa.int32(): pd.Int32Dtype()} if pa is not None else {}
+
+def _table_to_frame(table):
+    """Arrow表直接转换为紧凑布局：先在Arrow中转换数值类型和字典编码，不经过float64/字符串的中间DataFrame"""
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name in FLOAT32_COLUMNS:
+            column = column.cast(pa.float32())
+        elif name in COUNT_COLUMNS:
+            column = column.cast(pa.int32(), safe=False)
+        elif name == 'type':
+            column = column.dictionary_encode()
+        columns.append(column)
+    table = pa.Table.from_arrays(columns, names=table.column_names)
+    df = table.to_pandas(date_as_object=False, ignore_metadata=True, types_mapper=_COUNT_DTYPES.get)
+    if 'type' in df.columns:
+        df['type'] = _as_category(df['type'], OPTION_TYPES)
+    if 'expiration_date' in df.columns:
+        # 到期日只有少数几个取值，先去重再格式化，按日期排序的类别
+        codes, uniques = pd.factorize(df['expiration_date'], sort=True)
+        df['expiration_date'] = pd.Categorical.from_codes(codes, uniques.strftime('%Y-%m-%d'))
+    return df
+
+
+# ================= 流式导出 =================
+
+def _row_group_overlaps(row_group, dates, min_strike, max_strike):
+    """按row group的列统计信息判断其中是否可能有符合条件的合约（没有统计信息时保守地返回True）"""
+    for i in range(row_group.num_columns):
+        column = row_group.column(i)
+        stats = column.statistics
+        if stats is None or not stats.has_min_max:
+            continue
+        if column.path_in_schema == 'expiration_date' and dates is not None:
+            if not any(stats.min <= d <= stats.max for d in dates):
+                return False
+        elif column.path_in_schema == 'strike_price':
+            if (min_strike is not None and stats.max < min_strike) or \
+                    (max_strike is not None and stats.min > max_strike):
+                return False
+    return True
+
+
+def iter_snapshot_batches(path, expirations=None, min_strike=None, max_strike=None, batch_size=EXPORT_BATCH_ROWS):
+    """按批读取快照中符合条件的合约，逐批返回 pyarrow.RecordBatch，不把整份快照读入内存
+
+    expirations 为到期日（'YYYY-MM-DD'）列表，min_strike / max_strike 为执行价闭区间，None 表示不过滤；
+    统计信息表明不含符合条件合约的row group整块跳过。
+    """
+    dates = None if expirations is None else [pd.Timestamp(d).date() for d in expirations]
+    parquet = pq.ParquetFile(path)
+    groups = [i for i in range(parquet.num_row_groups)
+              if _row_group_overlaps(parquet.metadata.row_group(i), dates, min_strike, max_strike)]
+    if not groups:
+        return
+    for batch in parquet.iter_batches(batch_size=batch_size, row_groups=groups):
+        masks = []
+        if dates is not None:
+            masks.append(pc.is_in(batch.column('expiration_date'), value_set=pa.array(dates, pa.date32())))
+        if min_strike is not None:
+            masks.append(pc.greater_equal(batch.column('strike_price'), min_strike))
+        if max_strike is not None:
+            masks.append(pc.less_equal(batch.column('strike_price'), max_strike))
+        if masks:
+            mask = masks[0]
+            for other in masks[1:]:
+                mask = pc.and_(mask, other)
+            batch = batch.filter(mask)
+        if batch.num_rows:
+            yield batch
+
+
+def iter_snapshot_frames(path, expirations=None, min_strike=None, max_strike=None, batch_size=EXPORT_BATCH_ROWS,
+                         compact=True):
+    """同 iter_snapshot_batches，逐批返回DataFrame（含 contract_name 列）
+
+    compact 为 True 时为紧凑布局；为 False 时保持快照中存储的类型（float64，到期日为 datetime.date），导出用。
+    """
+    for batch in iter_snapshot_batches(path, expirations, min_strike, max_strike, batch_size):
+        table = pa.Table.from_batches([batch])
+        yield _table_to_frame(table) if compact else table.to_pandas(ignore_metadata=True)
+
+
+def format_csv_rows(df):
+    """把合约表格式化为不带表头的CSV文本（按df的列顺序）
+
+    格式与原来逐行 f-string 拼接的一致：各列按列 tolist() 后用 str() 转换，浮点数即 repr（50.0、
+    0.30000000000000004），缺失值为 nan（比 to_csv 快一倍多）。可空整数列按float64写出（与快照中存储的一致）；
+    float32 列会写出float32的近似值，导出时应传入float64的合约表。
+    """
+    columns = []
+    for name in df.columns:
+        values = df[name]
+        if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) and values.dtype.kind in 'iu':
+            values = values.to_numpy(dtype='float64', na_value=np.nan)
+        columns.append(map(str, values.tolist()))
+    return ''.join(line + '\n' for line in map(','.join, zip(*columns)))
+
+
+def filter_chain(df, expirations=None, min_strike=None, max_strike=None):
+    """按到期日和执行价区间过滤内存中的合约表（条件同 iter_snapshot_batches）"""
+    mask = np.ones(len(df), dtype=bool)
+    if expirations is not None:
+        days, _, _ = _expiration_days(df['expiration_date'])
+        wanted = pd.to_datetime(list(expirations)).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        mask &= np.isin(days, wanted)
+    strikes = pd.to_numeric(df['strike_price'], errors='coerce').to_numpy(dtype='float64')
+    if min_strike is not None:
+        mask &= strikes >= min_strike
+    if max_strike is not None:
+        mask &= strikes <= max_strike
+    return df if mask.all() else df[mask]
+
+
+class _ChunkSink:
+    """ParquetWriter 的输出目标：暂存写入的字节，由生成器逐块取走"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_parquet_bytes(batches, meta):
+    """把 RecordBatch 逐批写成一个Parquet文件（每批一个row group），边写边返回字节块"""
+    schema = snapshot_schema().with_metadata({META_KEY: json.dumps(meta, ensure_ascii=False).encode('utf-8')})
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd') as writer:
+        for batch in batches:
+            writer.write_batch(batch.cast(schema.remove_metadata()))
+            data = sink.take()
+            if data:
+                yield data
+    yield sink.take()
+
+
+# ================= 紧凑布局 =================
+
+def _as_category(values, categories=None):
+    """转换为类别列；不指定 categories 时按取值排序（日期字符串即时间顺序）"""
+    if categories is not None:
+        if isinstance(values.dtype, pd.CategoricalDtype) and list(values.cat.categories) == categories:
+            return values
+        return values.astype(pd.CategoricalDtype(categories))
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    codes, uniques = pd.factorize(values, sort=True)
+    return pd.Series(pd.Categorical.from_codes(codes, uniques), index=values.index, name=values.name)
+
+
+def _as_count(values):
+    """可空Int32：直接由数值和缺失掩码构建（按字符串解析dtype的 astype('Int32') 要慢一个数量级）"""
+    if isinstance(values.dtype, pd.Int32Dtype):
+        return values
+    data = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    mask = np.isnan(data)
+    return pd.arrays.IntegerArray(np.rint(np.where(mask, 0, data)).astype(np.int32), mask)
+
+
+def compact_frame(df):
+    """返回紧凑内存布局的合约表（不修改df）
+
+    type / 到期日为类别列，价格和隐含波动率为float32，成交量和未平仓量为可空Int32（缺失值用掩码表示），
+    不保存 contract_name；已是紧凑类型的列不会重新转换。
+    """
+    columns = {}
+    for name in df.columns:
+        if name == 'contract_name':
+            continue
+        values = df[name]
+        if name == 'type':
+            values = _as_category(values, OPTION_TYPES)
+        elif name in CATEGORY_COLUMNS:
+            values = _as_category(values)
+        elif name in FLOAT32_COLUMNS:
+            values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
+        elif name in COUNT_COLUMNS:
+            values = _as_count(values)
+        columns[name] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def concat_compact(frames):
+    """拼接紧凑布局的合约表：类别列先统一为相同（排序后的）类别，结果仍为类别列"""
+    frames = list(frames)
+    for name in CATEGORY_COLUMNS:
+        dtypes = [f[name].dtype for f in frames if name in f.columns]
+        if len(dtypes) != len(frames) or not all(isinstance(d, pd.CategoricalDtype) for d in dtypes):
+            continue
+        categories = dtypes[0].categories
+        for d in dtypes[1:]:
+            if not d.categories.isin(categories).all():
+                categories = categories.union(d.categories)
+        # 只重新编码类别不同的表（通常只是新增的少量行）
+        frames = [f if d.categories.equals(categories) else f.assign(**{name: f[name].cat.set_categories(categories)})
+                  for f, d in zip(frames, dtypes)]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _expiration_days(values):
+    """到期日（字符串、datetime或类别列）-> 距1970-01-01的天数"""
+    codes, uniques = pd.factorize(values)
+    days = pd.to_datetime(np.asarray(uniques)).to_numpy(dtype='datetime64[D]').astype(np.int64)
+    return np.append(days, -1)[codes], codes, uniques
+
+
+# 执行价或到期日缺失的合约的键：不与任何合约对齐（比较快照时总是视为新增/删除）
+MISSING_CONTRACT_KEY = -1
+
+
+def contract_keys(df):
+    """每个合约的int64键：到期日天数、看跌标志与执行价×1000 按位组合，与合约名称一一对应
+
+    比较快照时代替字符串 contract_name，整数对齐比字符串哈希快得多。执行价或到期日缺失的合约为 MISSING_CONTRACT_KEY。
+    """
+    days, _, _ = _expiration_days(df['expiration_date'])
+    put = (df['type'] == 'Put').to_numpy(dtype=bool).astype(np.int64)
+    strike = np.rint(pd.to_numeric(df['strike_price'], errors='coerce').to_numpy(dtype='float64') * 1000)
+    valid = np.isfinite(strike) & (days >= 0)
+    keys = (days << 34) | (put << 33) | np.where(valid, strike, 0).astype(np.int64)
+    return np.where(valid, keys, MISSING_CONTRACT_KEY)
+
+
+def align_contracts(previous, current):
+    """按合约键返回 current 每行在 previous 中的行号（没有对应合约时为-1），previous 中合约有重复时返回None
+
+    键为 MISSING_CONTRACT_KEY 的合约不参与对齐。
+    """
+    keys = contract_keys(previous)
+    rows = np.flatnonzero(keys != MISSING_CONTRACT_KEY)
+    index = pd.Index(keys[rows])
+    if not index.is_unique:
+        return None
+    positions = index.get_indexer(contract_keys(current))
+    return np.where(positions >= 0, rows[positions], -1)
+
+
+def contract_names(df, symbol):
+    """按需生成合约名称: 代码 + 到期日(YYYYMMDD) + C/P + 执行价*1000(8位补零)"""
+    _, codes, uniques = _expiration_days(df['expiration_date'])
+    prefixes = np.array([symbol + d for d in pd.to_datetime(np.asarray(uniques)).strftime('%Y%m%d')] + [symbol],
+                        dtype=object)
+    codes = np.where(codes < 0, len(prefixes) - 1, codes)
+    strike_milli = (pd.to_numeric(df['strike_price'], errors='coerce').to_numpy(dtype='float64') * 1000).astype(np.int64)
+    flag = np.where((df['type'] == 'Call').to_numpy(dtype=bool), 'C', 'P')
+    if pc is not None:
+        # Arrow字符串函数整列拼接，比pandas的 astype(str)/zfill 快数倍
+        digits = pc.utf8_lpad(pc.cast(pa.array(strike_milli), pa.string()), 8, '0')
+        names = pc.binary_join_element_wise(pa.array(prefixes).take(pa.array(codes)), pa.array(flag), digits, '')
+        return pd.Series(names.to_pandas().to_numpy(), index=df.index, dtype='str')
+    return (pd.Series(prefixes[codes], index=df.index, dtype=object) + flag
+            + pd.Series(strike_milli, index=df.index).astype(str).str.zfill(8))
+
+
+# ================= 快照差异 =================
+
+def chain_fingerprints(df):
+    """每个合约原始字段（DELTA_COLUMNS）的64位指纹，用于快照间比较
+
+    数值统一按float32计算，同一份数据不论是抓取得到的float64表还是紧凑布局的表，指纹都相同。
+    """
+    columns = {name: pd.to_numeric(df[name], errors='coerce').astype('float32')
+               for name in DELTA_COLUMNS if name in df.columns}
+    return pd.util.hash_pandas_object(pd.DataFrame(columns, index=df.index), index=False).to_numpy()
+
+
+def diff_chains(previous, current, previous_fingerprints=None, current_fingerprints=None):
+    """按合约键（contract_keys）比较两个快照
+
+    返回 {'positions': current每行在previous中的行号（新增为-1）, 'changed': current中新增或字段有变化的行号,
+    'removed': previous中已不存在的合约的行号, 'fingerprints': current的指纹}；合约有重复时返回None。
+    执行价或到期日缺失的合约不参与对齐：current 中的总是算作新增，previous 中的总是算作删除。
+    """
+    positions = align_contracts(previous, current)
+    if positions is None:
+        return None
+    matched = positions >= 0
+    if np.bincount(positions[matched], minlength=len(previous)).max(initial=0) > 1:
+        return None
+    if previous_fingerprints is None:
+        previous_fingerprints = chain_fingerprints(previous)
+    if current_fingerprints is None:
+        current_fingerprints = chain_fingerprints(current)
+    same = np.zeros(len(current), dtype=bool)
+    same[matched] = previous_fingerprints[positions[matched]] == current_fingerprints[matched]
+    present = np.zeros(len(previous), dtype=bool)
+    present[positions[matched]] = True
+    return {
+        'positions': positions,
+        'changed': np.flatnonzero(~same),
+        'removed': np.flatnonzero(~present),
+        'fingerprints': current_fingerprints
+    }
+
+
+def apply_chain_delta(previous, changed, removed):
+    """把增量（新增/变化的行、已删除合约的键）应用到上一个快照，返回新的合约表
+
+    旧版增量快照以合约名称记录已删除的合约，按名称中代码之后的部分（到期日 + C/P + 执行价）匹配。
+    执行价或到期日缺失的合约不按键替换：diff_chains 总是把它们记为previous中删除、current中新增。
+    """
+    removed = np.asarray(removed)
+    keys = contract_keys(previous)
+    if removed.dtype.kind in 'OUS':
+        suffixes = pd.Series(removed, dtype='str').str[-17:].to_numpy(dtype=object)
+        drop = np.isin(contract_names(previous, '').to_numpy(dtype=object), suffixes)
+    else:
+        drop = np.isin(keys, removed.astype(np.int64))
+    changed_keys = contract_keys(changed)
+    drop |= np.isin(keys, changed_keys[changed_keys != MISSING_CONTRACT_KEY])
+    return concat_compact([previous[~drop], changed])
+
+
+# ================= 历史快照 =================
+
+# 增量快照链的最大长度，达到后写入完整快照，限制读取时需要回放的文件数
+MAX_DELTA_CHAIN = 12
+# 变化的合约超过该比例时直接写入完整快照
+MAX_DELTA_FRACTION = 0.5
+
+def normalize_timestamp(value):
+    """统一时间戳为定长ISO字符串（微秒精度），保证字符串比较即时间比较"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat(timespec='microseconds')
+
+
+class RetentionPolicy:
+    """历史快照保留策略
+
+    full_resolution 以内的快照全部保留；更早的快照在每个 thinned_interval 时间段内只保留最后一个；
+    超过 max_age 的快照全部删除。
+    """
+
+    def __init__(self, full_resolution=timedelta(days=1), thinned_interval=timedelta(hours=1),
+                 max_age=timedelta(days=30)):
+        self.full_resolution = full_resolution
+        self.thinned_interval = thinned_interval
+        self.max_age = max_age
+
+    def select_expired(self, timestamps, now=None):
+        """返回应删除的时间戳列表（timestamps 为升序ISO字符串）"""
+        now = now or datetime.now()
+        full_cutoff = normalize_timestamp(now - self.full_resolution)
+        age_cutoff = normalize_timestamp(now - self.max_age)
+        interval = self.thinned_interval.total_seconds()
+        expired = []
+        kept_in_bucket = {}
+        for ts in timestamps:
+            if ts < age_cutoff:
+                expired.append(ts)
+            elif ts < full_cutoff:
+                bucket = int(datetime.fromisoformat(ts).timestamp() // interval)
+                if bucket in kept_in_bucket:
+                    expired.append(kept_in_bucket[bucket])
+                kept_in_bucket[bucket] = ts
+        return expired
+
+
+class SnapshotHistory:
+    """按 (symbol, data_timestamp) 追加保存的历史快照库
+
+    目录结构: {root}/{symbol}/{YYYY-MM-DD}/{HHMMSSffffff}.parquet，压缩后同一天的快照合并为
+    {YYYY-MM-DD}/compacted-*.parquet（每个快照一个row group）。SQLite索引记录每个快照所在的文件、
+    row group和元数据，按时间查询时无需扫描文件。
+
+    追加时默认只写入相对上一个快照新增/变化的合约（base 列记录基准快照），读取时沿基准链重建；
+    压缩和保留策略删除基准快照前会先把依赖它的增量快照还原为完整快照。
+
+    auto_compact 为 True 时，每个代码每天第一次追加快照后自动执行一次保留策略和压缩（maintenance 表
+    记录最近执行的日期，多个进程共用同一索引时也只有一个进程执行）。
+    """
+
+    def __init__(self, root, retention=None, auto_compact=True):
+        self.root = root
+        self.retention = retention or RetentionPolicy()
+        self.auto_compact = auto_compact
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, 'index.sqlite')
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS snapshots (
+                symbol TEXT NOT NULL,
+                data_timestamp TEXT NOT NULL,
+                path TEXT NOT NULL,
+                row_group INTEGER,
+                contracts INTEGER,
+                meta TEXT,
+                base TEXT,
+                PRIMARY KEY (symbol, data_timestamp))''')
+            # 旧版索引没有 base 列
+            if 'base' not in [r[1] for r in conn.execute('PRAGMA table_info(snapshots)')]:
+                conn.execute('ALTER TABLE snapshots ADD COLUMN base TEXT')
+            conn.execute('''CREATE TABLE IF NOT EXISTS maintenance (
+                symbol TEXT PRIMARY KEY,
+                compacted_day TEXT NOT NULL)''')
+
+    @contextmanager
+    def _connect(self):
+        """打开索引连接：正常退出时提交、异常时回滚，最后关闭连接（sqlite3 连接自身的 with 不会关闭连接）"""
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _abspath(self, rel_path):
+        return os.path.join(self.root, rel_path)
+
+    @staticmethod
+    def _entry(row):
+        symbol, ts, path, row_group, contracts, meta, base = row
+        return {'symbol': symbol, 'data_timestamp': ts, 'path': path, 'row_group': row_group,
+                'contracts': contracts, 'meta': json.loads(meta) if meta else {}, 'base': base}
+
+    def get(self, symbol, data_timestamp):
+        """按精确时间戳返回快照条目，不存在时返回None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM snapshots WHERE symbol = ? AND data_timestamp = ?',
+                               (symbol, normalize_timestamp(data_timestamp))).fetchone()
+        return self._entry(row) if row else None
+
+    def append(self, symbol, df, meta, incremental=True):
+        """追加一个快照，返回索引条目
+
+        incremental 为 True 时按合约键与上一个快照比较，只写入新增/变化的行和已删除合约的键；
+        增量链达到 MAX_DELTA_CHAIN 或变化超过 MAX_DELTA_FRACTION 时写入完整快照。
+        返回的条目中 changed / removed 为写入的合约数和删除的合约数。
+        auto_compact 时每个代码每天第一次追加后执行一次 compact(symbol)。
+        """
+        ts = normalize_timestamp(meta.get('data_timestamp') or datetime.now())
+        dt = datetime.fromisoformat(ts)
+        rel_path = os.path.join(symbol, dt.strftime('%Y-%m-%d'), dt.strftime('%H%M%S%f') + '.parquet')
+        os.makedirs(os.path.dirname(self._abspath(rel_path)), exist_ok=True)
+        delta = self._diff_with_previous(symbol, ts, df) if incremental else None
+        if delta is None:
+            base, changed, removed = None, df, []
+            write_snapshot(self._abspath(rel_path), df, meta)
+        else:
+            base, previous, diff = delta
+            changed = df.iloc[diff['changed']]
+            removed = contract_keys(previous)[diff['removed']].tolist()
+            write_snapshot(self._abspath(rel_path), changed, meta, delta={'base': base, 'removed': removed})
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, NULL, ?, ?, ?)',
+                         (symbol, ts, rel_path, len(df), json.dumps(meta, ensure_ascii=False), base))
+        if self.auto_compact:
+            self._daily_compact(symbol)
+        return {'symbol': symbol, 'data_timestamp': ts, 'path': rel_path, 'row_group': None,
+                'contracts': len(df), 'meta': meta, 'base': base,
+                'changed': len(changed), 'removed': len(removed)}
+
+    def _daily_compact(self, symbol, now=None):
+        """当天还没有为 symbol 执行过保留策略时执行一次；失败只打印，不影响已写入的快照"""
+        now = now or datetime.now()
+        day = now.strftime('%Y-%m-%d')
+        # 先原子地认领当天的维护，并发追加的其他线程/进程看到已认领后直接返回
+        with self._connect() as conn:
+            claimed = conn.execute('INSERT INTO maintenance VALUES (?, ?) ON CONFLICT (symbol) '
+                                   'DO UPDATE SET compacted_day = excluded.compacted_day '
+                                   'WHERE compacted_day < excluded.compacted_day', (symbol, day)).rowcount
+        if not claimed:
+            return
+        try:
+            removed, merged = self.compact(symbol, now)
+            if removed or merged:
+                print(f"{symbol} 历史快照自动维护: 删除 {removed} 个过期快照，合并 {merged} 个按天分区")
+        except Exception as e:
+            print(f"{symbol} 历史快照自动维护失败: {e}")
+
+    def _diff_with_previous(self, symbol, ts, df):
+        """与 ts 之前最近的快照比较，返回 (基准时间戳, 基准合约表, 差异)；不适合写增量时返回None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM snapshots WHERE symbol = ? AND data_timestamp < ? '
+                               'ORDER BY data_timestamp DESC LIMIT 1', (symbol, ts)).fetchone()
+        if row is None or not set(CONTRACT_KEY_COLUMNS) <= set(df.columns):
+            return None
+        base = self._entry(row)
+        if self._chain_length(base) + 1 >= MAX_DELTA_CHAIN:
+            return None
+        _, previous = self.load(base)
+        diff = diff_chains(previous, df)
+        if diff is None or len(diff['changed']) + len(diff['removed']) > len(df) * MAX_DELTA_FRACTION:
+            return None
+        return base['data_timestamp'], previous, diff
+
+    def _chain_length(self, entry):
+        """增量快照到最近一个完整快照之间的增量个数"""
+        length, base = 0, entry['base']
+        with self._connect() as conn:
+            while base is not None and length < MAX_DELTA_CHAIN:
+                length += 1
+                row = conn.execute('SELECT base FROM snapshots WHERE symbol = ? AND data_timestamp = ?',
+                                   (entry['symbol'], base)).fetchone()
+                base = row[0] if row else None
+        return length
+
+    def list(self, symbol, start=None, end=None):
+        """按时间升序列出 [start, end] 范围内的快照条目"""
+        sql = 'SELECT * FROM snapshots WHERE symbol = ?'
+        args = [symbol]
+        if start is not None:
+            sql += ' AND data_timestamp >= ?'
+            args.append(normalize_timestamp(start))
+        if end is not None:
+            sql += ' AND data_timestamp <= ?'
+            args.append(normalize_timestamp(end))
+        with self._connect() as conn:
+            rows = conn.execute(sql + ' ORDER BY data_timestamp', args).fetchall()
+        return [self._entry(r) for r in rows]
+
+    def symbols(self):
+        with self._connect() as conn:
+            return [r[0] for r in conn.execute('SELECT DISTINCT symbol FROM snapshots ORDER BY symbol')]
+
+    def nearest(self, symbol, when):
+        """返回时间上最接近 when 的快照条目"""
+        ts = normalize_timestamp(when)
+        with self._connect() as conn:
+            before = conn.execute('SELECT * FROM snapshots WHERE symbol = ? AND data_timestamp <= ? '
+                                  'ORDER BY data_timestamp DESC LIMIT 1', (symbol, ts)).fetchone()
+            after = conn.execute('SELECT * FROM snapshots WHERE symbol = ? AND data_timestamp >= ? '
+                                 'ORDER BY data_timestamp LIMIT 1', (symbol, ts)).fetchone()
+        if before is None or after is None:
+            row = before or after
+        else:
+            target = datetime.fromisoformat(ts)
+            gap_before = target - datetime.fromisoformat(before[1])
+            gap_after = datetime.fromisoformat(after[1]) - target
+            row = before if gap_before <= gap_after else after
+        return self._entry(row) if row else None
+
+    def load(self, entry, columns=None):
+        """读取单个快照，返回(元数据, DataFrame)；增量快照沿基准链重建为完整合约表"""
+        if entry.get('base') is None:
+            return entry['meta'], self._read_file(entry, columns)
+        read_columns = None if columns is None else list(dict.fromkeys(list(columns) + CONTRACT_KEY_COLUMNS))
+        base = self.get(entry['symbol'], entry['base'])
+        if base is None:
+            raise ValueError(f"{entry['symbol']} {entry['data_timestamp']} 的基准快照 {entry['base']} 不存在")
+        _, previous = self.load(base, read_columns)
+        df = self._apply_delta_file(entry, previous, read_columns)
+        return entry['meta'], df if columns is None else df[list(columns)]
+
+    def _read_file(self, entry, columns=None):
+        path = self._abspath(entry['path'])
+        if entry['row_group'] is None:
+            _, df = read_snapshot(path, columns=columns)
+        else:
+            table = pq.ParquetFile(path).read_row_group(entry['row_group'],
+                                                        columns=frame_columns() if columns is None else columns)
+            df = _table_to_frame(table)
+        return df
+
+    def _apply_delta_file(self, entry, previous, columns=None):
+        changed = self._read_file(entry, columns)
+        metadata = pq.read_schema(self._abspath(entry['path'])).metadata or {}
+        delta = json.loads(metadata.get(DELTA_KEY, b'{}').decode('utf-8'))
+        return apply_chain_delta(previous, changed, delta.get('removed', []))
+
+    def load_nearest(self, symbol, when, columns=None):
+        entry = self.nearest(symbol, when)
+        return self.load(entry, columns) if entry else (None, None)
+
+    def load_range(self, symbol, start=None, end=None, columns=None):
+        """读取时间范围内的全部快照，合并为带 data_timestamp 列的DataFrame"""
+        frames = []
+        read_columns = None if columns is None else list(dict.fromkeys(list(columns) + CONTRACT_KEY_COLUMNS))
+        last_ts, last_df = None, None
+        for entry in self.list(symbol, start, end):
+            # 连续的增量快照直接应用到上一个结果上，不必每个都从完整快照回放
+            if entry['base'] is not None and entry['base'] == last_ts:
+                full = self._apply_delta_file(entry, last_df, read_columns)
+            else:
+                _, full = self.load(entry, read_columns)
+            last_ts, last_df = entry['data_timestamp'], full
+            df = full.copy() if columns is None else full[list(columns)].copy()
+            df.insert(0, 'data_timestamp', entry['data_timestamp'])
+            frames.append(df)
+        return concat_compact(frames) if frames else pd.DataFrame()
+
+    def compact(self, symbol=None, now=None):
+        """执行保留策略并把已过完整保留期的按天分区合并成单个文件，返回(删除数, 合并的分区数)"""
+        now = now or datetime.now()
+        removed, merged = 0, 0
+        for sym in ([symbol] if symbol else self.symbols()):
+            entries = self.list(sym)
+            expired = set(self.retention.select_expired([e['data_timestamp'] for e in entries], now))
+            # 基准快照将被删除的增量快照先还原为完整快照
+            self._materialize([e for e in entries if e['data_timestamp'] not in expired and e['base'] in expired])
+            if expired:
+                with self._connect() as conn:
+                    conn.executemany('DELETE FROM snapshots WHERE symbol = ? AND data_timestamp = ?',
+                                     [(sym, ts) for ts in expired])
+                removed += len(expired)
+            kept = [e for e in entries if e['data_timestamp'] not in expired]
+            referenced = {e['path'] for e in kept}
+            for path in {e['path'] for e in entries if e['data_timestamp'] in expired} - referenced:
+                self._remove_file(path)
+            cutoff_day = (now - self.retention.full_resolution).strftime('%Y-%m-%d')
+            days = {}
+            for e in kept:
+                days.setdefault(e['data_timestamp'][:10], []).append(e)
+            for day, day_entries in days.items():
+                if day < cutoff_day and self._needs_compaction(day_entries):
+                    self._compact_day(sym, day, day_entries)
+                    merged += 1
+        return removed, merged
+
+    def _needs_compaction(self, day_entries):
+        paths = {e['path'] for e in day_entries}
+        if len(paths) > 1:
+            return True
+        # 已压缩文件中有被保留策略删除的row group时需要重写
+        return (day_entries[0]['row_group'] is not None
+                and pq.ParquetFile(self._abspath(day_entries[0]['path'])).num_row_groups != len(day_entries))
+
+    def _compact_day(self, symbol, day, day_entries):
+        rel_path = os.path.join(symbol, day, f"compacted-{datetime.now().strftime('%H%M%S%f')}.parquet")
+        schema = snapshot_schema()
+        rows = []
+        with atomic_open(self._abspath(rel_path), 'wb') as f:
+            with pq.ParquetWriter(f, schema, compression='zstd') as writer:
+                for group, e in enumerate(day_entries):
+                    _, df = self.load(e)
+                    table = _to_table(df, e['meta']).replace_schema_metadata(None)
+                    writer.write_table(table, row_group_size=max(1, len(df)))
+                    rows.append((rel_path, group, symbol, e['data_timestamp']))
+        with self._connect() as conn:
+            conn.executemany('UPDATE snapshots SET path = ?, row_group = ?, base = NULL '
+                             'WHERE symbol = ? AND data_timestamp = ?', rows)
+        for old_path in {e['path'] for e in day_entries}:
+            self._remove_file(old_path)
+
+    def _materialize(self, entries):
+        """把增量快照原地重写为完整快照"""
+        for e in entries:
+            meta, df = self.load(e)
+            write_snapshot(self._abspath(e['path']), df, meta)
+            with self._connect() as conn:
+                conn.execute('UPDATE snapshots SET base = NULL WHERE symbol = ? AND data_timestamp = ?',
+                             (e['symbol'], e['data_timestamp']))
+            e['base'] = None
+
+    def _remove_file(self, rel_path):
+        try:
+            os.remove(self._abspath(rel_path))
+        except FileNotFoundError:
+            pass
+
+
+CATALOG_FILE = 'catalog.sqlite'
+CATALOG_SORTS = ('freshness', 'symbol', 'contracts', 'size')
+# 内存中的目录副本最多隔多少秒检查一次其他进程（批量抓取子进程、命令行）的写入
+CATALOG_RECHECK_SECONDS = 2.0
+
+
+class SymbolCatalog:
+    """data 目录中各代码最新快照的目录索引（SQLite，每个代码一行）
+
+    抓取流程每写入一个快照就调用 record() 更新该代码的一行：最新数据时间戳、合约数、到期日列表、文件大小等。
+    query() 在内存副本上过滤、排序和分页，不列目录也不读快照文件；内存副本最多每 CATALOG_RECHECK_SECONDS 秒
+    用 PRAGMA data_version 检查一次其他进程的写入，有变化时重新读取。
+    索引为空（第一次使用）或手动增删了快照文件时，rebuild() 扫描一次目录重建。
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.index_path = os.path.join(data_dir, CATALOG_FILE)
+        self._conn = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS symbols (
+                symbol TEXT PRIMARY KEY,
+                data_timestamp TEXT,
+                contracts INTEGER,
+                expirations TEXT,
+                file_size INTEGER,
+                path TEXT,
+                company_name TEXT,
+                current_price REAL)''')
+        self._entries = None  # symbol -> 条目字典
+        self._version = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _entry(row):
+        symbol, ts, contracts, expirations, file_size, path, company_name, current_price = row
+        return {'symbol': symbol, 'data_timestamp': ts, 'contracts': contracts,
+                'expirations': json.loads(expirations) if expirations else [], 'file_size': file_size,
+                'path': path, 'company_name': company_name, 'current_price': current_price}
+
+    def _reload(self, force=False):
+        """（持有锁时调用）其他连接有写入或尚未读取时重新读取全部条目"""
+        now = time.monotonic()
+        if not force and self._entries is not None and now - self._checked_at < CATALOG_RECHECK_SECONDS:
+            return
+        self._checked_at = now
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if force or self._entries is None or version != self._version:
+            rows = self._conn.execute('SELECT * FROM symbols').fetchall()
+            self._entries = {row[0]: self._entry(row) for row in rows}
+            self._version = version
+
+    def record(self, symbol, path, meta, contracts=None, expirations=None):
+        """登记代码的最新快照；contracts / expirations 缺省时取元数据中的 total_options / expiration_dates"""
+        contracts = meta.get('total_options') if contracts is None else contracts
+        expirations = meta.get('expiration_dates') if expirations is None else expirations
+        try:
+            price = float(meta.get('current_price'))
+        except (TypeError, ValueError):
+            price = None
+        ts = meta.get('data_timestamp')
+        entry = {'symbol': symbol, 'data_timestamp': normalize_timestamp(ts) if ts else None,
+                 'contracts': None if contracts is None else int(contracts),
+                 'expirations': sorted(str(e)[:10] for e in (expirations or [])),
+                 'file_size': os.path.getsize(path), 'path': os.path.basename(path),
+                 'company_name': meta.get('company_name'), 'current_price': price}
+        with self._lock:
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (symbol, entry['data_timestamp'], entry['contracts'],
+                                    json.dumps(entry['expirations']), entry['file_size'], entry['path'],
+                                    entry['company_name'], price))
+            if self._entries is not None:
+                self._entries[symbol] = entry
+        return entry
+
+    def remove(self, symbol):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM symbols WHERE symbol = ?', (symbol,))
+            if self._entries is not None:
+                self._entries.pop(symbol, None)
+
+    def get(self, symbol):
+        with self._lock:
+            self._reload()
+            return self._entries.get(symbol)
+
+    def __len__(self):
+        with self._lock:
+            self._reload()
+            return len(self._entries)
+
+    def query(self, search=None, max_age=None, min_contracts=None, sort='freshness', descending=None,
+              limit=None, offset=0, now=None):
+        """过滤、排序、分页，返回 (符合条件的总数, 当前页条目列表)
+
+        search 匹配代码前缀或公司名称（不区分大小写）；max_age 为数据时间戳距今的最大秒数；
+        sort 为 CATALOG_SORTS 之一，freshness / contracts / size 默认降序，symbol 默认升序。
+        """
+        if sort not in CATALOG_SORTS:
+            raise ValueError(f"未知的排序方式: {sort}")
+        with self._lock:
+            self._reload()
+            entries = list(self._entries.values())
+        if search:
+            needle = search.upper()
+            entries = [e for e in entries if e['symbol'].startswith(needle)
+                       or needle in (e['company_name'] or '').upper()]
+        if max_age is not None:
+            cutoff = normalize_timestamp((now or datetime.now()) - timedelta(seconds=max_age))
+            entries = [e for e in entries if e['data_timestamp'] and e['data_timestamp'] >= cutoff]
+        if min_contracts is not None:
+            entries = [e for e in entries if (e['contracts'] or 0) >= min_contracts]
+        key = {'freshness': lambda e: e['data_timestamp'] or '', 'symbol': lambda e: e['symbol'],
+               'contracts': lambda e: e['contracts'] or 0, 'size': lambda e: e['file_size'] or 0}[sort]
+        entries.sort(key=key, reverse=sort != 'symbol' if descending is None else descending)
+        end = None if limit is None else offset + limit
+        return len(entries), entries[offset:end]
+
+    def rebuild(self):
+        """扫描 data 目录重建索引（同一代码同时有Parquet和旧版JSON时以Parquet为准），返回登记的代码数"""
+        paths = {}
+        for suffix in (JSON_SUFFIX, SNAPSHOT_SUFFIX):
+            if suffix == SNAPSHOT_SUFFIX and not has_columnar_support():
+                continue
+            for name in os.listdir(self.data_dir):
+                if name.endswith(suffix):
+                    paths[name[:-len(suffix)]] = os.path.join(self.data_dir, name)
+        entries = []
+        for symbol, path in sorted(paths.items()):
+            try:
+                entries.append(self._scan(symbol, path))
+            except Exception as e:
+                print(f"读取 {path} 失败: {e}")
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM symbols')
+            self._entries = {}
+        for symbol, path, meta, contracts, expirations in entries:
+            self.record(symbol, path, meta, contracts, expirations)
+        with self._lock:
+            self._reload(force=True)
+        return len(entries)
+
+    @staticmethod
+    def _scan(symbol, path):
+        """读取一个快照文件登记所需的信息：Parquet只读元数据头和到期日列"""
+        if path.endswith(SNAPSHOT_SUFFIX):
+            meta = read_snapshot_meta(path)
+            contracts = pq.ParquetFile(path).metadata.num_rows
+            expirations = meta.get('expiration_dates')
+            if not expirations:
+                column = pq.read_table(path, columns=['expiration_date']).column('expiration_date')
+                expirations = [str(v) for v in pc.unique(column.cast(pa.string())).to_pylist() if v]
+            return symbol, path, meta, contracts, expirations
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {'options_data': data}
+        rows = data.get('options_data', [])
+        meta = {k: v for k, v in data.items() if k != 'options_data'}
+        expirations = meta.get('expiration_dates') or sorted({r.get('expiration_date') for r in rows
+                                                               if r.get('expiration_date')})
+        return symbol, path, meta, len(rows), expirations